@@ -0,0 +1,189 @@
+#!/usr/bin/python
+# Copyright 2011 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+"""
+Micro-benchmark for the dependency string parsers in portage.dep.
+
+It reads the DEPEND, RDEPEND, PDEPEND, SRC_URI, IUSE and REQUIRED_USE
+values from a metadata cache directory, such as ${PORTDIR}/metadata/cache
+or ${PORTDIR}/metadata/md5-cache, and times paren_reduce, use_reduce,
+check_required_use and extract_affecting_use over all of them. Each
+round starts with empty parser caches, so the "cold" column shows the
+cost of parsing, and the "warm" column shows the cost of repeating
+the same work with the caches populated.
+
+Usage: bench_dep_strings.py [--rounds N] [--limit N] <cache directory>
+"""
+
+from __future__ import print_function
+
+import codecs
+import optparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+	os.path.realpath(__file__))), "pym"))
+
+import portage
+from portage import _encodings, _unicode_encode
+from portage.dep import Atom, check_required_use, extract_affecting_use, \
+	paren_reduce, use_reduce
+from portage.exception import InvalidDependString
+from portage.util.lrucache import set_maxsize
+import portage.dep
+import warnings
+
+_dep_keys = ("DEPEND", "RDEPEND", "PDEPEND")
+
+def _parse_entry(lines):
+	if lines and "=" in lines[0] and \
+		lines[0].split("=", 1)[0] in portage.auxdbkeys + ("_mtime_",):
+		# md5-cache or flat_hash format
+		return dict(line.split("=", 1) for line in lines if "=" in line)
+	# flat_list format
+	return dict(zip(portage.auxdbkeys, lines))
+
+def load_metadata(location, limit=None):
+	"""
+	@rtype: list
+	@return: a list of metadata dicts, one for each cache entry
+	"""
+	entries = []
+	for parent, dirs, files in os.walk(location):
+		dirs.sort()
+		for filename in sorted(files):
+			path = os.path.join(parent, filename)
+			f = codecs.open(_unicode_encode(path,
+				encoding=_encodings['fs'], errors='strict'),
+				mode='r', encoding=_encodings['repo.content'],
+				errors='replace')
+			try:
+				lines = f.read().splitlines()
+			finally:
+				f.close()
+			entries.append(_parse_entry(lines))
+			if limit is not None and len(entries) >= limit:
+				return entries
+	return entries
+
+def _clear_caches():
+	# Empty the caches without changing their sizes.
+	for cache in (portage.dep._tokenize_cache,
+		portage.dep._compiled_depstr_cache,
+		portage.dep._compiled_required_use_cache,
+		portage.dep._required_use_result_cache):
+		cache.clear()
+
+def _bench_paren_reduce(entries):
+	for metadata in entries:
+		for k in _dep_keys:
+			try:
+				paren_reduce(metadata.get(k, ""))
+			except InvalidDependString:
+				pass
+
+def _bench_use_reduce(entries):
+	for metadata in entries:
+		eapi = metadata.get("EAPI") or "0"
+		uselist = metadata["_use"]
+		for k in _dep_keys:
+			try:
+				use_reduce(metadata.get(k, ""), uselist=uselist,
+					eapi=eapi, token_class=Atom)
+			except InvalidDependString:
+				pass
+		try:
+			use_reduce(metadata.get("SRC_URI", ""), uselist=uselist,
+				eapi=eapi, is_src_uri=True)
+		except InvalidDependString:
+			pass
+
+def _bench_check_required_use(entries):
+	for metadata in entries:
+		required_use = metadata.get("REQUIRED_USE")
+		if not required_use:
+			continue
+		iuse = metadata["_iuse"]
+		try:
+			check_required_use(required_use, metadata["_use"],
+				iuse.__contains__)
+		except InvalidDependString:
+			pass
+
+def _bench_extract_affecting_use(entries):
+	for metadata in entries:
+		atom = metadata["_atom"]
+		if atom is None:
+			continue
+		try:
+			extract_affecting_use(metadata.get("DEPEND", ""), atom,
+				eapi=metadata.get("EAPI") or "0")
+		except InvalidDependString:
+			pass
+
+def _prepare(entries):
+	for metadata in entries:
+		iuse = frozenset(x.lstrip("+-") for x in \
+			metadata.get("IUSE", "").split())
+		metadata["_iuse"] = iuse
+		# Enable every other flag, so that conditionals go both ways.
+		metadata["_use"] = frozenset(sorted(iuse)[::2])
+		atom = None
+		for token in metadata.get("DEPEND", "").split():
+			if "/" in token:
+				atom = token
+				break
+		metadata["_atom"] = atom
+
+def _time(func, entries, rounds):
+	cold = warm = None
+	for i in range(rounds):
+		_clear_caches()
+		start = time.time()
+		func(entries)
+		elapsed = time.time() - start
+		if cold is None or elapsed < cold:
+			cold = elapsed
+		start = time.time()
+		func(entries)
+		elapsed = time.time() - start
+		if warm is None or elapsed < warm:
+			warm = elapsed
+	return cold, warm
+
+def main(args):
+	parser = optparse.OptionParser(usage="%prog [options] <cache directory>")
+	parser.add_option("--rounds", type="int", default=3,
+		help="number of rounds, of which the fastest is reported")
+	parser.add_option("--limit", type="int", default=None,
+		help="maximum number of cache entries to read")
+	options, args = parser.parse_args(args)
+	if len(args) != 1:
+		parser.error("expected a metadata cache directory")
+
+	warnings.simplefilter("ignore", DeprecationWarning)
+	# Make sure that a warm round doesn't have to evict anything.
+	set_maxsize(None)
+
+	entries = load_metadata(args[0], limit=options.limit)
+	if not entries:
+		parser.error("no cache entries found in '%s'" % args[0])
+	_prepare(entries)
+	print("%d cache entries, best of %d rounds" % \
+		(len(entries), options.rounds))
+	print("%-24s %10s %10s" % ("", "cold (s)", "warm (s)"))
+	for name, func in (
+		("paren_reduce", _bench_paren_reduce),
+		("use_reduce", _bench_use_reduce),
+		("check_required_use", _bench_check_required_use),
+		("extract_affecting_use", _bench_extract_affecting_use),
+		):
+		cold, warm = _time(func, entries, options.rounds)
+		print("%-24s %10.4f %10.4f" % (name, cold, warm))
+	return os.EX_OK
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
@@ -6,6 +6,8 @@ from portage.util import writemsg
 from portage.data import secpass
 import portage
 from portage import os
+from portage.dep import Atom
+from portage.exception import InvalidAtom
 
 try:
 	import cPickle as pickle
@@ -22,6 +24,12 @@ class BlockerCache(portage.cache.mappings.MutableMapping):
 	emerge.  The cache is invalidated whenever it is detected that something
 	has changed that might alter the results of dep_check() calls:
 		1) the set of installed packages (including COUNTER) has changed
+
+	It also keeps an index which maps each package key (cp) to the
+	installed packages that have blockers for it, so that only the
+	blockers that might match a given set of packages need to be
+	looked at. The index is stored in a separate file next to the
+	cache, and it's brought up to date with the cache by COUNTER.
 	"""
 
 	# Number of uncached packages to trigger cache update, since
@@ -44,25 +52,37 @@ class BlockerCache(portage.cache.mappings.MutableMapping):
 		self._cache_version = "1"
 		self._cache_data = None
 		self._modified = set()
+		self._index_filename = os.path.join(vardb.settings['EROOT'],
+			portage.CACHE_PATH, "vdb_blockers_index.pickle")
+		self._index_version = "1"
+		# Maps each cpv to (counter, cps of its blocker atoms).
+		self._index_data = None
+		# Maps each cp to the set of cpvs that have blockers for it.
+		self._blocked_cps = None
 		self._load()
 
-	def _load(self):
+	def _load_pickle(self, filename):
+		data = None
 		try:
-			f = open(self._cache_filename, mode='rb')
+			f = open(filename, mode='rb')
 			mypickle = pickle.Unpickler(f)
 			try:
 				mypickle.find_global = None
 			except AttributeError:
 				# TODO: If py3k, override Unpickler.find_class().
 				pass
-			self._cache_data = mypickle.load()
+			data = mypickle.load()
 			f.close()
 			del f
 		except (IOError, OSError, EOFError, ValueError, pickle.UnpicklingError) as e:
 			if isinstance(e, pickle.UnpicklingError):
 				writemsg("!!! Error loading '%s': %s\n" % \
-					(self._cache_filename, str(e)), noiselevel=-1)
+					(filename, str(e)), noiselevel=-1)
 			del e
+		return data
+
+	def _load(self):
+		self._cache_data = self._load_pickle(self._cache_filename)
 
 		cache_valid = self._cache_data and \
 			isinstance(self._cache_data, dict) and \
@@ -117,6 +137,76 @@ class BlockerCache(portage.cache.mappings.MutableMapping):
 			self._cache_data = {"version":self._cache_version}
 			self._cache_data["blockers"] = {}
 		self._modified.clear()
+		self._load_index()
+
+	def _load_index(self):
+		index_data = self._load_pickle(self._index_filename)
+		if not (isinstance(index_data, dict) and \
+			index_data.get("version") == self._index_version and \
+			isinstance(index_data.get("blockers"), dict)):
+			index_data = {"version":self._index_version, "blockers":{}}
+		self._index_data = index_data
+		self._blocked_cps = {}
+
+		# Discard the entries that don't belong to the cache, and
+		# update the ones that have a different COUNTER.
+		cached_blockers = self._cache_data["blockers"]
+		index_blockers = index_data["blockers"]
+		for cpv in list(index_blockers):
+			if cpv not in cached_blockers:
+				del index_blockers[cpv]
+		for cpv, (counter, atoms) in cached_blockers.items():
+			v = index_blockers.get(cpv)
+			if not (isinstance(v, tuple) and len(v) == 2 and \
+				v[0] == counter and isinstance(v[1], tuple)):
+				self._index(cpv, counter, atoms)
+				continue
+			for cp in v[1]:
+				self._blocked_cps.setdefault(cp, set()).add(cpv)
+
+	def _index(self, cpv, counter, atoms):
+		"""
+		Add the given blocker atoms of cpv to the index, replacing any
+		that were indexed before.
+		"""
+		self._unindex(cpv)
+		cps = []
+		for atom in atoms:
+			try:
+				cp = Atom(atom).cp
+			except InvalidAtom:
+				continue
+			if cp not in cps:
+				cps.append(cp)
+		self._index_data["blockers"][cpv] = (counter, tuple(cps))
+		for cp in cps:
+			self._blocked_cps.setdefault(cp, set()).add(cpv)
+
+	def _unindex(self, cpv):
+		v = self._index_data["blockers"].pop(cpv, None)
+		if v is None:
+			return
+		for cp in v[1]:
+			cpvs = self._blocked_cps.get(cp)
+			if cpvs is not None:
+				cpvs.discard(cpv)
+				if not cpvs:
+					del self._blocked_cps[cp]
+
+	def get_blocking_cpvs(self, cps):
+		"""
+		@param cps: package keys
+		@type cps: iterable
+		@rtype: set
+		@returns: The cpvs of the cached packages that have blocker
+			atoms for any of the given package keys.
+		"""
+		blocking_cpvs = set()
+		for cp in cps:
+			cpvs = self._blocked_cps.get(cp)
+			if cpvs:
+				blocking_cpvs.update(cpvs)
+		return blocking_cpvs
 
 	def flush(self):
 		"""If the current user has permission and the internal blocker cache
@@ -132,17 +222,22 @@ class BlockerCache(portage.cache.mappings.MutableMapping):
 			version : "1",
 			"blockers" : {cpv1:(counter,(atom1, atom2...)), cpv2...},
 		}
+
+		The index is saved at the same time, in the same format, except
+		that the atoms are replaced with their cps.
 		"""
 		if len(self._modified) >= self._cache_threshold and \
 			secpass >= 2:
-			try:
-				f = portage.util.atomic_ofstream(self._cache_filename, mode='wb')
-				pickle.dump(self._cache_data, f, protocol=2)
-				f.close()
-				portage.util.apply_secpass_permissions(
-					self._cache_filename, gid=portage.portage_gid, mode=0o644)
-			except (IOError, OSError) as e:
-				pass
+			for filename, data in ((self._cache_filename, self._cache_data),
+				(self._index_filename, self._index_data)):
+				try:
+					f = portage.util.atomic_ofstream(filename, mode='wb')
+					pickle.dump(data, f, protocol=2)
+					f.close()
+					portage.util.apply_secpass_permissions(
+						filename, gid=portage.portage_gid, mode=0o644)
+				except (IOError, OSError) as e:
+					pass
 			self._modified.clear()
 
 	def __setitem__(self, cpv, blocker_data):
@@ -155,8 +250,9 @@ class BlockerCache(portage.cache.mappings.MutableMapping):
 		@param blocker_data: An object with counter and atoms attributes.
 		@type blocker_data: BlockerData
 		"""
-		self._cache_data["blockers"][cpv] = \
-			(blocker_data.counter, tuple(str(x) for x in blocker_data.atoms))
+		atoms = tuple(str(x) for x in blocker_data.atoms)
+		self._cache_data["blockers"][cpv] = (blocker_data.counter, atoms)
+		self._index(cpv, blocker_data.counter, atoms)
 		self._modified.add(cpv)
 
 	def __iter__(self):
@@ -172,6 +268,7 @@ class BlockerCache(portage.cache.mappings.MutableMapping):
 
 	def __delitem__(self, cpv):
 		del self._cache_data["blockers"][cpv]
+		self._unindex(cpv)
 
 	def __getitem__(self, cpv):
 		"""
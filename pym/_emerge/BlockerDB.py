@@ -6,6 +6,8 @@ import sys
 import portage
 from portage import os
 from portage import digraph
+from portage.dep import Atom
+from portage.exception import InvalidAtom
 from portage._sets.base import InternalPackageSet
 
 from _emerge.BlockerCache import BlockerCache
@@ -77,9 +79,21 @@ class BlockerDB(object):
 			del blocker_cache[cpv]
 		blocker_cache.flush()
 
+		# Only the packages that have blockers for new_pkg, or for
+		# an old-style virtual that it provides, need to be checked.
+		blocked_cps = [new_pkg.cp]
+		for provide in new_pkg.metadata["PROVIDE"].split():
+			try:
+				blocked_cps.append(Atom(provide).cp)
+			except InvalidAtom:
+				continue
+		blocking_cpvs = blocker_cache.get_blocking_cpvs(blocked_cps)
+
 		blocker_parents = digraph()
 		blocker_atoms = []
 		for pkg in installed_pkgs:
+			if pkg.cpv not in blocking_cpvs:
+				continue
 			for blocker_atom in blocker_cache[pkg.cpv].atoms:
 				blocker_atom = blocker_atom.lstrip("!")
 				blocker_atoms.append(blocker_atom)
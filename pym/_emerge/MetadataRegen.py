@@ -61,15 +61,23 @@ class MetadataRegen(PollScheduler):
 			cp_set.add(cp)
 			portage.writemsg_stdout("Processing %s\n" % cp)
 			cpv_list = portdb.cp_list(cp)
+			# Pull the cache entries of the whole cp at once.
+			prefetched = portdb._prefetch_cache(cpv_list)
 			for cpv in cpv_list:
 				if self._terminated_tasks:
 					break
 				valid_pkgs.add(cpv)
-				ebuild_path, repo_path = portdb.findname2(cpv)
+				pulled = None
+				if cpv in prefetched:
+					ebuild_path, repo_path, pulled = prefetched[cpv]
+				else:
+					ebuild_path, repo_path = portdb.findname2(cpv)
 				if ebuild_path is None:
 					raise AssertionError("ebuild not found for '%s'" % cpv)
-				metadata, st, emtime = portdb._pull_valid_cache(
-					cpv, ebuild_path, repo_path)
+				if pulled is None:
+					pulled = portdb._pull_valid_cache(
+						cpv, ebuild_path, repo_path)
+				metadata, st, emtime = pulled
 				if metadata is not None:
 					if consumer is not None:
 						consumer(cpv, ebuild_path,
@@ -0,0 +1,303 @@
+# Copyright 2011 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import stat
+import sys
+from hashlib import md5
+
+import portage
+from portage import os
+from portage import _encodings, _unicode_encode
+from portage.const import CACHE_PATH, GLOBAL_CONFIG_PATH, INCREMENTALS, \
+	MAKE_CONF_FILE, USER_CONFIG_PATH, VDB_PATH, WORLD_FILE, WORLD_SETS_FILE
+from portage.util import writemsg
+from _emerge.Package import Package
+
+try:
+	import cPickle as pickle
+except ImportError:
+	import pickle
+
+if sys.hexversion >= 0x3000000:
+	basestring = str
+
+class ResolverCache(object):
+	"""
+	This caches the merge lists of successful dependency calculations, so
+	that emerge can reload a merge list (much like it does for --resume)
+	instead of calculating it again when nothing has changed. Each entry
+	is keyed by a digest of everything that might alter the result, which
+	has to be cheap to compute, so that it only stats a few markers:
+		1) the action, the arguments and the options that are relevant
+		   to dependency calculation
+		2) the configuration, meaning the files from make.conf, the
+		   profiles and /etc/portage, and the settings that can be
+		   overridden by environment variables
+		3) the repositories, meaning the repository directory and the
+		   metadata/timestamp.chk file, which is updated by each sync
+		4) the installed packages, meaning the vdb COUNTER, which changes
+		   when a package is merged, and the mtime of the vdb directory,
+		   which vardbapi updates whenever a package is merged or
+		   unmerged, plus the world file
+		5) the binary package index, if binary packages are used
+	Changes to a repository that isn't synced, like editing an ebuild in
+	place, are not noticed.
+	"""
+
+	# Maximum number of entries, since different argument
+	# lists for the same state get entries of their own.
+	_cache_size = 8
+
+	# Options that only affect display or merge scheduling.
+	_ignored_opts = frozenset([
+		"--alphabetical", "--ask", "--ask-enter-invalid", "--changelog",
+		"--color", "--columns", "--debug", "--fail-clean", "--jobs",
+		"--keep-going", "--load-average", "--nospinner", "--quiet",
+		"--quiet-build", "--quiet-unmerge-warn", "--resolver-cache",
+		"--tree", "--unordered-display", "--verbose",
+		"--verbose-main-repo-display",
+	])
+
+	# Settings that can be overridden by environment variables.
+	_settings_keys = INCREMENTALS + ("ACCEPT_LICENSE", "ACCEPT_PROPERTIES",
+		"ARCH", "CBUILD", "CHOST", "EPREFIX", "PKGDIR", "PORTAGE_CONFIGROOT",
+		"PORTDIR", "PORTDIR_OVERLAY", "ROOT")
+
+	def __init__(self, settings, trees):
+		self._settings = settings
+		self._trees = trees
+		self._cache_filename = os.path.join(settings['EROOT'],
+			CACHE_PATH, "resolver_cache.pickle")
+		self._cache_version = "1"
+		self._cache_data = None
+		self._load()
+
+	def _load(self):
+		try:
+			f = open(_unicode_encode(self._cache_filename,
+				encoding=_encodings['fs'], errors='strict'), mode='rb')
+			mypickle = pickle.Unpickler(f)
+			try:
+				mypickle.find_global = None
+			except AttributeError:
+				pass
+			self._cache_data = mypickle.load()
+			f.close()
+			del f
+		except (IOError, OSError, EOFError, ValueError, pickle.UnpicklingError) as e:
+			if isinstance(e, pickle.UnpicklingError):
+				writemsg("!!! Error loading '%s': %s\n" % \
+					(self._cache_filename, str(e)), noiselevel=-1)
+			del e
+
+		cache_valid = self._cache_data and \
+			isinstance(self._cache_data, dict) and \
+			self._cache_data.get("version") == self._cache_version and \
+			isinstance(self._cache_data.get("entries"), list)
+		if not cache_valid:
+			self._cache_data = {"version":self._cache_version}
+			self._cache_data["entries"] = []
+
+	def flush(self):
+		"""
+		Save the cache to disk, if the current user has permission. The
+		cache is stored as a pickled dict object with the following format:
+
+		{
+			version : "1",
+			"entries" : [(digest1, resume_data1), (digest2, resume_data2)...],
+		}
+
+		The entries are ordered from least to most recently stored, and
+		resume_data has the same "mergelist" and "favorites" format as
+		mtimedb["resume"].
+		"""
+		try:
+			f = portage.util.atomic_ofstream(self._cache_filename, mode='wb')
+			pickle.dump(self._cache_data, f, protocol=2)
+			f.close()
+			portage.util.apply_secpass_permissions(
+				self._cache_filename, gid=portage.portage_gid, mode=0o644)
+		except (IOError, OSError, portage.exception.PortageException):
+			pass
+
+	def get(self, digest):
+		"""
+		@rtype: dict
+		@returns: The resume data that was stored for the given digest,
+			or None if there is no valid entry.
+		"""
+		for k, resume_data in self._cache_data["entries"]:
+			if k != digest:
+				continue
+			if not isinstance(resume_data, dict):
+				return None
+			mergelist = resume_data.get("mergelist")
+			favorites = resume_data.get("favorites")
+			if not (isinstance(mergelist, list) and \
+				isinstance(favorites, list)):
+				return None
+			for x in mergelist:
+				if not (isinstance(x, list) and len(x) == 4 and \
+					all(isinstance(y, basestring) for y in x)):
+					return None
+			for x in favorites:
+				if not isinstance(x, basestring):
+					return None
+			# Return a copy, since _loadResumeCommand() and --skipfirst
+			# handling may modify the list.
+			return {"mergelist" : [list(x) for x in mergelist],
+				"favorites" : list(favorites)}
+		return None
+
+	def store(self, digest, mergelist, favorites):
+		"""
+		Store a merge list and save the cache to disk.
+
+		@param digest: A digest as returned from get_digest().
+		@type digest: String
+		@param mergelist: The merge list, as returned from depgraph.altlist().
+		@type mergelist: List
+		@param favorites: The favorites, as returned from
+			depgraph.select_files().
+		@type favorites: List
+		"""
+		resume_data = {
+			"mergelist" : [list(x) for x in mergelist \
+				if isinstance(x, Package) and x.operation == "merge"],
+			# Convert Atom instances to plain str.
+			"favorites" : [str(x) for x in favorites],
+		}
+		entries = [x for x in self._cache_data["entries"] if x[0] != digest]
+		entries.append((digest, resume_data))
+		del entries[:-self._cache_size]
+		self._cache_data["entries"] = entries
+		self.flush()
+
+	def get_digest(self, myaction, myfiles, myopts):
+		"""
+		@rtype: String
+		@returns: A digest of the given arguments and of the current
+			configuration, repository and vdb state, or None if the
+			state can't be determined (like for remote binary packages).
+		"""
+		if "--getbinpkg" in myopts or "--getbinpkgonly" in myopts:
+			return None
+
+		h = md5()
+		def update(*args):
+			h.update(_unicode_encode(repr(args),
+				encoding=_encodings['content'], errors='backslashreplace'))
+
+		update("version", portage.VERSION, self._cache_version)
+		update("action", myaction, [str(x) for x in myfiles])
+		update("options", self.get_opts_key(myopts))
+
+		settings = self._settings
+		update("settings", [(k, settings.get(k)) \
+			for k in self._settings_keys])
+
+		config_root = settings["PORTAGE_CONFIGROOT"]
+		for path in (os.path.join(config_root, MAKE_CONF_FILE),
+			os.path.join(config_root, USER_CONFIG_PATH),
+			GLOBAL_CONFIG_PATH):
+			self._update_tree(update, path)
+		# Each directory of the profile stack is listed on its own, and
+		# the directories below them are other profiles.
+		for path in settings.profiles:
+			self._update_dir(update, path)
+
+		for myroot in self._trees:
+			root_trees = self._trees[myroot]
+			eroot = root_trees["vartree"].settings["EROOT"]
+			for path in (WORLD_FILE, WORLD_SETS_FILE):
+				self._update_stat(update, os.path.join(eroot, path))
+			self._update_vdb(update, root_trees["vartree"].dbapi)
+			if "--usepkg" in myopts or "--usepkgonly" in myopts:
+				bintree = root_trees["bintree"]
+				self._update_stat(update,
+					os.path.join(bintree.pkgdir, "Packages"))
+			if "--usepkgonly" not in myopts:
+				for path in root_trees["porttree"].dbapi.porttrees:
+					self._update_repo(update, path)
+
+		return h.hexdigest()
+
+	@classmethod
+	def get_opts_key(cls, myopts):
+		"""
+		@rtype: List
+		@returns: The options that are relevant to dependency
+			calculation, as a sorted list of (name, repr(value)) tuples.
+		"""
+		opts = []
+		for k, v in myopts.items():
+			if k in cls._ignored_opts:
+				continue
+			if isinstance(v, (set, frozenset)):
+				v = sorted(v)
+			opts.append((k, repr(v)))
+		opts.sort()
+		return opts
+
+	@staticmethod
+	def _stat(path):
+		try:
+			return os.stat(path)
+		except OSError:
+			return None
+
+	def _update_stat(self, update, path):
+		st = self._stat(path)
+		if st is None:
+			update(path, None)
+		else:
+			update(path, st.st_mtime, st.st_size)
+		return st
+
+	def _listdir(self, path):
+		try:
+			return sorted(os.listdir(path))
+		except OSError:
+			return []
+
+	def _update_tree(self, update, path):
+		"""Include all files below path, recursively."""
+		st = self._update_stat(update, path)
+		if st is not None and stat.S_ISDIR(st.st_mode):
+			for name in self._listdir(path):
+				self._update_tree(update, os.path.join(path, name))
+
+	def _update_dir(self, update, path):
+		"""Include the files directly inside path."""
+		st = self._update_stat(update, path)
+		if st is not None and stat.S_ISDIR(st.st_mode):
+			for name in self._listdir(path):
+				self._update_stat(update, os.path.join(path, name))
+
+	def _update_repo(self, update, path):
+		"""
+		Include the repository directory and metadata/timestamp.chk,
+		which is updated by each sync.
+		"""
+		self._update_stat(update, path)
+		self._update_stat(update,
+			os.path.join(path, "metadata", "timestamp.chk"))
+
+	def _update_vdb(self, update, vardb):
+		"""
+		Include the COUNTER, which changes when a package is merged,
+		and the mtime of the vdb directory, which vardbapi._bump_mtime()
+		updates when a package is merged or unmerged.
+		"""
+		vdb_path = os.path.join(vardb.settings["EROOT"], VDB_PATH)
+		try:
+			f = open(_unicode_encode(vardb._counter_path,
+				encoding=_encodings['fs'], errors='strict'), mode='rb')
+			try:
+				update("COUNTER", f.read())
+			finally:
+				f.close()
+		except (IOError, OSError):
+			update("COUNTER", None)
+		self._update_stat(update, vdb_path)
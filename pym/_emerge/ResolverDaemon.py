@@ -0,0 +1,390 @@
+# Copyright 2011 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import errno
+import json
+import socket
+import struct
+import sys
+import traceback
+
+import portage
+from portage import os
+from portage import _encodings, _unicode_decode, _unicode_encode
+from portage.util import writemsg, writemsg_level
+import _emerge.depgraph
+from _emerge.actions import load_emerge_config
+from _emerge.depgraph import _frozen_depgraph_config
+from _emerge.ResolverCache import ResolverCache
+
+if sys.hexversion >= 0x3000000:
+	basestring = str
+
+# Each frame consists of a type and the length of the payload.
+_header_format = "!cI"
+_header_size = struct.calcsize(_header_format)
+
+# Output of the emerge process.
+_FRAME_OUTPUT = b"o"
+# The exit status of the emerge process, as a signed int.
+_FRAME_EXIT = b"x"
+# The request is not supported, and the client should run it itself.
+_FRAME_REFUSE = b"r"
+
+# Options that change the environment before the config is loaded, or
+# that do more than dependency calculation.
+_unsupported_opts = frozenset(["--accept-properties", "--config-root",
+	"--digest", "--fetch-all-uri", "--fetchonly", "--getbinpkg",
+	"--getbinpkgonly", "--resume", "--root", "--skipfirst"])
+
+# Environment variables that have to be the same for the client and the
+# daemon, since they affect the config that the daemon has loaded.
+_env_keys = ResolverCache._settings_keys + ("EMERGE_DEFAULT_OPTS",
+	"PORTAGE_RESOLVER_PROFILE")
+
+def _supported(myaction, myopts):
+	if myaction is not None or "--pretend" not in myopts:
+		return False
+	for opt in _unsupported_opts:
+		if opt in myopts:
+			return False
+	return True
+
+def _get_env():
+	return dict((k, os.environ.get(k)) for k in _env_keys)
+
+def _send_frame(sock, frame_type, payload=b""):
+	sock.sendall(struct.pack(_header_format, frame_type, len(payload)) + \
+		payload)
+
+def _recv_all(f, length):
+	buf = f.read(length)
+	if buf is None or len(buf) != length:
+		return None
+	return buf
+
+class ResolverDaemon(object):
+	"""
+	A long-lived process that keeps the config, the trees and the frozen
+	depgraph configs with synced FakeVartree instances in memory, and that
+	runs `emerge --pretend` requests from resolver_client() for other emerge
+	processes, which then skip loading the config and the installed
+	packages. Each request is run by a forked process, so that it can't
+	alter the state of the daemon, and its output is forwarded to the
+	client over a Unix socket. The state is reloaded when the digest of
+	the configuration, repository and vdb state from ResolverCache
+	changes, which only stats a few files, so that it is checked for
+	each request.
+	"""
+
+	# Maximum number of frozen configs, since different
+	# options that affect dependency calculation need
+	# frozen configs of their own.
+	_max_frozen_configs = 4
+
+	# Maximum size of a request.
+	_max_request_size = 1024 * 1024
+
+	# Seconds to wait for each part of a request, since requests are
+	# read one at a time, and a stuck client would stall the others.
+	_request_timeout = 10
+
+	def __init__(self, socket_path, load_config=load_emerge_config):
+		self._socket_path = socket_path
+		self._load_config = load_config
+		self._config = None
+		self._env = None
+		self._resolver_cache = None
+		self._digest = None
+		# Pairs of options keys and frozen configs, ordered from least
+		# to most recently used.
+		self._frozen_configs = []
+
+	def serve(self):
+		"""
+		Listen on the socket and handle requests until the process is
+		killed.
+		"""
+		self._load()
+		sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			os.unlink(self._socket_path)
+		except OSError as e:
+			if e.errno != errno.ENOENT:
+				raise
+		# Only allow the current user to connect.
+		old_umask = os.umask(0o77)
+		try:
+			sock.bind(self._socket_path)
+		finally:
+			os.umask(old_umask)
+		sock.listen(5)
+		writemsg_level(">>> Resolver daemon listening on '%s'\n" % \
+			(self._socket_path,), noiselevel=-1)
+		try:
+			while True:
+				conn, addr = sock.accept()
+				conn.settimeout(self._request_timeout)
+				try:
+					self._handle(conn)
+				finally:
+					conn.close()
+				self._reap()
+		finally:
+			sock.close()
+			try:
+				os.unlink(self._socket_path)
+			except OSError:
+				pass
+
+	def _load(self):
+		settings, trees, mtimedb = self._load_config()
+		self._config = (settings, trees, mtimedb)
+		self._env = _get_env()
+		self._resolver_cache = ResolverCache(settings, trees)
+		self._digest = self._resolver_cache.get_digest(None, [], {})
+		self._frozen_configs = []
+
+	def _reap(self):
+		while True:
+			try:
+				pid, status = os.waitpid(-1, os.WNOHANG)
+			except OSError as e:
+				if e.errno == errno.ECHILD:
+					break
+				raise
+			if pid == 0:
+				break
+
+	def _read_request(self, conn):
+		chunks = []
+		size = 0
+		while size <= self._max_request_size:
+			try:
+				buf = conn.recv(4096)
+			except socket.error:
+				# This includes socket.timeout.
+				return None
+			if not buf:
+				break
+			chunks.append(buf)
+			size += len(buf)
+		else:
+			return None
+		try:
+			request = json.loads(_unicode_decode(b"".join(chunks),
+				encoding=_encodings['content'], errors='strict'))
+		except (UnicodeDecodeError, ValueError):
+			return None
+		if not isinstance(request, dict):
+			return None
+		args = request.get("args")
+		cwd = request.get("cwd")
+		env = request.get("env")
+		if not (isinstance(args, list) and \
+			all(isinstance(x, basestring) for x in args) and \
+			isinstance(cwd, basestring) and isinstance(env, dict)):
+			return None
+		return request
+
+	def _get_opts(self, args):
+		"""
+		Parse the arguments like emerge_main() does, so that the frozen
+		config is created for the same options.
+		"""
+		from _emerge.main import adjust_binpkg_opts, parse_opts
+		settings = self._config[0]
+		myaction, myopts, myfiles = parse_opts(list(args), silent=True)
+		if "--ignore-default-opts" not in myopts:
+			args = settings["EMERGE_DEFAULT_OPTS"].split() + list(args)
+			myaction, myopts, myfiles = parse_opts(args, silent=True)
+		adjust_binpkg_opts(settings, myopts)
+		return myaction, myopts
+
+	def _get_frozen_config(self, myopts):
+		key = ResolverCache.get_opts_key(myopts)
+		for i, (k, frozen_config) in enumerate(self._frozen_configs):
+			if k == key:
+				del self._frozen_configs[i]
+				self._frozen_configs.append((k, frozen_config))
+				return frozen_config
+
+		settings, trees, mtimedb = self._config
+		frozen_config = _frozen_depgraph_config(settings, trees,
+			myopts, None)
+		for myroot in frozen_config.trees:
+			frozen_config._sync_vartree(myroot)
+		self._frozen_configs.append((key, frozen_config))
+		del self._frozen_configs[:-self._max_frozen_configs]
+		return frozen_config
+
+	def _handle(self, conn):
+		request = self._read_request(conn)
+		if request is None:
+			return
+
+		if self._resolver_cache.get_digest(None, [], {}) != self._digest:
+			writemsg_level(">>> Resolver daemon reloading the config\n",
+				noiselevel=-1)
+			self._load()
+
+		frozen_config = None
+		if request["env"] == self._env:
+			myaction, myopts = self._get_opts(request["args"])
+			if _supported(myaction, myopts):
+				frozen_config = self._get_frozen_config(myopts)
+
+		if frozen_config is None:
+			try:
+				_send_frame(conn, _FRAME_REFUSE)
+			except socket.error:
+				pass
+			return
+
+		sys.stdout.flush()
+		sys.stderr.flush()
+		pid = os.fork()
+		if pid != 0:
+			return
+
+		# This is the handler process, which forwards the
+		# output of the worker process to the client. It
+		# only serves this client, so it can wait for it.
+		retval = 1
+		try:
+			try:
+				conn.settimeout(None)
+				retval = self._forward(conn, request, frozen_config)
+			except (socket.error, OSError):
+				pass
+			except:
+				traceback.print_exc()
+		finally:
+			os._exit(retval)
+
+	def _forward(self, conn, request, frozen_config):
+		pr, pw = os.pipe()
+		pid = os.fork()
+		if pid == 0:
+			os.close(pr)
+			self._run_worker(conn, pw, request, frozen_config)
+
+		os.close(pw)
+		try:
+			while True:
+				buf = os.read(pr, 4096)
+				if not buf:
+					break
+				_send_frame(conn, _FRAME_OUTPUT, buf)
+		finally:
+			os.close(pr)
+			pid, status = os.waitpid(pid, 0)
+
+		if os.WIFEXITED(status):
+			retval = os.WEXITSTATUS(status)
+		else:
+			retval = 128 + os.WTERMSIG(status)
+		_send_frame(conn, _FRAME_EXIT, struct.pack("!i", retval))
+		return os.EX_OK
+
+	def _run_worker(self, conn, pw, request, frozen_config):
+		retval = 1
+		try:
+			try:
+				conn.close()
+				null_fd = os.open("/dev/null", os.O_RDONLY)
+				os.dup2(null_fd, 0)
+				os.close(null_fd)
+				os.dup2(pw, 1)
+				os.dup2(pw, 2)
+				os.close(pw)
+				# Keep stdout in order with stderr, like on a terminal.
+				sys.stdout = os.fdopen(1, 'w', 1)
+				os.chdir(request["cwd"])
+				_emerge.depgraph._preloaded_frozen_config = frozen_config
+				retval = self._run(request["args"])
+			except SystemExit as e:
+				retval = e.code
+			except:
+				traceback.print_exc()
+			portage.process.run_exitfuncs()
+			if not isinstance(retval, int):
+				retval = retval and 1 or os.EX_OK
+		finally:
+			try:
+				sys.stdout.flush()
+				sys.stderr.flush()
+			finally:
+				os._exit(retval)
+
+	def _run(self, args):
+		from _emerge.main import emerge_main
+		return emerge_main(args, config=self._config)
+
+def resolver_client(socket_path, args):
+	"""
+	Send a request to the ResolverDaemon listening on the given socket,
+	and copy its output to stdout.
+
+	@rtype: int
+	@returns: The exit status of the request, or None if the daemon is
+		not available or doesn't support the request, in which case it
+		should be run locally.
+	"""
+	args = list(args)
+	if "--color" not in args and sys.stdout.isatty() and \
+		os.environ.get("TERM") != "dumb" and \
+		os.environ.get("NOCOLOR", "").lower() not in ("yes", "true"):
+		# The output of the daemon doesn't go to a terminal.
+		args.append("--color=y")
+
+	request = {
+		"args" : args,
+		"cwd" : os.getcwd(),
+		"env" : _get_env(),
+	}
+
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		try:
+			sock.connect(socket_path)
+			sock.sendall(_unicode_encode(json.dumps(request),
+				encoding=_encodings['content'], errors='strict'))
+			sock.shutdown(socket.SHUT_WR)
+		except socket.error:
+			return None
+
+		out = sys.stdout
+		if sys.hexversion >= 0x3000000:
+			out = out.buffer
+		f = sock.makefile('rb')
+		output_started = False
+		try:
+			while True:
+				header = _recv_all(f, _header_size)
+				if header is None:
+					break
+				frame_type, length = struct.unpack(_header_format, header)
+				payload = _recv_all(f, length)
+				if payload is None:
+					break
+				if frame_type == _FRAME_OUTPUT:
+					out.write(payload)
+					out.flush()
+					output_started = True
+				elif frame_type == _FRAME_EXIT:
+					return struct.unpack("!i", payload)[0]
+				elif frame_type == _FRAME_REFUSE:
+					return None
+		except socket.error:
+			pass
+		finally:
+			f.close()
+	finally:
+		sock.close()
+
+	if not output_started:
+		return None
+	writemsg("!!! Lost the connection to the resolver daemon\n",
+		noiselevel=-1)
+	return 1
@@ -50,13 +50,15 @@ from _emerge.clear_caches import clear_caches
 from _emerge.countdown import countdown
 from _emerge.create_depgraph_params import create_depgraph_params
 from _emerge.Dependency import Dependency
-from _emerge.depgraph import backtrack_depgraph, depgraph, resume_depgraph
+from _emerge.depgraph import backtrack_depgraph, cached_depgraph, depgraph, \
+	resume_depgraph
 from _emerge.DepPrioritySatisfiedRange import DepPrioritySatisfiedRange
 from _emerge.emergelog import emergelog
 from _emerge.is_valid_package_atom import is_valid_package_atom
 from _emerge.MetadataRegen import MetadataRegen
 from _emerge.Package import Package
 from _emerge.ProgressHandler import ProgressHandler
+from _emerge.ResolverCache import ResolverCache
 from _emerge.RootConfig import RootConfig
 from _emerge.Scheduler import Scheduler
 from _emerge.search import search
@@ -293,13 +295,37 @@ def action_build(settings, trees, mtimedb,
 			return os.EX_OK
 
 		myparams = create_depgraph_params(myopts, myaction)
-		try:
-			success, mydepgraph, favorites = backtrack_depgraph(
-				settings, trees, myopts, myparams, myaction, myfiles, spinner)
-		except portage.exception.PackageSetNotFound as e:
-			root_config = trees[settings["ROOT"]]["root_config"]
-			display_missing_pkg_set(root_config, e.value)
-			return 1
+		mydepgraph = None
+		resolver_cache = None
+		cache_digest = None
+		if "--resolver-cache" in myopts:
+			resolver_cache = ResolverCache(settings, trees)
+			cache_digest = resolver_cache.get_digest(myaction, myfiles, myopts)
+			resume_data = None
+			if cache_digest is not None:
+				resume_data = resolver_cache.get(cache_digest)
+			if resume_data is not None:
+				success, mydepgraph = cached_depgraph(settings, trees,
+					myopts, myparams, resume_data, spinner)
+				if success:
+					favorites = resume_data["favorites"]
+				else:
+					# Something that isn't part of the digest has
+					# changed, so calculate the merge list again.
+					mydepgraph = None
+
+		if mydepgraph is None:
+			try:
+				success, mydepgraph, favorites = backtrack_depgraph(
+					settings, trees, myopts, myparams, myaction, myfiles, spinner)
+			except portage.exception.PackageSetNotFound as e:
+				root_config = trees[settings["ROOT"]]["root_config"]
+				display_missing_pkg_set(root_config, e.value)
+				return 1
+
+			if success and cache_digest is not None:
+				resolver_cache.store(cache_digest, mydepgraph.altlist(),
+					favorites)
 
 		if not success:
 			mydepgraph.display_problems()
@@ -1910,6 +1936,24 @@ def action_regen(settings, portdb, max_jobs, max_load):
 	portage.writemsg_stdout("done!\n")
 	return regen.returncode
 
+def action_resolver_daemon():
+	socket_path = os.environ.get("PORTAGE_RESOLVER_SOCKET")
+	if not socket_path:
+		writemsg_level("emerge: --resolver-daemon requires " + \
+			"PORTAGE_RESOLVER_SOCKET to be set\n",
+			level=logging.ERROR, noiselevel=-1)
+		return 1
+
+	# Imported here since the daemon imports this module.
+	from _emerge.ResolverDaemon import ResolverDaemon
+	try:
+		ResolverDaemon(socket_path).serve()
+	except (socket.error, OSError) as e:
+		writemsg_level("!!! Resolver daemon failed: %s\n" % (e,),
+			level=logging.ERROR, noiselevel=-1)
+		return 1
+	return os.EX_OK
+
 def action_search(root_config, myopts, myfiles, spinner):
 	if not myfiles:
 		print("emerge: no search terms provided.")
@@ -21,6 +21,7 @@ from portage import _unicode_decode, _unicode_encode, _encodings
 from portage.const import PORTAGE_PACKAGE_ATOM, USER_CONFIG_PATH
 from portage.dbapi import dbapi
 from portage.dep import Atom, extract_affecting_use, check_required_use, human_readable_required_use, _repo_separator
+from portage.dep.dep_check import _zapdeps_memo
 from portage.eapi import eapi_has_strong_blocks, eapi_has_required_use
 from portage.exception import InvalidAtom, InvalidDependString, PortageException
 from portage.output import colorize, create_color_func, \
@@ -33,7 +34,7 @@ from portage._sets.base import InternalPackageSet
 from portage.util import ConfigProtect, shlex_split, new_protect_filename
 from portage.util import cmp_sort_key, writemsg, writemsg_stdout
 from portage.util import writemsg_level, write_atomic
-from portage.util.digraph import digraph
+from portage.util.digraph import compact_digraph, digraph
 from portage.util.listdir import _ignorecvs_dirs
 from portage.versions import catpkgsplit
 
@@ -54,6 +55,7 @@ from _emerge.is_valid_package_atom import is_valid_package_atom
 from _emerge.Package import Package
 from _emerge.PackageArg import PackageArg
 from _emerge.PackageVirtualDbapi import PackageVirtualDbapi
+from _emerge.ResolverCache import ResolverCache
 from _emerge.RootConfig import RootConfig
 from _emerge.search import search
 from _emerge.SetArg import SetArg
@@ -63,9 +65,12 @@ from _emerge.UseFlagDisplay import pkg_use_display
 from _emerge.userquery import userquery
 
 from _emerge.resolver.backtracking import Backtracker, BacktrackParameter
+from _emerge.resolver.parallel_backtracking import _backtrack_result_codec, \
+	run_backtrack_jobs
 from _emerge.resolver.slot_collision import slot_conflict_handler
 from _emerge.resolver.circular_dependency import circular_dependency_handler
 from _emerge.resolver.output import Display
+from _emerge.resolver.profiling import get_resolver_profile
 
 if sys.hexversion >= 0x3000000:
 	basestring = str
@@ -97,6 +102,11 @@ class _frozen_depgraph_config(object):
 		self.edebug = 0
 		if settings.get("PORTAGE_DEBUG", "") == "1":
 			self.edebug = 1
+		# Timing and cache statistics, see ResolverProfile.
+		self._profile = None
+		if settings.get("PORTAGE_RESOLVER_PROFILE"):
+			self._profile = get_resolver_profile(
+				settings["PORTAGE_RESOLVER_PROFILE"])
 		self.spinner = spinner
 		self._running_root = trees["/"]["root_config"]
 		self._opts_no_restart = frozenset(["--buildpkgonly",
@@ -107,6 +117,9 @@ class _frozen_depgraph_config(object):
 		self.roots = {}
 		# All Package instances
 		self._pkg_cache = {}
+		# Ebuilds matching a given atom, which are shared between
+		# backtracking runs since they don't depend on graph state.
+		self._match_pkgs_cache = {}
 		self._highest_license_masked = {}
 		for myroot in trees:
 			self.trees[myroot] = {}
@@ -144,6 +157,41 @@ class _frozen_depgraph_config(object):
 		self.rebuild_if_new_ver = "--rebuild-if-new-ver" in myopts
 		self.rebuild_if_unbuilt = "--rebuild-if-unbuilt" in myopts
 
+	def _sync_vartree(self, myroot):
+		fake_vartree = self.trees[myroot]["vartree"]
+		fake_vartree.sync()
+
+		# FakeVartree.sync() populates virtuals, and we want
+		# self.pkgsettings to have them populated too.
+		self.pkgsettings[myroot] = \
+			portage.config(clone=fake_vartree.settings)
+
+# A frozen config that was prepared in advance by the ResolverDaemon,
+# which is used by the next call to backtrack_depgraph().
+_preloaded_frozen_config = None
+
+def _get_frozen_config(settings, trees, myopts, spinner):
+	"""
+	Return the preloaded frozen config if it was prepared for the given
+	trees and options, and create a new one otherwise. The preloaded one
+	is only used once, since depgraph instances modify its caches.
+	"""
+	global _preloaded_frozen_config
+	frozen_config = _preloaded_frozen_config
+	_preloaded_frozen_config = None
+	if frozen_config is not None and \
+		frozen_config._trees_orig is trees and \
+		ResolverCache.get_opts_key(frozen_config.myopts) == \
+		ResolverCache.get_opts_key(myopts):
+		# Options that only affect display may differ.
+		frozen_config.myopts = myopts
+		frozen_config.spinner = spinner
+		frozen_config.edebug = 0
+		if settings.get("PORTAGE_DEBUG", "") == "1":
+			frozen_config.edebug = 1
+		return frozen_config
+	return _frozen_depgraph_config(settings, trees, myopts, spinner)
+
 class _depgraph_sets(object):
 	def __init__(self):
 		# contains all sets added to the graph
@@ -415,6 +463,8 @@ class _dynamic_depgraph_config(object):
 		self._initially_unsatisfied_deps = []
 		self._ignored_deps = []
 		self._highest_pkg_cache = {}
+		# The || dep choices of dep_zapdeps() for each trees dict.
+		self._zapdeps_memos = []
 
 		self._needed_unstable_keywords = backtrack_parameters.needed_unstable_keywords
 		self._needed_p_mask_changes = backtrack_parameters.needed_p_mask_changes
@@ -452,6 +502,9 @@ class _dynamic_depgraph_config(object):
 			self._graph_trees[myroot]["vartree"]    = graph_tree
 			self._graph_trees[myroot]["graph_db"]   = graph_tree.dbapi
 			self._graph_trees[myroot]["graph"]      = self.digraph
+			self._graph_trees[myroot]["zapdeps_memo"] = _zapdeps_memo()
+			self._zapdeps_memos.append(
+				self._graph_trees[myroot]["zapdeps_memo"])
 			def filtered_tree():
 				pass
 			filtered_tree.dbapi = _dep_check_composite_db(depgraph, myroot)
@@ -476,6 +529,9 @@ class _dynamic_depgraph_config(object):
 			# avoided when possible.
 			self._filtered_trees[myroot]["graph_db"] = graph_tree.dbapi
 			self._filtered_trees[myroot]["graph"]    = self.digraph
+			self._filtered_trees[myroot]["zapdeps_memo"] = _zapdeps_memo()
+			self._zapdeps_memos.append(
+				self._filtered_trees[myroot]["zapdeps_memo"])
 			self._filtered_trees[myroot]["vartree"] = \
 				depgraph._frozen_config.trees[myroot]["vartree"]
 
@@ -523,6 +579,9 @@ class depgraph(object):
 		self._select_atoms = self._select_atoms_highest_available
 		self._select_package = self._select_pkg_highest_available
 
+		if frozen_config._profile is not None:
+			frozen_config._profile.instrument(self)
+
 	def _load_vdb(self):
 		"""
 		Load installed package metadata if appropriate. This used to be called
@@ -543,12 +602,7 @@ class depgraph(object):
 			if not fake_vartree.dbapi:
 				# This needs to be called for the first depgraph, but not for
 				# backtracking depgraphs that share the same frozen_config.
-				fake_vartree.sync()
-
-				# FakeVartree.sync() populates virtuals, and we want
-				# self.pkgsettings to have them populated too.
-				self._frozen_config.pkgsettings[myroot] = \
-					portage.config(clone=fake_vartree.settings)
+				self._frozen_config._sync_vartree(myroot)
 
 			if preload_installed_pkgs:
 				vardb = fake_vartree.dbapi
@@ -1207,12 +1261,16 @@ class depgraph(object):
 				self._dynamic_config.mydbapi[pkg.root].cpv_inject(pkg)
 				self._dynamic_config._filtered_trees[pkg.root]["porttree"].dbapi._clear_cache()
 				self._dynamic_config._highest_pkg_cache.clear()
+				self._invalidate_zapdeps_memos(pkg.cp)
 				self._check_masks(pkg)
 
 			if not pkg.installed:
 				# Allow this package to satisfy old-style virtuals in case it
 				# doesn't already. Any pre-existing providers will be preferred
 				# over this one.
+				if pkg.metadata.get("PROVIDE"):
+					# This may change what old-style virtuals match.
+					self._invalidate_zapdeps_memos()
 				try:
 					pkgsettings.setinst(pkg.cpv, pkg.metadata)
 					# For consistency, also update the global virtuals.
@@ -1231,6 +1289,9 @@ class depgraph(object):
 		# Do this even when addme is False (--onlydeps) so that the
 		# parent/child relationship is always known in case
 		# self._show_slot_collision_notice() needs to be called later.
+		if pkg not in self._dynamic_config.digraph:
+			# dep_zapdeps() prefers choices that are in the graph.
+			self._invalidate_zapdeps_memos(pkg.cp)
 		self._dynamic_config.digraph.add(pkg, myparent, priority=priority)
 		if dep.atom is not None and dep.parent is not None:
 			self._add_parent_atom(pkg, (dep.parent, dep.atom))
@@ -2295,7 +2356,13 @@ class depgraph(object):
 
 		# Now that the root packages have been added to the graph,
 		# process the dependencies.
-		if not self._create_graph():
+		success = self._create_graph()
+		if "--debug" in self._frozen_config.myopts:
+			hits = sum(memo.hits for memo in self._dynamic_config._zapdeps_memos)
+			misses = sum(memo.misses for memo in self._dynamic_config._zapdeps_memos)
+			writemsg_level("\n|| dep choices: %d memo hits, %d misses\n" % \
+				(hits, misses), noiselevel=-1, level=logging.DEBUG)
+		if not success:
 			return 0, myfavorites
 
 		try:
@@ -2383,6 +2450,7 @@ class depgraph(object):
 		self._dynamic_config._highest_pkg_cache.clear()
 		for trees in self._dynamic_config._filtered_trees.values():
 			trees["porttree"].dbapi._clear_cache()
+		self._invalidate_zapdeps_memos()
 
 	def _greedy_slots(self, root_config, atom, blocker_lookahead=False):
 		"""
@@ -2467,6 +2535,17 @@ class depgraph(object):
 		return [pkg.slot_atom for pkg in greedy_pkgs \
 			if pkg not in discard_pkgs]
 
+	def _invalidate_zapdeps_memos(self, cp=None):
+		"""
+		Invalidate the || dep choices that dep_zapdeps() has remembered
+		for atoms of the given cp, or all of them if cp is None.
+		"""
+		for memo in self._dynamic_config._zapdeps_memos:
+			if cp is None:
+				memo.clear()
+			else:
+				memo.invalidate(cp)
+
 	def _select_atoms_from_graph(self, *pargs, **kwargs):
 		"""
 		Prefer atoms matching packages that have already been
@@ -3190,6 +3269,12 @@ class depgraph(object):
 
 		db = root_config.trees[self.pkg_tree_map[pkg_type]].dbapi
 
+		if hasattr(db, "xmatch") and not onlydeps:
+			for pkg in self._iter_match_pkgs_cached(root_config,
+				pkg_type, atom):
+				yield pkg
+			return
+
 		if hasattr(db, "xmatch"):
 			# For portdbapi we match only against the cpv, in order
 			# to bypass unnecessary cache access for things like IUSE
@@ -3268,9 +3353,77 @@ class depgraph(object):
 							continue
 						yield pkg
 
+	def _iter_match_pkgs_cached(self, root_config, pkg_type, atom):
+		"""
+		Like _iter_match_pkgs(), but for portdbapi only. The matches
+		for atom.without_use are remembered in the frozen config, so
+		that backtracking runs don't have to repeat the xmatch() call
+		and the Package lookups. The list is filled lazily, in order
+		to avoid loading metadata for versions that the caller never
+		gets to.
+		"""
+		match_key = (root_config.root, pkg_type, atom.without_use)
+		entry = self._frozen_config._match_pkgs_cache.get(match_key)
+		if entry is None:
+			db = root_config.trees[self.pkg_tree_map[pkg_type]].dbapi
+			cpv_list = db.xmatch("match-all-cpv-only", atom.without_use)
+			if atom.repo is None:
+				repo_list = db.getRepositories()
+			else:
+				repo_list = [atom.repo]
+			# descending order
+			cpv_list.reverse()
+			pending = iter([(cpv, repo) for cpv in cpv_list \
+				for repo in repo_list])
+			entry = (pending, [])
+			self._frozen_config._match_pkgs_cache[match_key] = entry
+
+		pending, matches = entry
+		if atom.use is None:
+			use_atom_set = None
+		else:
+			use_atom_set = InternalPackageSet(initial_atoms=(atom,),
+				allow_repo=True)
+		atom_set = None
+		i = 0
+		while True:
+			if i < len(matches):
+				pkg = matches[i]
+				i += 1
+			else:
+				# Other iterators that share this entry may have
+				# extended the list, so check the length each time.
+				try:
+					cpv, repo = next(pending)
+				except StopIteration:
+					return
+				try:
+					pkg = self._pkg(cpv, pkg_type, root_config, myrepo=repo)
+				except portage.exception.PackageNotFound:
+					continue
+				# See the comments about false matches in
+				# _iter_match_pkgs(). USE is checked separately below,
+				# since it may differ between backtracking runs.
+				if atom_set is None:
+					atom_set = InternalPackageSet(
+						initial_atoms=(atom.without_use,), allow_repo=True)
+				if not atom_set.findAtomForPackage(pkg):
+					continue
+				matches.append(pkg)
+				i = len(matches)
+
+			if use_atom_set is not None and \
+				not use_atom_set.findAtomForPackage(pkg,
+				modified_use=self._pkg_use_enabled(pkg)):
+				continue
+			yield pkg
+
 	def _select_pkg_highest_available(self, root, atom, onlydeps=False):
 		cache_key = (root, atom, onlydeps)
 		ret = self._dynamic_config._highest_pkg_cache.get(cache_key)
+		if self._frozen_config._profile is not None:
+			self._frozen_config._profile.cache_lookup(
+				"_highest_pkg_cache", ret is not None)
 		if ret is not None:
 			pkg, existing = ret
 			if pkg and not existing:
@@ -3425,6 +3578,10 @@ class depgraph(object):
 			#We are not allowed to do the needed changes.
 			return False
 
+		if masked_by_unstable_keywords or masked_by_p_mask or \
+			missing_licenses:
+			self._invalidate_zapdeps_memos(pkg.cp)
+
 		if masked_by_unstable_keywords:
 			self._dynamic_config._needed_unstable_keywords.add(pkg)
 			backtrack_infos = self._dynamic_config._backtrack_infos
@@ -3528,6 +3685,7 @@ class depgraph(object):
 				return old_use
 
 			self._dynamic_config._needed_use_config_changes[pkg] = (new_use, new_changes)
+			self._invalidate_zapdeps_memos(pkg.cp)
 			backtrack_infos = self._dynamic_config._backtrack_infos
 			backtrack_infos.setdefault("config", {})
 			backtrack_infos["config"].setdefault("needed_use_config_changes", [])
@@ -4105,6 +4263,7 @@ class depgraph(object):
 		# _select_package has just changed implementations.
 		for trees in self._dynamic_config._filtered_trees.values():
 			trees["porttree"].dbapi._clear_cache()
+		self._invalidate_zapdeps_memos()
 
 		args = self._dynamic_config._initial_arg_list[:]
 		for root in self._frozen_config.roots:
@@ -4262,6 +4421,17 @@ class depgraph(object):
 
 				blocker_cache = BlockerCache(myroot, vardb)
 				stale_cache = set(blocker_cache)
+
+				# Blockers of installed packages only have an effect if
+				# they match packages that are going to be merged, so
+				# only those that might match are added to the graph.
+				# Old-style virtuals may be matched via PROVIDE.
+				blocked_cps = set(pkg.cp for pkg in final_db \
+					if pkg.operation == "merge")
+				blocked_cps.update(root_config.settings.getvirtuals())
+				blocked_cps.update(pkgsettings.getvirtuals())
+				blocking_cpvs = blocker_cache.get_blocking_cpvs(blocked_cps)
+
 				for pkg in vardb:
 					cpv = pkg.cpv
 					stale_cache.discard(cpv)
@@ -4333,6 +4503,8 @@ class depgraph(object):
 						continue
 
 					if blocker_data:
+						if cpv not in blocking_cpvs:
+							continue
 						blocker_atoms = [Atom(atom) for atom in blocker_data.atoms]
 					else:
 						# Use aux_get() to trigger FakeVartree global
@@ -4373,6 +4545,9 @@ class depgraph(object):
 						counter = long(pkg.metadata["COUNTER"])
 						blocker_cache[cpv] = \
 							blocker_cache.BlockerData(counter, blocker_atoms)
+					if blocker_atoms:
+						blocker_atoms = [atom for atom in blocker_atoms \
+							if atom.cp in blocked_cps]
 					if blocker_atoms:
 						try:
 							for atom in blocker_atoms:
@@ -4730,7 +4905,7 @@ class depgraph(object):
 				if isinstance(node, Package) \
 				and node.operation == 'merge'], scheduler_graph)
 
-		mygraph=self._dynamic_config.digraph.copy()
+		mygraph = compact_digraph.from_digraph(self._dynamic_config.digraph)
 
 		removed_nodes = set()
 
@@ -4763,6 +4938,11 @@ class depgraph(object):
 				break
 			removed_nodes.clear()
 		self._merge_order_bias(mygraph)
+		# Keep track of the leaf nodes for the priority levels that are
+		# checked below, instead of searching for them on each iteration.
+		mygraph.track_degrees(frozenset(
+			DepPriorityNormalRange.ignore_priority +
+			DepPrioritySatisfiedRange.ignore_priority))
 		def cmp_circular_bias(n1, n2):
 			"""
 			RDEPEND is stronger than PDEPEND and this function
@@ -5047,9 +5227,28 @@ class depgraph(object):
 					# these smaller independent cycles.
 					ignore_priority = priority_range.ignore_medium_soft
 					smallest_cycle = None
+					# All nodes of a strongly connected component can reach
+					# the same nodes, so gather_deps() gathers the same group
+					# for each of them, and only one of them needs to be tried.
+					# Since gather_deps() only succeeds for groups of
+					# mergeable nodes, the components of the subgraph of
+					# mergeable nodes are sufficient.
+					component_ids = {}
+					for component_id, component in enumerate(
+						mygraph.strongly_connected_components(
+						ignore_priority=ignore_priority,
+						nodes=mergeable_nodes)):
+						for node in component:
+							component_ids[node] = component_id
+					tried_components = set()
 					for node in nodes:
 						if not mygraph.parent_nodes(node):
 							continue
+						component_id = component_ids.get(node)
+						if component_id is not None:
+							if component_id in tried_components:
+								continue
+							tried_components.add(component_id)
 						selected_nodes = set()
 						if gather_deps(ignore_priority,
 							mergeable_nodes, selected_nodes, node):
@@ -6203,10 +6402,13 @@ class depgraph(object):
 			world_set.unlock()
 
 	def _loadResumeCommand(self, resume_data, skip_masked=True,
-		skip_missing=True):
+		skip_missing=True, deep=True):
 		"""
 		Add a resume command to the graph and validate it in the process.  This
 		will raise a PackageNotFound exception if a package is not available.
+		If deep is False, the deep parameter is left as it is, which is only
+		correct if none of the packages in the merge list have been merged
+		since it was calculated.
 		"""
 
 		self._load_vdb()
@@ -6286,6 +6488,7 @@ class depgraph(object):
 						((pkg.root, "="+pkg.cpv), {"myparent":None}))
 
 			fakedb[myroot].cpv_inject(pkg)
+			self._invalidate_zapdeps_memos(pkg.cp)
 			serialized_tasks.append(pkg)
 			self._spinner_update()
 
@@ -6310,7 +6513,8 @@ class depgraph(object):
 			# deep depenedencies of a scheduled build, that build needs to
 			# be cancelled. In order for this type of situation to be
 			# recognized, deep traversal of dependencies is required.
-			self._dynamic_config.myparams["deep"] = True
+			if deep:
+				self._dynamic_config.myparams["deep"] = True
 
 			for task in serialized_tasks:
 				if isinstance(task, Package) and \
@@ -6525,6 +6729,9 @@ class _dep_check_composite_db(dbapi):
 
 	def match(self, atom):
 		ret = self._match_cache.get(atom)
+		profile = self._depgraph._frozen_config._profile
+		if profile is not None:
+			profile.cache_lookup("_dep_check_composite_db", ret is not None)
 		if ret is not None:
 			return ret[:]
 		pkg, existing = self._depgraph._select_package(self._root, atom)
@@ -6734,12 +6941,30 @@ def _backtrack_depgraph(settings, trees, myopts, myparams, myaction, myfiles, sp
 	max_retries = myopts.get('--backtrack', 10)
 	max_depth = max(1, (max_retries + 1) / 2)
 	allow_backtracking = max_retries > 0
+	backtrack_jobs = myopts.get('--backtrack-jobs', 1)
+	if not hasattr(os, "fork"):
+		backtrack_jobs = 1
 	backtracker = Backtracker(max_depth)
 	backtracked = 0
 
-	frozen_config = _frozen_depgraph_config(settings, trees,
-		myopts, spinner)
+	frozen_config = _get_frozen_config(settings, trees, myopts, spinner)
 
+	def run_job(backtrack_parameters):
+		# This runs in a worker process, so there is nobody to
+		# look at the spinner.
+		frozen_config.spinner = None
+		job_depgraph = depgraph(settings, trees, myopts, myparams, None,
+			frozen_config=frozen_config,
+			allow_backtracking=allow_backtracking,
+			backtrack_parameters=backtrack_parameters)
+		success, favorites = job_depgraph.select_files(myfiles)
+		return (success or job_depgraph.success_without_autounmask(),
+			job_depgraph.need_restart(), job_depgraph.get_backtrack_infos())
+
+	# Results of runs that were started in parallel, but that are not yet
+	# next in depth first order, keyed by the id of their node.
+	pending_results = {}
+	solved = False
 	while backtracker:
 
 		if debug and mydepgraph is not None:
@@ -6748,33 +6973,89 @@ def _backtrack_depgraph(settings, trees, myopts, myparams, myaction, myfiles, sp
 				backtracked, noiselevel=-1, level=logging.DEBUG)
 			mydepgraph.display_problems()
 
-		backtrack_parameters = backtracker.get()
-
-		mydepgraph = depgraph(settings, trees, myopts, myparams, spinner,
-			frozen_config=frozen_config,
-			allow_backtracking=allow_backtracking,
-			backtrack_parameters=backtrack_parameters)
-		success, favorites = mydepgraph.select_files(myfiles)
+		if backtrack_jobs > 1:
+			# Each run that ends with a restart increments backtracked,
+			# so don't start more runs than the sequential loop would.
+			runs = backtracker.get_many(
+				min(backtrack_jobs, max_retries - backtracked + 1))
+			new_runs = [(node, parameter) for node, parameter in runs
+				if id(node) not in pending_results]
+			if len(new_runs) > 1:
+				# Packages from the results are looked up via a depgraph
+				# with an empty graph, like in the workers.
+				loader = depgraph(settings, trees, myopts, myparams, None,
+					frozen_config=frozen_config)
+				codec = _backtrack_result_codec(frozen_config.roots,
+					loader._pkg)
+				new_results = run_backtrack_jobs([parameter for node,
+					parameter in new_runs], run_job, codec)
+				for (node, parameter), result in zip(new_runs, new_results):
+					if result is not None:
+						pending_results[id(node)] = result
+				if debug:
+					writemsg_level(
+						"\n\nbacktracking tries %s-%s ran in %s workers\n\n" % \
+						(backtracked, backtracked + len(runs) - 1,
+						len(new_runs)), noiselevel=-1, level=logging.DEBUG)
+			results = [pending_results.pop(id(node), None)
+				for node, parameter in runs]
+		else:
+			runs = [(None, backtracker.get())]
+			results = [None]
+
+		mydepgraph = None
+		done = False
+		for i, ((node, backtrack_parameters), result) in \
+			enumerate(zip(runs, results)):
+			if result is not None:
+				solved, need_restart, backtrack_infos = result
+				if solved or not need_restart or \
+					backtracked >= max_retries:
+					# This run ends the loop, so repeat it here in order
+					# to get a depgraph instance for the caller.
+					result = None
+
+			if result is None:
+				mydepgraph = depgraph(settings, trees, myopts, myparams, spinner,
+					frozen_config=frozen_config,
+					allow_backtracking=allow_backtracking,
+					backtrack_parameters=backtrack_parameters)
+				success, favorites = mydepgraph.select_files(myfiles)
+				solved = success or mydepgraph.success_without_autounmask()
+
+				if solved or not allow_backtracking or \
+					backtracked >= max_retries or \
+					not mydepgraph.need_restart():
+					done = True
+					break
+				backtrack_infos = mydepgraph.get_backtrack_infos()
 
-		if success or mydepgraph.success_without_autounmask():
-			break
-		elif not allow_backtracking:
-			break
-		elif backtracked >= max_retries:
-			break
-		elif mydepgraph.need_restart():
 			backtracked += 1
-			backtracker.feedback(mydepgraph.get_backtrack_infos())
-		else:
+			unexplored = len(backtracker)
+			backtracker.feedback(backtrack_infos, node=node)
+			if len(backtracker) > unexplored and i + 1 < len(runs):
+				# The new nodes come before the remaining runs in depth
+				# first order, so those are put back, and their results
+				# are kept until they are next.
+				for (other, parameter), other_result in \
+					zip(runs[i+1:], results[i+1:]):
+					if other_result is not None:
+						pending_results[id(other)] = other_result
+				backtracker.restore([other for other, parameter
+					in runs[i+1:]])
+				break
+
+		if done:
 			break
 
-	if not (success or mydepgraph.success_without_autounmask()) and backtracked:
+	if not solved and backtracked:
 
 		if debug:
 			writemsg_level(
 				"\n\nbacktracking aborted after %s tries\n\n" % \
 				backtracked, noiselevel=-1, level=logging.DEBUG)
-			mydepgraph.display_problems()
+			if mydepgraph is not None:
+				mydepgraph.display_problems()
 
 		mydepgraph = depgraph(settings, trees, myopts, myparams, spinner,
 			frozen_config=frozen_config,
@@ -6796,6 +7077,29 @@ def _backtrack_depgraph(settings, trees, myopts, myparams, myaction, myfiles, sp
 	return (success, mydepgraph, favorites)
 
 
+def cached_depgraph(settings, trees, myopts, myparams, resume_data, spinner):
+	"""
+	Construct a depgraph for a merge list that has been loaded from the
+	ResolverCache. Unlike resume_depgraph(), no packages are dropped and
+	dependencies are not traversed deeply unless the options ask for it,
+	since the cache is only valid if nothing has changed since the merge
+	list was calculated.
+	@rtype: tuple
+	@returns: (success, depgraph)
+	"""
+	_spinner_start(spinner, myopts)
+	try:
+		mydepgraph = depgraph(settings, trees, myopts, myparams, spinner)
+		try:
+			success = mydepgraph._loadResumeCommand(resume_data,
+				skip_masked=False, skip_missing=False, deep=False)
+		except (portage.exception.PackageNotFound,
+			depgraph.UnsatisfiedResumeDep):
+			success = False
+		return (success, mydepgraph)
+	finally:
+		_spinner_stop(spinner)
+
 def resume_depgraph(settings, trees, mtimedb, myopts, myparams, spinner):
 	"""
 	Raises PackageSetNotFound if myfiles contains a missing package set.
@@ -181,6 +181,20 @@ def help(myopts, havecolor=1):
 		for line in wrap(desc, desc_width):
 			print(desc_indent + line)
 		print()
+		print("       "+green("--resolver-daemon"))
+		desc = "Run a daemon that keeps the configuration and the " + \
+			"installed packages loaded, and that calculates " + \
+			"dependencies for other emerge --pretend processes. " + \
+			"It listens on the Unix socket given by " + \
+			"PORTAGE_RESOLVER_SOCKET, and emerge uses it when that " + \
+			"variable is set. The daemon reloads everything when the " + \
+			"configuration, the repositories or the installed " + \
+			"packages change, and emerge calculates dependencies " + \
+			"itself when the daemon is not running or its " + \
+			"environment differs."
+		for line in wrap(desc, desc_width):
+			print(desc_indent + line)
+		print()
 		print("       "+green("--resume")+" ("+green("-r")+" short option)")
 		print("              Resumes the most recent merge list that has been aborted due to an")
 		print("              error. Please note that this operation will only return an error")
@@ -327,6 +341,15 @@ def help(myopts, havecolor=1):
 		for line in wrap(desc, desc_width):
 			print(desc_indent + line)
 		print()
+		print("       " + green("--backtrack-jobs") + " " + turquoise("JOBS"))
+		desc = "Specifies the number of backtracking runs that may be " + \
+			"tried in parallel, each in a separate worker process. " + \
+			"Runs are started ahead of time, but their results are " + \
+			"used in the same order as with sequential backtracking, " + \
+			"so the same solution is found (default: '1')."
+		for line in wrap(desc, desc_width):
+			print(desc_indent + line)
+		print()
 		print("       " + green("--binpkg-respect-use") + " [ %s | %s ]" % \
 			(turquoise("y"), turquoise("n")))
 		desc = "Tells emerge to ignore binary packages if their use flags" + \
@@ -693,6 +716,17 @@ def help(myopts, havecolor=1):
 		for line in wrap(desc, desc_width):
 			print(desc_indent + line)
 		print()
+		print("       " + green("--resolver-cache") + " [ %s | %s ]" % \
+			(turquoise("y"), turquoise("n")))
+		desc = "Save the merge list of a successful dependency " + \
+			"calculation in a cache. When the same command is run " + \
+			"again and neither the configuration, the repositories, " + \
+			"nor the installed packages have changed, the merge list " + \
+			"is reloaded from the cache instead of being calculated " + \
+			"again (default: 'n')."
+		for line in wrap(desc, desc_width):
+			print(desc_indent + line)
+		print()
 		print("       "+green("--root=DIR"))
 		desc = "Set the ROOT environment variable " + \
 			"which is documented in the emerge(1) man page."
@@ -37,7 +37,8 @@ from portage._sets import SETPREFIX
 from portage._global_updates import _global_updates
 
 from _emerge.actions import action_config, action_sync, action_metadata, \
-	action_regen, action_search, action_uninstall, action_info, action_build, \
+	action_regen, action_resolver_daemon, action_search, action_uninstall, \
+	action_info, action_build, \
 	adjust_configs, chk_updated_cfg_files, pw_grp_conv, display_missing_pkg_set, \
 	display_news_notification, getportageversion, load_emerge_config
 import _emerge
@@ -580,7 +581,7 @@ def parse_opts(tmpcmdline, silent=False):
 	actions = frozenset([
 		"clean", "config", "depclean", "help",
 		"info", "list-sets", "metadata",
-		"prune", "regen",  "search",
+		"prune", "regen", "resolver-daemon", "search",
 		"sync",  "unmerge", "version",
 	])
 
@@ -621,6 +622,14 @@ def parse_opts(tmpcmdline, silent=False):
 			"action" : "store"
 		},
 
+		"--backtrack-jobs": {
+
+			"help"   : "Specifies the number of backtracking runs to " + \
+				"try in parallel worker processes",
+
+			"action" : "store"
+		},
+
 		"--buildpkg": {
 			"shortopt" : "-b",
 			"help"     : "build binary packages",
@@ -827,6 +836,13 @@ def parse_opts(tmpcmdline, silent=False):
 			"action" : "store"
 		},
 
+		"--resolver-cache": {
+			"help"     : "reuse the result of a previous dependency " + \
+			             "calculation if nothing has changed since",
+			"type"     : "choice",
+			"choices"  : true_y_or_n
+		},
+
 		"--root": {
 		 "help"   : "specify the target root filesystem for merging packages",
 		 "action" : "store"
@@ -1043,6 +1059,11 @@ def parse_opts(tmpcmdline, silent=False):
 	if myoptions.rebuilt_binaries in true_y:
 		myoptions.rebuilt_binaries = True
 
+	if myoptions.resolver_cache in true_y:
+		myoptions.resolver_cache = True
+	else:
+		myoptions.resolver_cache = None
+
 	if myoptions.root_deps in true_y:
 		myoptions.root_deps = True
 
@@ -1070,6 +1091,21 @@ def parse_opts(tmpcmdline, silent=False):
 
 		myoptions.backtrack = backtrack
 
+	if myoptions.backtrack_jobs is not None:
+
+		try:
+			backtrack_jobs = int(myoptions.backtrack_jobs)
+		except (OverflowError, ValueError):
+			backtrack_jobs = 0
+
+		if backtrack_jobs < 1:
+			backtrack_jobs = None
+			if not silent:
+				parser.error("Invalid --backtrack-jobs parameter: '%s'\n" % \
+					(myoptions.backtrack_jobs,))
+
+		myoptions.backtrack_jobs = backtrack_jobs
+
 	if myoptions.deep is not None:
 		deep = None
 		if myoptions.deep == "True":
@@ -1488,10 +1524,43 @@ def check_procfs():
 		level=logging.ERROR, noiselevel=-1)
 	return 1
 
-def emerge_main(args=None):
+def adjust_binpkg_opts(settings, myopts):
+	"""
+	Add the binary package options that are implied by FEATURES
+	and by other options.
+	"""
+	if "getbinpkg" in settings.features:
+		myopts["--getbinpkg"] = True
+
+	if "--getbinpkgonly" in myopts:
+		myopts["--getbinpkg"] = True
+
+	if "--getbinpkgonly" in myopts:
+		myopts["--usepkgonly"] = True
+
+	if "--getbinpkg" in myopts:
+		myopts["--usepkg"] = True
+
+	if "--usepkgonly" in myopts:
+		myopts["--usepkg"] = True
+
+	if "buildpkg" in settings.features or "--buildpkgonly" in myopts:
+		myopts["--buildpkg"] = True
+
+	if "--buildpkgonly" in myopts:
+		# --buildpkgonly will not merge anything, so
+		# it cancels all binary package options.
+		for opt in ("--getbinpkg", "--getbinpkgonly",
+			"--usepkg", "--usepkgonly"):
+			myopts.pop(opt, None)
+
+def emerge_main(args=None, config=None):
 	"""
 	@param args: command arguments (default: sys.argv[1:])
 	@type args: list
+	@param config: the (settings, trees, mtimedb) tuple to use instead of
+		loading the config (used by the ResolverDaemon)
+	@type config: tuple
 	"""
 	if args is None:
 		args = sys.argv[1:]
@@ -1517,7 +1586,22 @@ def emerge_main(args=None):
 
 	# Portage needs to ensure a sane umask for the files it creates.
 	os.umask(0o22)
-	settings, trees, mtimedb = load_emerge_config()
+
+	if myaction == "resolver-daemon":
+		return action_resolver_daemon()
+
+	if config is None and os.environ.get("PORTAGE_RESOLVER_SOCKET"):
+		from _emerge.ResolverDaemon import _supported, resolver_client
+		if _supported(myaction, myopts):
+			retval = resolver_client(
+				os.environ["PORTAGE_RESOLVER_SOCKET"], args)
+			if retval is not None:
+				return retval
+
+	if config is None:
+		settings, trees, mtimedb = load_emerge_config()
+	else:
+		settings, trees, mtimedb = config
 	portdb = trees[settings["ROOT"]]["porttree"].dbapi
 	rval = profile_check(trees, myaction)
 	if rval != os.EX_OK:
@@ -1575,30 +1659,7 @@ def emerge_main(args=None):
 		config_protect_check(trees)
 	check_procfs()
 
-	if "getbinpkg" in settings.features:
-		myopts["--getbinpkg"] = True
-
-	if "--getbinpkgonly" in myopts:
-		myopts["--getbinpkg"] = True
-
-	if "--getbinpkgonly" in myopts:
-		myopts["--usepkgonly"] = True
-
-	if "--getbinpkg" in myopts:
-		myopts["--usepkg"] = True
-
-	if "--usepkgonly" in myopts:
-		myopts["--usepkg"] = True
-
-	if "buildpkg" in settings.features or "--buildpkgonly" in myopts:
-		myopts["--buildpkg"] = True
-
-	if "--buildpkgonly" in myopts:
-		# --buildpkgonly will not merge anything, so
-		# it cancels all binary package options.
-		for opt in ("--getbinpkg", "--getbinpkgonly",
-			"--usepkg", "--usepkgonly"):
-			myopts.pop(opt, None)
+	adjust_binpkg_opts(settings, myopts)
 
 	for mytrees in trees.values():
 		mydb = mytrees["porttree"].dbapi
@@ -67,6 +67,7 @@ class Backtracker(object):
 
 	__slots__ = (
 		"_max_depth", "_unexplored_nodes", "_current_node", "_nodes", "_root",
+		"_get_many_base",
 	)
 
 	def __init__(self, max_depth):
@@ -74,6 +75,7 @@ class Backtracker(object):
 		self._unexplored_nodes = []
 		self._current_node = None
 		self._nodes = []
+		self._get_many_base = None
 
 		self._root = _BacktrackNode()
 		self._add(self._root)
@@ -102,6 +104,36 @@ class Backtracker(object):
 			return None
 
 
+	def get_many(self, count):
+		"""
+		Like get(), but returns up to count (node, parameter) pairs from
+		the top of the stack of unexplored nodes, so that they can be tried
+		in parallel. Only the first of them is certain to be the one that
+		get() would return next, since feedback() for it may add new nodes
+		that get() would return before the others. So the runs have to be
+		fed back in order, each with its node, and as soon as feedback()
+		adds nodes (which makes len() grow), the nodes of the remaining
+		runs have to be passed to restore() before anything else is done.
+		"""
+		result = []
+		while self._unexplored_nodes and len(result) < count:
+			node = self._unexplored_nodes.pop()
+			result.append((node, copy.deepcopy(node.parameter)))
+		self._get_many_base = len(self._unexplored_nodes)
+		return result
+
+
+	def restore(self, nodes):
+		"""
+		Put back the given nodes from the last get_many() call, which
+		haven't been fed back, below the nodes that feedback() has added
+		since, so that they are returned in the same order as if they
+		had never been taken.
+		"""
+		base = self._get_many_base
+		self._unexplored_nodes[base:base] = reversed(nodes)
+
+
 	def __len__(self):
 		return len(self._unexplored_nodes)
 
@@ -158,10 +190,13 @@ class Backtracker(object):
 		self._current_node = new_node
 
 
-	def feedback(self, infos):
+	def feedback(self, infos, node=None):
 		"""
 		Takes information from the depgraph and computes new backtrack parameters to try.
+		The node argument is required for runs that were started with get_many().
 		"""
+		if node is not None:
+			self._current_node = node
 		assert self._current_node is not None, "call feedback() only after get() was called"
 
 		#Not all config changes require a restart, that's why they can appear together
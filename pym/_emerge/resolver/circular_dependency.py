@@ -65,7 +65,7 @@ class circular_dependency_handler(object):
 		indent = ""
 		for pos, pkg in enumerate(self.shortest_cycle):
 			parent = self.shortest_cycle[pos-1]
-			priorities = self.graph.nodes[parent][0][pkg]
+			priorities = self.graph.get_priorities(pkg, parent)
 			if pos > 0:
 				msg.append(indent + "%s (%s)" % (pkg, priorities[-1],))
 			else:
@@ -74,7 +74,7 @@ class circular_dependency_handler(object):
 
 		pkg = self.shortest_cycle[0]
 		parent = self.shortest_cycle[-1]
-		priorities = self.graph.nodes[parent][0][pkg]
+		priorities = self.graph.get_priorities(pkg, parent)
 		msg.append(indent + "%s (%s)" % (pkg, priorities[-1],))
 
 		return "\n".join(msg)
@@ -99,7 +99,7 @@ class circular_dependency_handler(object):
 
 		for pos, pkg in enumerate(self.shortest_cycle):
 			parent = self.shortest_cycle[pos-1]
-			priorities = self.graph.nodes[parent][0][pkg]
+			priorities = self.graph.get_priorities(pkg, parent)
 			parent_atoms = self.all_parent_atoms.get(pkg)
 
 			if priorities[-1].buildtime:
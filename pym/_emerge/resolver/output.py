@@ -33,6 +33,8 @@ if sys.hexversion >= 0x3000000:
 
 class Display(object):
 	"""Formats and outputs the depgrah supplied it for merge/re-merge, etc.
+	Each entry is written as soon as it has been formatted, so that the
+	start of a large merge list is shown without waiting for the rest.
 
 	__call__()
 	@param depgraph: list
@@ -42,7 +44,7 @@ class Display(object):
 
 	def __init__(self):
 		self.changelogs = []
-		self.print_msg = []
+		self.show_repos = False
 		self.blockers = []
 		self.counters = _PackageCounters()
 		self.resolver = None
@@ -68,14 +70,13 @@ class Display(object):
 
 
 	def _blockers(self, pkg, fetch_symbol):
-		"""Processes pkg for blockers and adds colorized strings to
-		self.print_msg and self.blockers
+		"""Processes pkg for blockers and prints colorized strings or
+		adds them to self.blockers
 
 		@param pkg: _emerge.Package instance
 		@param fetch_symbol: string
 		@rtype: bool
-		Modifies class globals: self.blocker_style, self.resolved,
-			self.print_msg
+		Modifies class globals: self.blocker_style, self.resolved
 		"""
 		if pkg.satisfied:
 			self.blocker_style = "PKG_BLOCKER_SATISFIED"
@@ -111,7 +112,7 @@ class Display(object):
 		if isinstance(pkg, Blocker) and pkg.satisfied:
 			if self.conf.columns:
 				return True
-			self.print_msg.append(addl)
+			self.print_message(addl)
 		else:
 			self.blockers.append(addl)
 		return False
@@ -301,14 +302,13 @@ class Display(object):
 				return colorize("PKG_NOMERGE", pkg_str)
 
 
-	def verbose_size(self, pkg, repoadd_set, pkg_info):
+	def verbose_size(self, pkg, pkg_info):
 		"""Determines the size of the downloads required
 
 		@param pkg: _emerge.Package instance
-		@param repoadd_set: set of repos to add
 		@param pkg_info: dictionary
 		Modifies class globals: self.myfetchlist, self.counters.totalsize,
-			self.verboseadd, repoadd_set.
+			self.verboseadd, self.repoadd.
 		"""
 		mysize = 0
 		if pkg.type_name == "ebuild" and pkg_info.merge:
@@ -324,11 +324,21 @@ class Display(object):
 				for myfetchfile in myfilesdict:
 					if myfetchfile not in self.myfetchlist:
 						mysize += myfilesdict[myfetchfile]
-						self.myfetchlist.append(myfetchfile)
+						self.myfetchlist.add(myfetchfile)
 				if pkg_info.ordered:
 					self.counters.totalsize += mysize
 			self.verboseadd += _format_size(mysize)
 
+		self.repoadd = self.get_repoadd(pkg, pkg_info.repo_path_real)
+
+
+	def get_repoadd(self, pkg, repo_path_real):
+		"""Determines the repository string for the verbose output
+
+		@param pkg: _emerge.Package instance
+		@param repo_path_real: string
+		@rtype string
+		"""
 		# overlay verbose
 		# assign index for a previous version in the same slot
 		slot_matches = self.vardb.match(pkg.slot_atom)
@@ -340,22 +350,19 @@ class Display(object):
 
 		# now use the data to generate output
 		if pkg.installed or not slot_matches:
-			self.repoadd = self.conf.repo_display.repoStr(
-				pkg_info.repo_path_real)
+			repoadd = self.conf.repo_display.repoStr(repo_path_real)
 		else:
 			repo_path_prev = None
 			if repo_name_prev:
 				repo_path_prev = self.portdb.getRepositoryPath(
 					repo_name_prev)
-			if repo_path_prev == pkg_info.repo_path_real:
-				self.repoadd = self.conf.repo_display.repoStr(
-					pkg_info.repo_path_real)
+			if repo_path_prev == repo_path_real:
+				repoadd = self.conf.repo_display.repoStr(repo_path_real)
 			else:
-				self.repoadd = "%s=>%s" % (
+				repoadd = "%s=>%s" % (
 					self.conf.repo_display.repoStr(repo_path_prev),
-					self.conf.repo_display.repoStr(pkg_info.repo_path_real))
-		if self.repoadd:
-			repoadd_set.add(self.repoadd)
+					self.conf.repo_display.repoStr(repo_path_real))
+		return repoadd
 
 
 	@staticmethod
@@ -527,22 +534,20 @@ class Display(object):
 		return addl
 
 
-	def print_messages(self, show_repos):
-		"""Performs the actual output printing of the pre-formatted
-		messages
+	def print_message(self, msg):
+		"""Performs the actual output printing of a formatted message
 
-		@param show_repos: bool.
+		@param msg: string, or a (myprint, verboseadd, repoadd) tuple
 		"""
-		for msg in self.print_msg:
-			if isinstance(msg, basestring):
-				writemsg_stdout("%s\n" % (msg,), noiselevel=-1)
-				continue
-			myprint, self.verboseadd, repoadd = msg
-			if self.verboseadd:
-				myprint += " " + self.verboseadd
-			if show_repos and repoadd:
-				myprint += " " + teal("[%s]" % repoadd)
-			writemsg_stdout("%s\n" % (myprint,), noiselevel=-1)
+		if isinstance(msg, basestring):
+			writemsg_stdout("%s\n" % (msg,), noiselevel=-1)
+			return
+		myprint, verboseadd, repoadd = msg
+		if verboseadd:
+			myprint += " " + verboseadd
+		if self.show_repos and repoadd:
+			myprint += " " + teal("[%s]" % repoadd)
+		writemsg_stdout("%s\n" % (myprint,), noiselevel=-1)
 		return
 
 
@@ -608,6 +613,48 @@ class Display(object):
 		return display_list
 
 
+	def get_show_repos(self, mylist):
+		"""Determines whether the repositories are shown in the verbose
+		output, which is the case unless all of the packages come from
+		the main repository. This is done before anything is printed,
+		since it affects every entry of the merge list.
+
+		@param mylist: list of (pkg, depth, ordered) tuples
+		@rtype bool
+		"""
+		repoadd_set = set()
+		for pkg, depth, ordered in mylist:
+			if isinstance(pkg, Blocker):
+				continue
+			self.portdb = self.conf.trees[pkg.root]["porttree"].dbapi
+			self.vardb = self.conf.trees[pkg.root]["vartree"].dbapi
+			repoadd = self.get_repoadd(pkg, self.get_repo_path(pkg)[1])
+			if repoadd:
+				repoadd_set.add(repoadd)
+		return bool(repoadd_set) and repoadd_set != set(["0"])
+
+
+	def get_repo_path(self, pkg):
+		"""Finds the ebuild and the real path of the repository of a package
+
+		@param pkg: _emerge.Package instance
+		@rtype ebuild_path, repo_path_real: strings, ebuild_path is None
+			for built packages
+		"""
+		ebuild_path = None
+		if pkg.type_name == "ebuild":
+			ebuild_path = self.portdb.findname(pkg.cpv, myrepo=pkg.repo)
+			if ebuild_path is None:
+				raise AssertionError(
+					"ebuild not found for '%s'" % pkg.cpv)
+			repo_path_real = os.path.dirname(os.path.dirname(
+				os.path.dirname(ebuild_path)))
+		else:
+			repo_path_real = \
+				self.portdb.getRepositoryPath(pkg.metadata["repository"])
+		return ebuild_path, repo_path_real
+
+
 	def set_pkg_info(self, pkg, ordered):
 		"""Sets various pkg_info dictionary variables
 
@@ -625,19 +672,9 @@ class Display(object):
 		if not pkg_info.merge and pkg_info.operation == "merge":
 			pkg_info.operation = "nomerge"
 		pkg_info.built = pkg.type_name != "ebuild"
-		pkg_info.ebuild_path = None
 		pkg_info.repo_name = pkg.repo
-		if pkg.type_name == "ebuild":
-			pkg_info.ebuild_path = self.portdb.findname(
-				pkg.cpv, myrepo=pkg_info.repo_name)
-			if pkg_info.ebuild_path is None:
-				raise AssertionError(
-					"ebuild not found for '%s'" % pkg.cpv)
-			pkg_info.repo_path_real = os.path.dirname(os.path.dirname(
-				os.path.dirname(pkg_info.ebuild_path)))
-		else:
-			pkg_info.repo_path_real = \
-				self.portdb.getRepositoryPath(pkg.metadata["repository"])
+		pkg_info.ebuild_path, pkg_info.repo_path_real = \
+			self.get_repo_path(pkg)
 		pkg_info.use = list(self.conf.pkg_use_enabled(pkg))
 		if not pkg.built and pkg.operation == 'merge' and \
 			'fetch' in pkg.metadata.restrict:
@@ -774,18 +811,17 @@ class Display(object):
 		@param verbosity: verbose level, defaults to None
 		Modifies self.conf, self.myfetchlist, self.portdb, self.vardb,
 			self.pkgsettings, self.verboseadd, self.oldlp, self.newlp,
-			self.print_msg,
+			self.show_repos,
 		"""
 		if favorites is None:
 			favorites = []
 		self.conf = _DisplayConfig(depgraph, mylist, favorites, verbosity)
 		mylist = self.get_display_list(self.conf.mylist)
-		# files to fetch list - avoids counting a same file twice
+		if self.conf.verbosity == 3:
+			self.show_repos = self.get_show_repos(mylist)
+		# files to fetch set - avoids counting a same file twice
 		# in size display (verbose mode)
-		self.myfetchlist = []
-		# Use this set to detect when all the "repoadd" strings are "[0]"
-		# and disable the entire repo display in this case.
-		repoadd_set = set()
+		self.myfetchlist = set()
 
 		for mylist_index in range(len(mylist)):
 			pkg, depth, ordered = mylist[mylist_index]
@@ -806,7 +842,7 @@ class Display(object):
 				self._display_use(pkg, pkg_info.oldbest, myinslotlist)
 				self.recheck_hidden(pkg)
 				if self.conf.verbosity == 3:
-					self.verbose_size(pkg, repoadd_set, pkg_info)
+					self.verbose_size(pkg, pkg_info)
 
 				pkg_info.cp = pkg.cp
 				pkg_info.ver = self.get_ver_str(pkg)
@@ -850,7 +886,7 @@ class Display(object):
 
 				if self.conf.columns and pkg.operation == "uninstall":
 					continue
-				self.print_msg.append((myprint, self.verboseadd, self.repoadd))
+				self.print_message((myprint, self.verboseadd, self.repoadd))
 
 				if not self.conf.tree_display \
 					and not self.conf.no_restart \
@@ -863,23 +899,20 @@ class Display(object):
 						'git' in pkg.inherited or \
 						'git-2' in pkg.inherited:
 						if mylist_index < len(mylist) - 1:
-							self.print_msg.append(
+							self.print_message(
 								colorize(
 									"WARN", "*** Portage will stop merging "
 									"at this point and reload itself,"
 									)
 								)
-							self.print_msg.append(
+							self.print_message(
 								colorize("WARN", "    then resume the merge.")
 								)
 
-		show_repos = repoadd_set and repoadd_set != set(["0"])
-
-		# now finally print out the messages
-		self.print_messages(show_repos)
+		# now finally print out the blockers and the totals
 		self.print_blockers()
 		if self.conf.verbosity == 3:
-			self.print_verbose(show_repos)
+			self.print_verbose(self.show_repos)
 		if self.conf.changelog:
 			self.print_changelog()
 
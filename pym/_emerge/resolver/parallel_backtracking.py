@@ -0,0 +1,243 @@
+# Copyright 2011 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import errno
+import signal
+import sys
+import traceback
+
+try:
+	import cPickle as pickle
+except ImportError:
+	import pickle
+
+from io import BytesIO
+
+import portage
+from portage import os
+from portage.dep import Atom
+from portage._sets import SETPREFIX
+from _emerge.AtomArg import AtomArg
+from _emerge.Package import Package
+from _emerge.PackageArg import PackageArg
+from _emerge.RootConfig import RootConfig
+from _emerge.SetArg import SetArg
+
+if sys.hexversion >= 0x3000000:
+	_unicode = str
+else:
+	_unicode = unicode
+
+class _backtrack_result_codec(object):
+	"""
+	Serializes the result of a backtracking run, which refers to Package
+	instances, atoms and arguments that belong to the depgraph of the
+	worker process. These are replaced with persistent ids on the way
+	out, and they are looked up again in the parent process, so that
+	the Backtracker gets the same instances that a run in the parent
+	process would have produced.
+	"""
+
+	def __init__(self, roots, load_pkg):
+		"""
+		@param roots: maps each root to its RootConfig
+		@type roots: dict
+		@param load_pkg: called as load_pkg(cpv, type_name, root_config,
+			installed, onlydeps, repo) to get a Package instance, like
+			depgraph._pkg()
+		@type load_pkg: callable
+		"""
+		self._roots = roots
+		self._load_pkg = load_pkg
+
+	@staticmethod
+	def _atom_id(atom):
+		# Atom is a str subclass, so it's converted to plain strings
+		# here, since persistent ids are pickled normally.
+		unevaluated = atom.unevaluated_atom
+		if unevaluated == atom:
+			unevaluated = None
+		else:
+			unevaluated = _unicode(unevaluated)
+		return (_unicode(atom), unevaluated, atom.extended_syntax)
+
+	def _load_atom(self, atom_id):
+		s, unevaluated, extended_syntax = atom_id
+		if unevaluated is not None:
+			unevaluated = Atom(unevaluated, allow_repo=True,
+				allow_wildcard=extended_syntax)
+		return Atom(s, unevaluated_atom=unevaluated, allow_repo=True,
+			allow_wildcard=extended_syntax)
+
+	@staticmethod
+	def _pkg_id(pkg):
+		return (_unicode(pkg.cpv), pkg.type_name, pkg.root, pkg.installed,
+			pkg.onlydeps, pkg.repo)
+
+	def _load_pkg_id(self, pkg_id):
+		cpv, type_name, root, installed, onlydeps, repo = pkg_id
+		return self._load_pkg(cpv, type_name, self._roots[root],
+			installed, onlydeps, repo)
+
+	def _persistent_id(self, obj):
+		if isinstance(obj, Package):
+			return ("Package",) + self._pkg_id(obj)
+		if isinstance(obj, Atom):
+			return ("Atom",) + self._atom_id(obj)
+		if isinstance(obj, RootConfig):
+			return ("RootConfig", obj.root)
+		if isinstance(obj, AtomArg):
+			return ("AtomArg", obj.arg, obj.root_config.root) + \
+				self._atom_id(obj.atom)
+		if isinstance(obj, PackageArg):
+			return ("PackageArg", obj.arg, obj.root_config.root) + \
+				self._pkg_id(obj.package)
+		if isinstance(obj, SetArg):
+			return ("SetArg", obj.arg, obj.root_config.root)
+		return None
+
+	def _persistent_load(self, obj_id):
+		kind = obj_id[0]
+		if kind == "Package":
+			return self._load_pkg_id(obj_id[1:])
+		if kind == "Atom":
+			return self._load_atom(obj_id[1:])
+		if kind == "RootConfig":
+			return self._roots[obj_id[1]]
+		arg, root_config = obj_id[1], self._roots[obj_id[2]]
+		if kind == "AtomArg":
+			return AtomArg(arg=arg, atom=self._load_atom(obj_id[3:]),
+				root_config=root_config)
+		if kind == "PackageArg":
+			return PackageArg(arg=arg, package=self._load_pkg_id(obj_id[3:]),
+				root_config=root_config)
+		if kind == "SetArg":
+			return SetArg(arg=arg,
+				pset=root_config.sets.get(arg[len(SETPREFIX):]),
+				root_config=root_config)
+		raise pickle.UnpicklingError("unknown persistent id: %s" % (kind,))
+
+	def dumps(self, obj):
+		f = BytesIO()
+		pickler = pickle.Pickler(f, 2)
+		pickler.persistent_id = self._persistent_id
+		pickler.dump(obj)
+		return f.getvalue()
+
+	def loads(self, data):
+		unpickler = pickle.Unpickler(BytesIO(data))
+		unpickler.persistent_load = self._persistent_load
+		return unpickler.load()
+
+def _read_all(fd):
+	chunks = []
+	while True:
+		try:
+			buf = os.read(fd, 65536)
+		except OSError as e:
+			if e.errno == errno.EINTR:
+				continue
+			raise
+		if not buf:
+			break
+		chunks.append(buf)
+	return b"".join(chunks)
+
+def _write_all(fd, data):
+	while data:
+		try:
+			written = os.write(fd, data)
+		except OSError as e:
+			if e.errno == errno.EINTR:
+				continue
+			raise
+		data = data[written:]
+
+def run_backtrack_jobs(parameters, run, codec):
+	"""
+	Call run(parameter) for each of the given backtrack parameters, each
+	in a separate forked process. The workers share the state of the
+	parent process (notably the frozen depgraph config) copy-on-write,
+	and their output is discarded.
+
+	@param parameters: backtrack parameters to try
+	@type parameters: list
+	@param run: called as run(parameter) to do a backtracking run, which
+		returns a picklable result
+	@type run: callable
+	@param codec: serializes the results
+	@type codec: _backtrack_result_codec
+	@rtype: list
+	@return: the result of each run, in the order of the parameters, or
+		None for runs that failed in the worker, which the caller should
+		repeat in its own process
+	"""
+	sys.stdout.flush()
+	sys.stderr.flush()
+	workers = []
+	for parameter in parameters:
+		read_fd, write_fd = os.pipe()
+		try:
+			pid = os.fork()
+		except OSError:
+			os.close(read_fd)
+			os.close(write_fd)
+			workers.append((None, None))
+			continue
+
+		if pid != 0:
+			os.close(write_fd)
+			portage.process.spawned_pids.append(pid)
+			workers.append((pid, read_fd))
+			continue
+
+		# Worker process.
+		rval = 1
+		try:
+			os.close(read_fd)
+			for other_pid, other_fd in workers:
+				if other_fd is not None:
+					os.close(other_fd)
+			signal.signal(signal.SIGINT, signal.SIG_DFL)
+			signal.signal(signal.SIGTERM, signal.SIG_DFL)
+			null_fd = os.open("/dev/null", os.O_RDWR)
+			for fd in (0, 1, 2):
+				os.dup2(null_fd, fd)
+			try:
+				data = codec.dumps(run(parameter))
+			except SystemExit:
+				raise
+			except:
+				traceback.print_exc()
+			else:
+				_write_all(write_fd, data)
+				rval = os.EX_OK
+		finally:
+			# Call os._exit() from finally block, in order to suppress any
+			# finally blocks from earlier in the call stack. See bug #345289.
+			os._exit(rval)
+
+	results = []
+	for pid, read_fd in workers:
+		if pid is None:
+			results.append(None)
+			continue
+		try:
+			data = _read_all(read_fd)
+		finally:
+			os.close(read_fd)
+		retval = os.waitpid(pid, 0)[1]
+		try:
+			portage.process.spawned_pids.remove(pid)
+		except ValueError:
+			pass
+		result = None
+		if retval == os.EX_OK and data:
+			try:
+				result = codec.loads(data)
+			except (SystemExit, KeyboardInterrupt):
+				raise
+			except Exception:
+				result = None
+		results.append(result)
+	return results
@@ -0,0 +1,136 @@
+# Copyright 2011 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import io
+import json
+import time
+
+import portage
+from portage import _encodings, _unicode_encode
+from portage.util.lrucache import cache_stats
+
+class ResolverProfile(object):
+	"""
+	Collects the wall time and the number of calls of the main phases of
+	dependency calculation, and the hit ratios of the depgraph caches.
+	Emerge enables this when PORTAGE_RESOLVER_PROFILE is set to the path
+	of a file, and writes the results to that file as JSON when it exits.
+	The statistics of all depgraph instances (including backtracking runs
+	in the main process) are added up.
+	"""
+
+	# The depgraph methods that are timed.
+	phases = ("select_files", "_create_graph", "_add_pkg_deps",
+		"_select_pkg_highest_available_imp", "_complete_graph",
+		"_validate_blockers", "_serialize_tasks")
+
+	def __init__(self):
+		self._start_time = time.time()
+		# Maps each phase to [calls, wall time].
+		self._phases = dict((name, [0, 0.]) for name in self.phases)
+		# The phases that are currently running, so that the time
+		# of nested calls is only counted once.
+		self._running = set()
+		# Maps each cache name to [hits, misses].
+		self._caches = {}
+
+	def instrument(self, mydepgraph):
+		"""
+		Replace the phase methods of the given depgraph instance with
+		wrappers that record their calls.
+		"""
+		for name in self.phases:
+			setattr(mydepgraph, name,
+				self._wrap(name, getattr(mydepgraph, name)))
+
+	def _wrap(self, name, method):
+		stats = self._phases[name]
+		running = self._running
+
+		def wrapper(*args, **kwargs):
+			stats[0] += 1
+			if name in running:
+				return method(*args, **kwargs)
+			running.add(name)
+			start = time.time()
+			try:
+				return method(*args, **kwargs)
+			finally:
+				stats[1] += time.time() - start
+				running.discard(name)
+
+		return wrapper
+
+	def cache_lookup(self, name, hit):
+		"""
+		Record a lookup in the named cache.
+		"""
+		stats = self._caches.get(name)
+		if stats is None:
+			stats = self._caches[name] = [0, 0]
+		if hit:
+			stats[0] += 1
+		else:
+			stats[1] += 1
+
+	def stats(self):
+		"""
+		@rtype: dict
+		@return: the collected statistics, in a form that can be
+			serialized as JSON
+		"""
+		phases = {}
+		for name, (calls, wall_time) in self._phases.items():
+			phases[name] = {"calls": calls, "time": wall_time}
+
+		caches = {}
+		for name, (hits, misses) in self._caches.items():
+			hit_ratio = None
+			if hits + misses:
+				hit_ratio = float(hits) / (hits + misses)
+			caches[name] = {"hits": hits, "misses": misses,
+				"hit_ratio": hit_ratio}
+
+		return {
+			"version": str(portage.VERSION),
+			"time": time.time() - self._start_time,
+			"phases": phases,
+			"caches": caches,
+			"lru_caches": cache_stats(),
+		}
+
+	def write(self, filename):
+		"""
+		Write the statistics to the given file as JSON.
+		"""
+		f = io.open(_unicode_encode(filename,
+			encoding=_encodings['fs'], errors='strict'),
+			mode='w', encoding=_encodings['content'], errors='strict')
+		try:
+			f.write(portage._unicode_decode(
+				json.dumps(self.stats(), indent=1, sort_keys=True)))
+			f.write(portage._unicode_decode("\n"))
+		finally:
+			f.close()
+
+_profile = None
+
+def get_resolver_profile(filename):
+	"""
+	Return the profile of this process, which is created on the first
+	call and written to the given file when the process exits.
+
+	@rtype: ResolverProfile
+	"""
+	global _profile
+	if _profile is None:
+		_profile = ResolverProfile()
+		portage.process.atexit_register(_write_profile, _profile, filename)
+	return _profile
+
+def _write_profile(profile, filename):
+	try:
+		profile.write(filename)
+	except (IOError, OSError) as e:
+		portage.util.writemsg("!!! Unable to write resolver profile " + \
+			"'%s': %s\n" % (filename, e), noiselevel=-1)
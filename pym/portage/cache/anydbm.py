@@ -39,6 +39,7 @@ class database(fs_template.FsBased):
 	autocommits = True
 	cleanse_keys = True
 	serialize_eclasses = False
+	batched_get_many = True
 
 	def __init__(self, *args, **config):
 		super(database,self).__init__(*args, **config)
@@ -92,6 +93,22 @@ class database(fs_template.FsBased):
 		# we override getitem because it's just a cpickling of the data handed in.
 		return pickle.loads(self.__db[_unicode_encode(cpv)])
 
+	def get_many(self, cpvs, keys=None):
+		# unpickle the entries directly, since dbm can't pull several
+		# keys at once anyway.
+		db = self.__db
+		result = {}
+		for cpv in cpvs:
+			try:
+				d = pickle.loads(db[_unicode_encode(cpv)])
+			except KeyError:
+				continue
+			try:
+				result[cpv] = self._convert_entry(cpv, d)
+			except cache_errors.CacheError:
+				pass
+		return result
+
 	def _setitem(self, cpv, values):
 		self.__db[_unicode_encode(cpv)] = pickle.dumps(values,pickle.HIGHEST_PROTOCOL)
 
@@ -0,0 +1,444 @@
+# Copyright 2011 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import errno
+import mmap
+import stat
+import struct
+import sys
+import zlib
+
+from portage import os
+from portage import _encodings, _unicode_decode, _unicode_encode
+from portage.cache import cache_errors, fs_template
+from portage.cache.mappings import MutableMapping
+
+from portage.proxy.lazyimport import lazyimport
+lazyimport(globals(),
+	'portage.exception:PortageException',
+	'portage.locks:lockfile,unlockfile',
+	'portage.util:atomic_ofstream,writemsg',
+)
+del lazyimport
+
+if sys.hexversion >= 0x3000000:
+	basestring = str
+
+# The file starts with a header:
+#   magic, number of keys, number of index slots, number of entries
+# followed by the key names, each one prefixed with its length.
+_header = struct.Struct("!8sIII")
+_magic = b"PKDCACH1"
+_key_length = struct.Struct("!H")
+
+# The index is an open addressing hash table, where each slot holds the
+# crc32 of a cpv and the offset of its record. Offset 0 marks an empty
+# slot, since no record can start there.
+_slot = struct.Struct("!II")
+
+# Each record consists of the cpv, prefixed with its length, and the
+# lengths of the values of all keys, followed by the values themselves.
+# Keys with empty values are treated as missing.
+_cpv_length = struct.Struct("!H")
+
+def _hash(cpv):
+	return zlib.crc32(cpv) & 0xffffffff
+
+class _PackedEntry(MutableMapping):
+	"""
+	The values of a cache entry, which are only decoded when they
+	are accessed.
+	"""
+
+	__slots__ = ("_buf", "_spans", "_values")
+
+	def __init__(self, buf, spans):
+		self._buf = buf
+		# Maps each key to the (start, end) offsets of its value.
+		self._spans = spans
+		self._values = {}
+
+	def __getitem__(self, key):
+		try:
+			return self._values[key]
+		except KeyError:
+			pass
+		start, end = self._spans[key]
+		value = _unicode_decode(self._buf[start:end],
+			encoding=_encodings['repo.content'], errors='replace')
+		self._values[key] = value
+		return value
+
+	def __setitem__(self, key, value):
+		self._values[key] = value
+
+	def __delitem__(self, key):
+		found = self._spans.pop(key, None) is not None
+		if self._values.pop(key, None) is not None:
+			found = True
+		if not found:
+			raise KeyError(key)
+
+	def __contains__(self, key):
+		return key in self._values or key in self._spans
+
+	def __iter__(self):
+		for key in self._spans:
+			yield key
+		for key in self._values:
+			if key not in self._spans:
+				yield key
+
+	def __len__(self):
+		return len(self._spans) + \
+			len([key for key in self._values if key not in self._spans])
+
+	if sys.hexversion >= 0x3000000:
+		keys = __iter__
+
+class database(fs_template.FsBased):
+	"""
+	Stores all entries of a repository in a single file, which is
+	memory-mapped by readers. A hash index in the file maps each cpv to
+	the offset of its record, so a lookup doesn't have to open a file per
+	cpv like flat_hash does, and the values of an entry are only decoded
+	when they are accessed.
+
+	Writes are kept in memory until the next commit, which rebuilds the
+	file from the current one and the pending writes, and renames it into
+	place. A lock file serializes concurrent writers, while readers keep
+	using the file that they have mapped.
+	"""
+
+	autocommits = False
+
+	# Each commit rewrites the whole file, so writes are
+	# committed in batches of at least this size, unless
+	# sync() or commit() is called.
+	_min_sync_rate = 1000
+
+	def __init__(self, *args, **config):
+		super(database, self).__init__(*args, **config)
+		label = self.label.lstrip(os.path.sep).rstrip(os.path.sep)
+		self._db_path = os.path.join(self.location, label) + ".packed"
+		write_keys = set(self._known_keys)
+		write_keys.add("_eclasses_")
+		write_keys.add("_mtime_")
+		self._write_keys = tuple(sorted(write_keys))
+		self.sync_rate = self._min_sync_rate
+		# Maps each cpv to the encoded values of self._write_keys.
+		self._pending = {}
+		self._pending_deletes = set()
+		self._buf = None
+		self._buf_stat = None
+		self._keys = None
+		self._lengths = None
+		self._index_offset = None
+		self._slot_mask = None
+		if not self.readonly:
+			try:
+				self._ensure_dirs()
+				self._ensure_dirs(label)
+			except (OSError, IOError) as e:
+				raise cache_errors.InitializationError(self.__class__, e)
+		self._open()
+
+	def _open(self):
+		"""
+		Map the current version of the file, or nothing if it doesn't
+		exist or if it's invalid.
+		"""
+		self._buf = None
+		self._buf_stat = None
+		try:
+			f = open(_unicode_encode(self._db_path,
+				encoding=_encodings['fs'], errors='strict'), 'rb')
+		except IOError as e:
+			if e.errno not in (errno.ENOENT, errno.ESTALE):
+				raise cache_errors.CacheCorruption(self._db_path, e)
+			return
+		try:
+			st = os.fstat(f.fileno())
+			if st.st_size < _header.size:
+				return
+			buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		finally:
+			f.close()
+
+		try:
+			magic, key_count, slot_count, entry_count = \
+				_header.unpack_from(buf, 0)
+			if magic != _magic or not slot_count or \
+				slot_count & (slot_count - 1):
+				raise ValueError("invalid header")
+			offset = _header.size
+			keys = []
+			for i in range(key_count):
+				length, = _key_length.unpack_from(buf, offset)
+				offset += _key_length.size
+				keys.append(_unicode_decode(buf[offset:offset+length],
+					encoding=_encodings['repo.content'], errors='strict'))
+				offset += length
+			if offset + slot_count * _slot.size > len(buf):
+				raise ValueError("truncated index")
+		except (struct.error, ValueError, UnicodeDecodeError) as e:
+			writemsg("!!! Invalid metadata cache '%s': %s\n" % \
+				(self._db_path, e), noiselevel=-1)
+			return
+
+		self._buf = buf
+		self._buf_stat = (st.st_ino, st.st_size, st[stat.ST_MTIME])
+		self._keys = tuple(keys)
+		self._lengths = struct.Struct("!%dI" % len(keys))
+		self._index_offset = offset
+		self._slot_mask = slot_count - 1
+
+	def _reopen_if_replaced(self):
+		"""
+		Map the file again if another process has replaced it since
+		it was mapped. Returns True if it was mapped again.
+		"""
+		try:
+			st = os.stat(self._db_path)
+		except OSError:
+			st = None
+		if st is None:
+			buf_stat = None
+		else:
+			buf_stat = (st.st_ino, st.st_size, st[stat.ST_MTIME])
+		if buf_stat == self._buf_stat:
+			return False
+		self._open()
+		return True
+
+	def _find(self, cpv):
+		"""
+		Return the offset of the record for the given cpv, or None if
+		there is none.
+		"""
+		buf = self._buf
+		if buf is None:
+			return None
+		cpv = _unicode_encode(cpv,
+			encoding=_encodings['repo.content'], errors='strict')
+		h = _hash(cpv)
+		index_offset = self._index_offset
+		slot_mask = self._slot_mask
+		i = h & slot_mask
+		# Writers leave at least half of the slots empty, but
+		# don't loop forever if the index is corrupt.
+		probes = slot_mask + 1
+		try:
+			while probes:
+				slot_hash, offset = _slot.unpack_from(buf,
+					index_offset + i * _slot.size)
+				if offset == 0:
+					break
+				if slot_hash == h:
+					length, = _cpv_length.unpack_from(buf, offset)
+					start = offset + _cpv_length.size
+					if buf[start:start+length] == cpv:
+						return offset
+				i = (i + 1) & slot_mask
+				probes -= 1
+		except struct.error:
+			pass
+		return None
+
+	def _record(self, offset):
+		"""
+		Return the cpv of the record at the given offset, the offset of
+		its first value, the lengths of its values and its end offset.
+		"""
+		buf = self._buf
+		length, = _cpv_length.unpack_from(buf, offset)
+		start = offset + _cpv_length.size
+		cpv = buf[start:start+length]
+		start += length
+		lengths = self._lengths.unpack_from(buf, start)
+		start += self._lengths.size
+		end = start + sum(lengths)
+		if end > len(buf):
+			raise ValueError("truncated record")
+		return cpv, start, lengths, end
+
+	def _getitem(self, cpv):
+		if cpv in self._pending_deletes:
+			raise KeyError(cpv)
+		values = self._pending.get(cpv)
+		if values is not None:
+			d = {}
+			for k, v in zip(self._write_keys, values):
+				if v:
+					d[k] = _unicode_decode(v,
+						encoding=_encodings['repo.content'], errors='replace')
+			return d
+
+		offset = self._find(cpv)
+		if offset is None and self._reopen_if_replaced():
+			offset = self._find(cpv)
+		if offset is None:
+			raise KeyError(cpv)
+
+		try:
+			record_cpv, start, lengths, end = self._record(offset)
+		except (struct.error, ValueError) as e:
+			raise cache_errors.CacheCorruption(cpv, e)
+		spans = {}
+		for k, length in zip(self._keys, lengths):
+			if length:
+				spans[k] = (start, start + length)
+			start += length
+		return _PackedEntry(self._buf, spans)
+
+	def _setitem(self, cpv, values):
+		encoded = []
+		for k in self._write_keys:
+			v = values.get(k)
+			if v:
+				if not isinstance(v, basestring):
+					v = str(v)
+				encoded.append(_unicode_encode(v,
+					encoding=_encodings['repo.content'],
+					errors='backslashreplace'))
+			else:
+				encoded.append(b"")
+		self._pending[cpv] = encoded
+		self._pending_deletes.discard(cpv)
+
+	def _delitem(self, cpv):
+		if cpv in self._pending_deletes:
+			raise KeyError(cpv)
+		in_pending = self._pending.pop(cpv, None) is not None
+		if self._find(cpv) is not None:
+			self._pending_deletes.add(cpv)
+		elif not in_pending:
+			raise KeyError(cpv)
+
+	def __contains__(self, cpv):
+		if cpv in self._pending_deletes:
+			return False
+		return cpv in self._pending or self._find(cpv) is not None
+
+	def _iter_records(self):
+		"""
+		Generate (cpv, offset) pairs for all records in the mapped file.
+		"""
+		buf = self._buf
+		if buf is None:
+			return
+		index_offset = self._index_offset
+		for i in range(self._slot_mask + 1):
+			slot_hash, offset = _slot.unpack_from(buf,
+				index_offset + i * _slot.size)
+			if offset == 0:
+				continue
+			length, = _cpv_length.unpack_from(buf, offset)
+			start = offset + _cpv_length.size
+			yield (_unicode_decode(buf[start:start+length],
+				encoding=_encodings['repo.content'], errors='replace'),
+				offset)
+
+	def __iter__(self):
+		for cpv in self._pending:
+			yield cpv
+		for cpv, offset in list(self._iter_records()):
+			if cpv not in self._pending and \
+				cpv not in self._pending_deletes:
+				yield cpv
+
+	def sync(self, rate=0):
+		self.sync_rate = max(rate, self._min_sync_rate)
+		if rate == 0:
+			self.commit()
+
+	def commit(self):
+		if not (self._pending or self._pending_deletes):
+			return
+		lock = None
+		try:
+			lock = lockfile(self._db_path, wantnewlockfile=1)
+			# Another process may have written the file since it was
+			# mapped, so merge the pending writes with its current
+			# version.
+			self._reopen_if_replaced()
+			self._write()
+		except (IOError, OSError, PortageException) as e:
+			raise cache_errors.CacheCorruption(self._db_path, e)
+		finally:
+			if lock is not None:
+				unlockfile(lock)
+		self._pending.clear()
+		self._pending_deletes.clear()
+		self._open()
+
+	def _write(self):
+		records = []
+		keys = self._write_keys
+		lengths = struct.Struct("!%dI" % len(keys))
+
+		for cpv, values in self._pending.items():
+			records.append(self._pack(cpv, lengths, values))
+
+		buf = self._buf
+		if buf is not None:
+			same_keys = self._keys == keys
+			for cpv, offset in self._iter_records():
+				if cpv in self._pending or cpv in self._pending_deletes:
+					continue
+				try:
+					record_cpv, start, old_lengths, end = \
+						self._record(offset)
+				except (struct.error, ValueError):
+					# Drop the corrupt record.
+					continue
+				if same_keys:
+					records.append((record_cpv, buf[offset:end]))
+					continue
+				# Convert the record to the current keys.
+				old_values = {}
+				for k, length in zip(self._keys, old_lengths):
+					old_values[k] = buf[start:start+length]
+					start += length
+				records.append(self._pack(cpv, lengths,
+					[old_values.get(k, b"") for k in keys]))
+
+		slot_count = 8
+		while slot_count < 2 * len(records):
+			slot_count *= 2
+		slot_mask = slot_count - 1
+
+		header = [_header.pack(_magic, len(keys), slot_count, len(records))]
+		for k in keys:
+			k = _unicode_encode(k,
+				encoding=_encodings['repo.content'], errors='strict')
+			header.append(_key_length.pack(len(k)))
+			header.append(k)
+		header = b"".join(header)
+
+		index = bytearray(slot_count * _slot.size)
+		offset = len(header) + len(index)
+		for cpv, record in records:
+			i = _hash(cpv) & slot_mask
+			while _slot.unpack_from(index, i * _slot.size)[1] != 0:
+				i = (i + 1) & slot_mask
+			_slot.pack_into(index, i * _slot.size, _hash(cpv), offset)
+			offset += len(record)
+
+		f = atomic_ofstream(self._db_path, mode='wb')
+		try:
+			f.write(header)
+			f.write(bytes(index))
+			for cpv, record in records:
+				f.write(record)
+		except:
+			f.abort()
+			raise
+		f.close()
+		self._ensure_access(self._db_path)
+
+	def _pack(self, cpv, lengths, values):
+		cpv = _unicode_encode(cpv,
+			encoding=_encodings['repo.content'], errors='strict')
+		return (cpv, b"".join([_cpv_length.pack(len(cpv)), cpv,
+			lengths.pack(*[len(v) for v in values])] + list(values)))
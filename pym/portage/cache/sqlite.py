@@ -15,12 +15,28 @@ if sys.hexversion >= 0x3000000:
 class database(fs_template.FsBased):
 
 	autocommits = False
+	batched_get_many = True
 	synchronous = False
+	# The default rollback journal. It is set explicitly, so that a
+	# database which was switched to write-ahead logging is switched back,
+	# since users without write access couldn't read it anymore.
+	journal_mode = "delete"
 	# cache_bytes is used together with page_size (set at sqlite build time)
 	# to calculate the number of pages requested, according to the following
 	# equation: cache_bytes = page_bytes * page_count
 	cache_bytes = 1024 * 1024 * 10
 	_db_table = None
+	# Version of the table layout, which is stored in PRAGMA user_version.
+	# Version 2 dropped the internal package id, so that the package key
+	# is the primary key.
+	_db_schema_version = 2
+	# Writes are kept in memory and written in a single transaction by
+	# commit(), once there are at least this many of them, unless sync()
+	# or commit() is called.
+	_min_sync_rate = 1000
+	# Number of cpvs for each query of get_many(), which keeps the
+	# number of parameters below the sqlite limit of 999.
+	_get_many_chunk_size = 500
 
 	def __init__(self, *args, **config):
 		super(database, self).__init__(*args, **config)
@@ -28,8 +44,12 @@ class database(fs_template.FsBased):
 		self._allowed_keys = ["_mtime_", "_eclasses_"]
 		self._allowed_keys.extend(self._known_keys)
 		self._allowed_keys.sort()
-		self.location = os.path.join(self.location, 
+		self.location = os.path.join(self.location,
 			self.label.lstrip(os.path.sep).rstrip(os.path.sep))
+		self.sync_rate = self._min_sync_rate
+		# Maps each cpv to the row that commit() will write.
+		self._pending = {}
+		self._pending_deletes = set()
 
 		if not self.readonly and not os.path.exists(self.location):
 			self._ensure_dirs()
@@ -37,11 +57,15 @@ class database(fs_template.FsBased):
 		config.setdefault("autocommit", self.autocommits)
 		config.setdefault("cache_bytes", self.cache_bytes)
 		config.setdefault("synchronous", self.synchronous)
+		config.setdefault("journal_mode", self.journal_mode)
 		# Timeout for throwing a "database is locked" exception (pysqlite
 		# default is 5.0 seconds).
 		config.setdefault("timeout", 15)
 		self._db_init_connection(config)
-		self._db_init_structures()
+		try:
+			self._db_init_structures()
+		except self._db_error as e:
+			raise cache_errors.InitializationError(self.__class__, e)
 
 	def _import_sqlite(self):
 		# sqlite3 is optional with >=python-2.5
@@ -74,14 +98,24 @@ class database(fs_template.FsBased):
 		try:
 			if not self.readonly:
 				self._ensure_dirs()
-			self._db_connection = self._db_module.connect(
-				database=_unicode_decode(self._dbpath), **connection_kwargs)
+			if self.readonly and sys.hexversion >= 0x3040000:
+				# A read-only connection never takes the write lock,
+				# so any number of them can read in parallel.
+				from urllib.request import pathname2url
+				self._db_connection = self._db_module.connect(
+					"file:%s?mode=ro" % pathname2url(self._dbpath),
+					uri=True, **connection_kwargs)
+			else:
+				self._db_connection = self._db_module.connect(
+					database=_unicode_decode(self._dbpath), **connection_kwargs)
 			self._db_cursor = self._db_connection.cursor()
 			self._db_cursor.execute("PRAGMA encoding = %s" % self._db_escape_string("UTF-8"))
 			if not self.readonly and not self._ensure_access(self._dbpath):
 				raise cache_errors.InitializationError(self.__class__, "can't ensure perms on %s" % self._dbpath)
 			self._db_init_cache_size(config["cache_bytes"])
 			self._db_init_synchronous(config["synchronous"])
+			if not self.readonly:
+				self._db_init_journal_mode(config["journal_mode"])
 		except self._db_error as e:
 			raise cache_errors.InitializationError(self.__class__, e)
 
@@ -90,52 +124,104 @@ class database(fs_template.FsBased):
 		self._db_table["packages"] = {}
 		mytable = "portage_packages"
 		self._db_table["packages"]["table_name"] = mytable
-		self._db_table["packages"]["package_id"] = "internal_db_package_id"
 		self._db_table["packages"]["package_key"] = "portage_package_key"
 		self._db_table["packages"]["internal_columns"] = \
-			[self._db_table["packages"]["package_id"],
-			self._db_table["packages"]["package_key"]]
+			[self._db_table["packages"]["package_key"]]
 		create_statement = []
 		create_statement.append("CREATE TABLE")
 		create_statement.append(mytable)
 		create_statement.append("(")
 		table_parameters = []
-		table_parameters.append("%s INTEGER PRIMARY KEY AUTOINCREMENT" % self._db_table["packages"]["package_id"])
-		table_parameters.append("%s TEXT" % self._db_table["packages"]["package_key"])
+		table_parameters.append("%s TEXT PRIMARY KEY NOT NULL" % self._db_table["packages"]["package_key"])
 		for k in self._allowed_keys:
 			table_parameters.append("%s TEXT" % k)
-		table_parameters.append("UNIQUE(%s)" % self._db_table["packages"]["package_key"])
 		create_statement.append(",".join(table_parameters))
 		create_statement.append(")")
-		
+
 		self._db_table["packages"]["create"] = " ".join(create_statement)
 		self._db_table["packages"]["columns"] = \
 			self._db_table["packages"]["internal_columns"] + \
 			self._allowed_keys
 
+		# The statements are constant, so that sqlite only has to
+		# prepare each of them once.
+		package_key = self._db_table["packages"]["package_key"]
+		self._db_table["packages"]["select"] = \
+			"SELECT %s FROM %s WHERE %s=?" % \
+			(",".join(self._allowed_keys), mytable, package_key)
+		self._db_table["packages"]["select_many"] = \
+			"SELECT %s FROM %s WHERE %s IN" % \
+			(",".join(self._db_table["packages"]["columns"]),
+			mytable, package_key)
+		self._db_table["packages"]["contains"] = \
+			"SELECT %s FROM %s WHERE %s=?" % \
+			(package_key, mytable, package_key)
+		self._db_table["packages"]["replace"] = \
+			"REPLACE INTO %s (%s) VALUES (%s)" % \
+			(mytable, ",".join(self._db_table["packages"]["columns"]),
+			",".join("?" * len(self._db_table["packages"]["columns"])))
+		self._db_table["packages"]["delete"] = \
+			"DELETE FROM %s WHERE %s=?" % (mytable, package_key)
+
 		cursor = self._db_cursor
 		for k, v in self._db_table.items():
 			if self._db_table_exists(v["table_name"]):
 				create_statement = self._db_table_get_create(v["table_name"])
 				if create_statement != v["create"]:
-					writemsg(_("sqlite: dropping old table: %s\n") % v["table_name"])
-					cursor.execute("DROP TABLE %s" % v["table_name"])
-					cursor.execute(v["create"])
+					if self.readonly:
+						raise cache_errors.InitializationError(
+							self.__class__, "table %s has an old layout" % \
+							v["table_name"])
+					self._db_migrate_table(v)
+			elif self.readonly:
+				raise cache_errors.InitializationError(self.__class__,
+					"table %s does not exist" % v["table_name"])
 			else:
 				cursor.execute(v["create"])
 
+		if not self.readonly:
+			cursor.execute("PRAGMA user_version = %d" % \
+				self._db_schema_version)
+			self._db_connection.commit()
+
+	def _db_migrate_table(self, table):
+		"""copy the rows of a table with an older layout, such as the one
+		with an internal package id from before schema version 2, into a
+		table with the current layout.  they are dropped instead if the
+		old table lacks some of the current columns, since the entries
+		would be incomplete."""
+		cursor = self._db_cursor
+		table_name = table["table_name"]
+		old_table = table_name + "_old"
+		cursor.execute("PRAGMA table_info(%s)" % table_name)
+		old_columns = set(row[1] for row in cursor.fetchall())
+		cursor.execute("DROP TABLE IF EXISTS %s" % old_table)
+		cursor.execute("ALTER TABLE %s RENAME TO %s" % (table_name, old_table))
+		cursor.execute(table["create"])
+		if old_columns.issuperset(table["columns"]):
+			writemsg(_("sqlite: migrating old table: %s\n") % table_name,
+				noiselevel=1)
+			columns = ",".join(table["columns"])
+			cursor.execute("INSERT OR REPLACE INTO %s (%s) SELECT %s FROM %s WHERE %s IS NOT NULL" % \
+				(table_name, columns, columns, old_table,
+				table["package_key"]))
+		else:
+			writemsg(_("sqlite: dropping old table: %s\n") % table_name,
+				noiselevel=1)
+		cursor.execute("DROP TABLE %s" % old_table)
+
 	def _db_table_exists(self, table_name):
 		"""return true/false dependant on a tbl existing"""
 		cursor = self._db_cursor
-		cursor.execute("SELECT name FROM sqlite_master WHERE type=\"table\" AND name=%s" % \
-			self._db_escape_string(table_name))
+		cursor.execute("SELECT name FROM sqlite_master WHERE type=\"table\" AND name=?",
+			(table_name,))
 		return len(cursor.fetchall()) == 1
 
 	def _db_table_get_create(self, table_name):
 		"""return true/false dependant on a tbl existing"""
 		cursor = self._db_cursor
-		cursor.execute("SELECT sql FROM sqlite_master WHERE name=%s" % \
-			self._db_escape_string(table_name))
+		cursor.execute("SELECT sql FROM sqlite_master WHERE name=?",
+			(table_name,))
 		return cursor.fetchall()[0][0]
 
 	def _db_init_cache_size(self, cache_bytes):
@@ -160,70 +246,116 @@ class database(fs_template.FsBased):
 		if actual_synchronous!=synchronous:
 			raise cache_errors.InitializationError(self.__class__,"actual synchronous = "+actual_synchronous+" does does not match requested value of "+synchronous)
 
-	def _getitem(self, cpv):
+	def _db_init_journal_mode(self, journal_mode):
 		cursor = self._db_cursor
-		cursor.execute("select * from %s where %s=%s" % \
-			(self._db_table["packages"]["table_name"],
-			self._db_table["packages"]["package_key"],
-			self._db_escape_string(cpv)))
-		result = cursor.fetchall()
-		if len(result) == 1:
+		# sqlite returns the resulting mode, which stays the old one if
+		# the requested mode is not supported. Leaving write-ahead logging
+		# fails while other connections have the database open, and then
+		# it is left to the next connection.
+		try:
+			cursor.execute("PRAGMA journal_mode = %s" % journal_mode)
+			cursor.fetchall()
+		except self._db_module.OperationalError:
 			pass
-		elif len(result) == 0:
+		del cursor
+
+	def _getitem(self, cpv):
+		row = self._pending.get(cpv)
+		if row is not None:
+			row = row[1:]
+		elif cpv in self._pending_deletes:
 			raise KeyError(cpv)
 		else:
-			raise cache_errors.CacheCorruption(cpv, "key is not unique")
-		d = {}
-		internal_columns = self._db_table["packages"]["internal_columns"]
-		column_index = -1
-		for k in self._db_table["packages"]["columns"]:
-			column_index +=1
-			if k not in internal_columns:
-				d[k] = result[0][column_index]
+			cursor = self._db_cursor
+			cursor.execute(self._db_table["packages"]["select"], (cpv,))
+			result = cursor.fetchall()
+			if len(result) == 1:
+				pass
+			elif len(result) == 0:
+				raise KeyError(cpv)
+			else:
+				raise cache_errors.CacheCorruption(cpv, "key is not unique")
+			row = result[0]
 
-		return d
+		return dict(zip(self._allowed_keys, row))
+
+	def get_many(self, cpvs, keys=None):
+		"""pull the entries with a single IN query per chunk of cpvs, instead
+		of one query per cpv"""
+		result = {}
+		fetch = []
+		for cpv in cpvs:
+			row = self._pending.get(cpv)
+			if row is not None:
+				try:
+					result[cpv] = self._convert_entry(cpv,
+						dict(zip(self._allowed_keys, row[1:])))
+				except cache_errors.CacheError:
+					pass
+			elif cpv not in self._pending_deletes:
+				fetch.append(cpv)
+
+		select = self._db_table["packages"]["select_many"]
+		cursor = self._db_cursor
+		for i in range(0, len(fetch), self._get_many_chunk_size):
+			chunk = fetch[i:i+self._get_many_chunk_size]
+			cursor.execute("%s (%s)" % (select, ",".join("?" * len(chunk))),
+				chunk)
+			for row in cursor.fetchall():
+				cpv = row[0]
+				try:
+					result[cpv] = self._convert_entry(cpv,
+						dict(zip(self._allowed_keys, row[1:])))
+				except cache_errors.CacheError:
+					pass
+		return result
 
 	def _setitem(self, cpv, values):
-		update_statement = []
-		update_statement.append("REPLACE INTO %s" % self._db_table["packages"]["table_name"])
-		update_statement.append("(")
-		update_statement.append(','.join([self._db_table["packages"]["package_key"]] + self._allowed_keys))
-		update_statement.append(")")
-		update_statement.append("VALUES")
-		update_statement.append("(")
-		values_parameters = []
-		values_parameters.append(self._db_escape_string(cpv))
+		row = [cpv]
 		for k in self._allowed_keys:
-			values_parameters.append(self._db_escape_string(values.get(k, '')))
-		update_statement.append(",".join(values_parameters))
-		update_statement.append(")")
+			v = values.get(k, '')
+			if not isinstance(v, basestring):
+				v = str(v)
+			row.append(v)
+		self._pending_deletes.discard(cpv)
+		self._pending[cpv] = tuple(row)
+
+	def commit(self):
+		if not (self._pending or self._pending_deletes):
+			return
 		cursor = self._db_cursor
 		try:
-			s = " ".join(update_statement)
-			cursor.execute(s)
+			if self._pending_deletes:
+				cursor.executemany(self._db_table["packages"]["delete"],
+					[(cpv,) for cpv in self._pending_deletes])
+			if self._pending:
+				cursor.executemany(self._db_table["packages"]["replace"],
+					list(self._pending.values()))
+			self._db_connection.commit()
 		except self._db_error as e:
-			writemsg("%s: %s\n" % (cpv, str(e)))
+			# Keep the writes, so that the next commit can retry them.
+			self._db_connection.rollback()
+			writemsg("sqlite: %s: %s\n" % (self._dbpath, str(e)))
 			raise
+		self._pending.clear()
+		self._pending_deletes.clear()
 
-	def commit(self):
-		self._db_connection.commit()
+	def sync(self, rate=0):
+		self.sync_rate = max(rate, self._min_sync_rate)
+		if rate == 0:
+			self.commit()
 
 	def _delitem(self, cpv):
-		cursor = self._db_cursor
-		cursor.execute("DELETE FROM %s WHERE %s=%s" % \
-			(self._db_table["packages"]["table_name"],
-			self._db_table["packages"]["package_key"],
-			self._db_escape_string(cpv)))
+		self._pending.pop(cpv, None)
+		self._pending_deletes.add(cpv)
 
 	def __contains__(self, cpv):
+		if cpv in self._pending:
+			return True
+		if cpv in self._pending_deletes:
+			return False
 		cursor = self._db_cursor
-		cursor.execute(" ".join(
-			["SELECT %s FROM %s" %
-			(self._db_table["packages"]["package_id"],
-			self._db_table["packages"]["table_name"]),
-			"WHERE %s=%s" % (
-			self._db_table["packages"]["package_key"],
-			self._db_escape_string(cpv))]))
+		cursor.execute(self._db_table["packages"]["contains"], (cpv,))
 		result = cursor.fetchall()
 		if len(result) == 0:
 			return False
@@ -241,5 +373,21 @@ class database(fs_template.FsBased):
 		result = cursor.fetchall()
 		key_list = [x[0] for x in result]
 		del result
+		pending = set(self._pending)
+		pending.update(self._pending_deletes)
+		key_list = [x for x in key_list if x not in pending]
+		key_list.extend(self._pending)
 		while key_list:
 			yield key_list.pop()
+
+class wal_database(database):
+	"""
+	Like database, but with write-ahead logging, which lets readers in
+	other processes go on while entries are written. sqlite needs write
+	access to the database and its directory in order to read it then,
+	so this is only suitable if all users of the cache have that. If
+	sqlite doesn't support it (it needs >=3.7.0 and shared memory), the
+	rollback journal is kept.
+	"""
+
+	journal_mode = "wal"
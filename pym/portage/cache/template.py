@@ -21,6 +21,8 @@ class database(object):
 	autocommits = False
 	cleanse_keys = False
 	serialize_eclasses = True
+	# get_many() pulls several entries at once, rather than one by one.
+	batched_get_many = False
 
 	def __init__(self, location, label, auxdbkeys, readonly=False):
 		""" initialize the derived class; specifically, store label/keys"""
@@ -38,7 +40,11 @@ class database(object):
 		if self.updates > self.sync_rate:
 			self.commit()
 			self.updates = 0
-		d=self._getitem(cpv)
+		return self._convert_entry(cpv, self._getitem(cpv))
+
+	def _convert_entry(self, cpv, d):
+		"""handles the __eclasses__ and _mtime_ conversion of values returned
+		by _getitem, for __getitem__ and get_many"""
 		if self.serialize_eclasses and "_eclasses_" in d:
 			d["_eclasses_"] = reconstruct_eclasses(cpv, d["_eclasses_"])
 		elif "_eclasses_" not in d:
@@ -159,6 +165,22 @@ class database(object):
 		except KeyError:
 			return x
 
+	def get_many(self, cpvs, keys=None):
+		"""returns a dict mapping each of the given cpvs to its values, like
+		__getitem__ does.  cpvs that are missing or corrupt are left out, so
+		that callers can fall back to __getitem__ for them.  if keys is given,
+		only those keys (plus _mtime_ and _eclasses_) are needed, though the
+		values may contain others.  Derived classes should override this if
+		they can pull several entries in one go, using _convert_entry on each
+		of them, and set batched_get_many."""
+		d = {}
+		for cpv in cpvs:
+			try:
+				d[cpv] = self[cpv]
+			except (KeyError, cache_errors.CacheError):
+				pass
+		return d
+
 	def get_matches(self, match_dict):
 		"""generic function for walking the entire cache db, matching restrictions to
 		filter what cpv's are returned.  Derived classes should override this if they
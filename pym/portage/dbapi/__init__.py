@@ -8,10 +8,10 @@ import re
 import portage
 portage.proxy.lazyimport.lazyimport(globals(),
 	'portage.dbapi.dep_expand:dep_expand@_dep_expand',
-	'portage.dep:match_from_list',
+	'portage.dep:match_from_list,_candidate_index',
 	'portage.output:colorize',
-	'portage.util:cmp_sort_key,writemsg',
-	'portage.versions:catsplit,catpkgsplit,vercmp',
+	'portage.util:writemsg',
+	'portage.versions:catsplit,catpkgsplit,_vercmp_key',
 )
 
 from portage import os
@@ -52,15 +52,13 @@ class dbapi(object):
 		order. It sorts in place and returns None.
 		"""
 		if len(cpv_list) > 1:
-			# If the cpv includes explicit -r0, it has to be preserved
-			# for consistency in findname and aux_get calls, so use a
-			# dict to map strings back to their original values.
+			# Parse each version once, and sort on the resulting keys.
+			# The cpv strings themselves are left untouched, so that an
+			# explicit -r0 is preserved for findname and aux_get calls.
 			ver_map = {}
 			for cpv in cpv_list:
-				ver_map[cpv] = '-'.join(catpkgsplit(cpv)[2:])
-			def cmp_cpv(cpv1, cpv2):
-				return vercmp(ver_map[cpv1], ver_map[cpv2])
-			cpv_list.sort(key=cmp_sort_key(cmp_cpv))
+				ver_map[cpv] = _vercmp_key('-'.join(catpkgsplit(cpv)[2:]))
+			cpv_list.sort(key=ver_map.__getitem__)
 
 	def cpv_all(self):
 		"""Return all CPVs in the db
@@ -123,7 +121,20 @@ class dbapi(object):
 		return list(self._iter_match(mydep,
 			self.cp_list(mydep.cp, use_cache=use_cache)))
 
+	def _cp_index(self, cp, use_cache=1):
+		"""
+		Return a portage.dep._candidate_index for self.cp_list(cp)
+		results, which can be passed to _iter_match() in place of the
+		list. Subclasses that are able to cache the index should
+		override this method.
+		"""
+		return _candidate_index(self.cp_list(cp, use_cache=use_cache))
+
 	def _iter_match(self, atom, cpv_iter):
+		"""
+		@param cpv_iter: cpvs to match against, or a _candidate_index
+			as returned from _cp_index()
+		"""
 		cpv_iter = iter(match_from_list(atom, cpv_iter))
 		if atom.slot:
 			cpv_iter = self._iter_match_slot(atom, cpv_iter)
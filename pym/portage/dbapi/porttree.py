@@ -10,7 +10,7 @@ portage.proxy.lazyimport.lazyimport(globals(),
 	'portage.checksum',
 	'portage.data:portage_gid,secpass',
 	'portage.dbapi.dep_expand:dep_expand',
-	'portage.dep:Atom,dep_getkey,match_from_list,use_reduce',
+	'portage.dep:Atom,dep_getkey,match_from_list,use_reduce,_candidate_index',
 	'portage.package.ebuild.doebuild:doebuild',
 	'portage.util:ensure_dirs,shlex_split,writemsg,writemsg_level',
 	'portage.util.listdir:listdir',
@@ -209,6 +209,8 @@ class portdbapi(dbapi):
 			"RESTRICT", "SLOT", "DEFINED_PHASES", "REQUIRED_USE"])
 
 		self._aux_cache = {}
+		# Cache entries from _prefetch_cache() while aux_get_many() runs.
+		self._prefetched_cache = None
 		self._broken_ebuilds = set()
 
 	def _init_cache_dirs(self):
@@ -383,6 +385,95 @@ class portdbapi(dbapi):
 			traceback.print_exc()
 		return metadata
 
+	def _prefetch_cache(self, mycpvs, mytree=None, keys=None):
+		"""
+		Find the ebuilds of the given cpvs and pull their valid cache
+		entries like _pull_valid_cache() does, but with one get_many()
+		call per cache of each repository. A cpv is only looked up in the
+		caches of the repository that findname2() resolves it to, and the
+		writable cache is only queried for the cpvs that don't have a valid
+		pre-generated entry. Repositories whose writable cache doesn't
+		support batched lookups are left to _pull_valid_cache().
+		@rtype: dict
+		@returns: A dict which maps each cpv whose ebuild was found to an
+			(ebuild_path, repo_path, pulled) tuple, where pulled is the
+			return value of _pull_valid_cache(), or None if it still has
+			to be called (which also handles corrupt entries).
+		"""
+		if mytree:
+			trees = [mytree]
+		else:
+			trees = self.porttrees
+		for repo_path in trees:
+			if self.auxdb[repo_path].batched_get_many:
+				break
+		else:
+			return {}
+
+		prefetched = {}
+		repo_cpvs = {}
+		for cpv in mycpvs:
+			ebuild_path, repo_path = self.findname2(cpv, mytree)
+			if ebuild_path is None:
+				continue
+			prefetched[cpv] = (ebuild_path, repo_path, None)
+			repo_cpvs.setdefault(repo_path, []).append(cpv)
+
+		for repo_path, cpvs in repo_cpvs.items():
+			auxdb = self.auxdb[repo_path]
+			if not auxdb.batched_get_many:
+				continue
+			eclass_db = self._repo_info[repo_path].eclass_db
+
+			stats = {}
+			for cpv in cpvs:
+				try:
+					stats[cpv] = _os.stat(_unicode_encode(prefetched[cpv][0],
+						encoding=_encodings['fs'], errors='strict'))
+				except OSError:
+					# Let _pull_valid_cache() report it.
+					pass
+			cpvs = [cpv for cpv in cpvs if cpv in stats]
+
+			for db in (self._pregen_auxdb.get(repo_path), auxdb):
+				if db is None or not cpvs:
+					continue
+				entries = {}
+				if db.batched_get_many:
+					try:
+						entries = db.get_many(cpvs, keys=keys)
+					except CacheError:
+						pass
+				else:
+					# This is the pre-generated cache, which is read-only.
+					for cpv in cpvs:
+						try:
+							entries[cpv] = db[cpv]
+						except (KeyError, CacheError):
+							pass
+
+				remaining = []
+				for cpv in cpvs:
+					metadata = entries.get(cpv)
+					emtime = stats[cpv][stat.ST_MTIME]
+					if metadata is not None and \
+						self._is_cache_valid(metadata, emtime, eclass_db):
+						prefetched[cpv] = (prefetched[cpv][0], repo_path,
+							(metadata, stats[cpv], emtime))
+					else:
+						remaining.append(cpv)
+				cpvs = remaining
+
+		return prefetched
+
+	def _is_cache_valid(self, metadata, emtime, eclass_db):
+		eapi = metadata.get('EAPI', '').strip()
+		if not eapi:
+			eapi = '0'
+		return not (eapi[:1] == '-' and eapi_is_supported(eapi[1:])) and \
+			emtime == metadata['_mtime_'] and \
+			eclass_db.is_eclass_data_valid(metadata['_eclasses_'])
+
 	def _pull_valid_cache(self, cpv, ebuild_path, repo_path):
 		try:
 			# Don't use unicode-wrapped os module, for better performance.
@@ -420,12 +511,7 @@ class portdbapi(dbapi):
 					except CacheError:
 						pass
 			else:
-				eapi = metadata.get('EAPI', '').strip()
-				if not eapi:
-					eapi = '0'
-				if not (eapi[:1] == '-' and eapi_is_supported(eapi[1:])) and \
-					emtime == metadata['_mtime_'] and \
-					eclass_db.is_eclass_data_valid(metadata['_eclasses_']):
+				if self._is_cache_valid(metadata, emtime, eclass_db):
 					doregen = False
 
 			if not doregen:
@@ -461,14 +547,23 @@ class portdbapi(dbapi):
 			# Missing slash. Can't find ebuild so raise KeyError.
 			raise KeyError(mycpv)
 
-		myebuild, mylocation = self.findname2(mycpv, mytree)
+		pulled = None
+		prefetched = None
+		if self._prefetched_cache is not None:
+			prefetched = self._prefetched_cache.get(mycpv)
+		if prefetched is None:
+			myebuild, mylocation = self.findname2(mycpv, mytree)
+		else:
+			myebuild, mylocation, pulled = prefetched
 
 		if not myebuild:
 			writemsg("!!! aux_get(): %s\n" % \
 				_("ebuild not found for '%s'") % mycpv, noiselevel=1)
 			raise KeyError(mycpv)
 
-		mydata, st, emtime = self._pull_valid_cache(mycpv, myebuild, mylocation)
+		if pulled is None:
+			pulled = self._pull_valid_cache(mycpv, myebuild, mylocation)
+		mydata, st, emtime = pulled
 		doregen = mydata is None
 
 		if doregen:
@@ -534,6 +629,56 @@ class portdbapi(dbapi):
 
 		return returnme
 
+	def aux_get_many(self, mycpvs, mylist, mytree=None, myrepo=None):
+		"""
+		Like aux_get(), but for several cpvs, such as all versions of a
+		cp or a whole category. The cache entries of the cpvs that are
+		not in the internal cache are pulled with _prefetch_cache(), and
+		only stale or missing entries are handled one by one.
+		@param mycpvs: the cpvs to return the metadata of
+		@type mycpvs: iterable
+		@param mylist: the metadata keys to return
+		@type mylist: list
+		@rtype: dict
+		@returns: A dict which maps each cpv to a list of values, in order
+			of keys in mylist. cpvs for which aux_get() fails are left out.
+		"""
+		mycpvs = list(mycpvs)
+		if myrepo is not None:
+			mytree = self.treemap.get(myrepo)
+			if mytree is None:
+				raise KeyError(myrepo)
+
+		fetch = mycpvs
+		if not mytree and not self._known_keys.intersection(
+			mylist).difference(self._aux_cache_keys):
+			fetch = [cpv for cpv in mycpvs if cpv not in self._aux_cache]
+
+		keys = set(mylist)
+		keys.update(self._aux_cache_keys)
+		keys.add("EAPI")
+		prefetched = None
+		if len(fetch) > 1:
+			prefetched = self._prefetch_cache(fetch, mytree=mytree, keys=keys)
+
+		result = {}
+		self._prefetched_cache = prefetched
+		try:
+			for cpv in mycpvs:
+				try:
+					result[cpv] = self.aux_get(cpv, mylist, mytree=mytree)
+				except KeyError:
+					continue
+				except PortageException as e:
+					writemsg("!!! Error: aux_get('%s', %s)\n" % (cpv, mylist),
+						noiselevel=-1)
+					writemsg("!!! %s\n" % (e,), noiselevel=-1)
+					del e
+					continue
+		finally:
+			self._prefetched_cache = None
+		return result
+
 	def getFetchMap(self, mypkg, useflags=None, mytree=None):
 		"""
 		Get the SRC_URI metadata as a dict which maps each file name to a
@@ -773,10 +918,25 @@ class portdbapi(dbapi):
 				self.xcache["match-all"][mycp] = cachelist
 		return mylist
 
+	def _cp_index(self, mycp, use_cache=1, mytree=None):
+		"""
+		Return a _candidate_index for cp_list() results. The index is only
+		cached while the tree is frozen, so the plain list is returned
+		otherwise, since building an index for a single match costs
+		more than it saves.
+		"""
+		if not (self.frozen and mytree is None):
+			return self.cp_list(mycp, use_cache=use_cache, mytree=mytree)
+		index = self.xcache["cp-index"].get(mycp)
+		if index is None:
+			index = _candidate_index(self.cp_list(mycp, use_cache=use_cache))
+			self.xcache["cp-index"][mycp] = index
+		return index
+
 	def freeze(self):
-		for x in "bestmatch-visible", "cp-list", "list-visible", "match-all", \
-			"match-all-cpv-only", "match-visible", "minimum-all", \
-			"minimum-visible":
+		for x in "bestmatch-visible", "cp-index", "cp-list", "list-visible", \
+			"match-all", "match-all-cpv-only", "match-visible", \
+			"minimum-all", "minimum-visible":
 			self.xcache[x]={}
 		self.frozen=1
 
@@ -821,14 +981,14 @@ class portdbapi(dbapi):
 				myval = self.cp_list(mykey, mytree=mytree)
 			else:
 				myval = match_from_list(mydep,
-					self.cp_list(mykey, mytree=mytree))
+					self._cp_index(mykey, mytree=mytree))
 
 		elif level == "list-visible":
 			#a list of all visible packages, not called directly (just by xmatch())
 			#myval = self.visible(self.cp_list(mykey))
 
-			myval = self.gvisible(self.visible(
-				self.cp_list(mykey, mytree=mytree)))
+			myval = self.visible_batch(mykey,
+				self.cp_list(mykey, mytree=mytree))
 		elif level == "minimum-all":
 			# Find the minimum matching version. This is optimized to
 			# minimize the number of metadata accesses (improves performance
@@ -837,7 +997,7 @@ class portdbapi(dbapi):
 				cpv_iter = iter(self.cp_list(mykey, mytree=mytree))
 			else:
 				cpv_iter = self._iter_match(mydep,
-					self.cp_list(mykey, mytree=mytree))
+					self._cp_index(mykey, mytree=mytree))
 			try:
 				myval = next(cpv_iter)
 			except StopIteration:
@@ -851,7 +1011,7 @@ class portdbapi(dbapi):
 				mylist = self.cp_list(mykey, mytree=mytree)
 			else:
 				mylist = match_from_list(mydep,
-					self.cp_list(mykey, mytree=mytree))
+					self._cp_index(mykey, mytree=mytree))
 			myval = ""
 			settings = self.settings
 			local_config = settings.local_config
@@ -917,7 +1077,7 @@ class portdbapi(dbapi):
 				myval = self.cp_list(mykey, mytree=mytree)
 			else:
 				myval = list(self._iter_match(mydep,
-					self.cp_list(mykey, mytree=mytree)))
+					self._cp_index(mykey, mytree=mytree)))
 		else:
 			raise AssertionError(
 				"Invalid level argument: '%s'" % level)
@@ -1005,6 +1165,107 @@ class portdbapi(dbapi):
 			newlist.append(mycpv)
 		return newlist
 
+	def visible_batch(self, mycp, mylist):
+		"""
+		Return the entries of mylist that both visible() and gvisible()
+		would keep, in the same order. All entries must have the given
+		cp. The metadata of each entry is fetched only once. Masks are
+		evaluated by matching each package.mask, package.unmask and
+		profile atom against the whole list at once, with the cpv and
+		SLOT of each entry, like visible() does. Results for
+		KEYWORDS, LICENSE and PROPERTIES are shared between entries with
+		the same values, unless package.keywords, package.license or
+		package.properties entries apply to mycp.
+		"""
+		if not mylist:
+			return []
+
+		settings = self.settings
+		aux_keys = list(self._aux_cache_keys)
+		aux_many = self.aux_get_many(mylist, aux_keys)
+		candidates = []
+		mask_candidates = []
+		for mycpv in mylist:
+			values = aux_many.get(mycpv)
+			if values is None:
+				# masked by corruption
+				continue
+			metadata = dict(zip(aux_keys, values))
+			if not metadata["SLOT"]:
+				continue
+			candidates.append((mycpv, metadata))
+			mask_candidates.append((mycpv, {"SLOT": metadata["SLOT"]}))
+
+		if not candidates:
+			return []
+
+		masked = settings._getMaskedCpvs(mycp, mask_candidates)
+
+		local_config = settings.local_config
+		chost = settings.get('CHOST', '')
+		accept_chost = settings._accept_chost
+		# Each of these maps a metadata value to a cached result, or is
+		# None if the result depends on more than that value.
+		missing_keywords = None
+		if not settings._hasPackageKeywords(mycp):
+			missing_keywords = {}
+		missing_licenses = None
+		missing_properties = None
+		if local_config:
+			if not settings._hasPackageLicense(mycp):
+				missing_licenses = {}
+			if not settings._hasPackageProperties(mycp):
+				missing_properties = {}
+
+		newlist = []
+		for mycpv, metadata in candidates:
+			if mycpv in masked:
+				continue
+			eapi = metadata["EAPI"]
+			if not eapi_is_supported(eapi):
+				continue
+			if _eapi_is_deprecated(eapi):
+				continue
+			if self._batch_missing(missing_keywords, metadata["KEYWORDS"],
+				settings._getMissingKeywords, mycpv, metadata):
+				continue
+			if local_config:
+				metadata['CHOST'] = chost
+				if not accept_chost(mycpv, metadata):
+					continue
+				metadata["USE"] = ""
+				if "?" in metadata["LICENSE"] or "?" in metadata["PROPERTIES"]:
+					self.doebuild_settings.setcpv(mycpv, mydb=metadata)
+					metadata['USE'] = self.doebuild_settings['PORTAGE_USE']
+				try:
+					if self._batch_missing(missing_licenses,
+						(metadata["LICENSE"], metadata["USE"]),
+						settings._getMissingLicenses, mycpv, metadata):
+						continue
+					if self._batch_missing(missing_properties,
+						(metadata["PROPERTIES"], metadata["USE"]),
+						settings._getMissingProperties, mycpv, metadata):
+						continue
+				except InvalidDependString:
+					continue
+			newlist.append(mycpv)
+		return newlist
+
+	@staticmethod
+	def _batch_missing(cache, cache_key, get_missing, mycpv, metadata):
+		"""
+		Call get_missing(mycpv, metadata), unless cache already holds a
+		result for cache_key. The result is cached as a bool, since only
+		its truth value is needed.
+		"""
+		if cache is None:
+			return bool(get_missing(mycpv, metadata))
+		missing = cache.get(cache_key)
+		if missing is None:
+			missing = bool(get_missing(mycpv, metadata))
+			cache[cache_key] = missing
+		return missing
+
 def close_portdbapi_caches():
 	for i in portdbapi.portdbapi_instances:
 		i.close_caches()
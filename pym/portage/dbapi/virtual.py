@@ -3,6 +3,8 @@
 
 
 from portage.dbapi import dbapi
+from portage.dbapi.dep_expand import dep_expand
+from portage.dep import _candidate_index
 from portage import cpv_getkey
 
 class fakedbapi(dbapi):
@@ -23,21 +25,32 @@ class fakedbapi(dbapi):
 			from portage import settings
 		self.settings = settings
 		self._match_cache = {}
+		self._cp_index_cache = {}
 
 	def _clear_cache(self):
 		if self._categories is not None:
 			self._categories = None
 		if self._match_cache:
 			self._match_cache = {}
+		if self._cp_index_cache:
+			self._cp_index_cache = {}
 
 	def match(self, origdep, use_cache=1):
 		result = self._match_cache.get(origdep, None)
 		if result is not None:
 			return result[:]
-		result = dbapi.match(self, origdep, use_cache=use_cache)
+		mydep = dep_expand(origdep, mydb=self, settings=self.settings)
+		result = list(self._iter_match(mydep, self._cp_index(mydep.cp)))
 		self._match_cache[origdep] = result
 		return result[:]
 
+	def _cp_index(self, cp, use_cache=1):
+		index = self._cp_index_cache.get(cp)
+		if index is None:
+			index = _candidate_index(self.cp_list(cp))
+			self._cp_index_cache[cp] = index
+		return index
+
 	def cpv_exists(self, mycpv, myrepo=None):
 		return mycpv in self.cpvdict
 
@@ -4,10 +4,11 @@
 
 __all__ = [
 	'Atom', 'best_match_to_list', 'cpvequal',
-	'dep_getcpv', 'dep_getkey', 'dep_getslot',
-	'dep_getusedeps', 'dep_opconvert', 'flatten',
-	'get_operator', 'isjustname', 'isspecific',
-	'isvalidatom', 'match_from_list', 'match_to_list',
+	'dep_getcpv', 'dep_getcpv_list', 'dep_getkey', 'dep_getkey_list',
+	'dep_getslot', 'dep_getslot_list',
+	'dep_getusedeps', 'dep_getusedeps_list', 'dep_opconvert', 'flatten',
+	'get_operator', 'get_operator_list', 'isjustname', 'isspecific',
+	'isvalidatom', 'isvalidatom_list', 'match_from_list', 'match_to_list',
 	'paren_enclose', 'paren_normalize', 'paren_reduce',
 	'remove_slot', 'strip_empty', 'use_reduce', 
 	'_repo_separator', '_slot_separator',
@@ -29,14 +30,17 @@ __all__ = [
 
 import re, sys
 import warnings
+import weakref
+from bisect import bisect_left, bisect_right
 from itertools import chain
 from portage import _unicode_decode
 from portage.eapi import eapi_has_slot_deps, eapi_has_src_uri_arrows, \
 	eapi_has_use_deps, eapi_has_strong_blocks, eapi_has_use_dep_defaults
 from portage.exception import InvalidAtom, InvalidData, InvalidDependString
 from portage.localization import _
+from portage.util.lrucache import LRUCache
 from portage.versions import catpkgsplit, catsplit, \
-	pkgcmp, ververify, _cp, _cpv
+	pkgcmp, ververify, _cp, _cpv, _vercmp_key
 import portage.cache.mappings
 
 if sys.hexversion >= 0x3000000:
@@ -91,6 +95,55 @@ def strip_empty(myarr):
 		('portage.dep.strip_empty',), DeprecationWarning, stacklevel=2)
 	return [x for x in myarr if x]
 
+# Kinds of tokens produced by _tokenize_depstr(). A _compiled_depstr
+# also uses _TOKEN_ATOM for tokens that have been converted to atoms,
+# and _TOKEN_OTHER for everything that isn't a bracket or an atom.
+_TOKEN_OPEN, _TOKEN_CLOSE, _TOKEN_ATOM, _TOKEN_OTHER, _TOKEN_ANY_OF, \
+	_TOKEN_EXACTLY_ONE, _TOKEN_ARROW, _TOKEN_CONDITIONAL = range(8)
+
+_special_tokens = {
+	"("  : _TOKEN_OPEN,
+	")"  : _TOKEN_CLOSE,
+	"||" : _TOKEN_ANY_OF,
+	"^^" : _TOKEN_EXACTLY_ONE,
+	"->" : _TOKEN_ARROW,
+}
+
+_tokenize_cache = LRUCache(8192, name='portage.dep._tokenize_depstr')
+
+def _tokenize_depstr(depstr):
+	"""
+	Split a dependency, SRC_URI or REQUIRED_USE string on whitespace
+	and classify each token, so that the parsers in this module don't
+	have to compare every token against each operator themselves. The
+	result is cached, since the same strings are parsed by several of
+	them.
+
+	@param depstr: the string to split
+	@type depstr: String
+	@rtype: tuple
+	@return: a tuple of (kind, token) tuples
+	"""
+	try:
+		return _tokenize_cache[depstr]
+	except KeyError:
+		pass
+
+	special_kind = _special_tokens.get
+	tokens = []
+	for token in depstr.split():
+		kind = special_kind(token)
+		if kind is None:
+			if token[-1] == "?":
+				kind = _TOKEN_CONDITIONAL
+			else:
+				kind = _TOKEN_OTHER
+		tokens.append((kind, token))
+
+	tokens = tuple(tokens)
+	_tokenize_cache[depstr] = tokens
+	return tokens
+
 def paren_reduce(mystr):
 	"""
 	Take a string and convert all paren enclosed entities into sublists and
@@ -108,17 +161,16 @@ def paren_reduce(mystr):
 	if _internal_warnings:
 		warnings.warn(_("%s is deprecated and will be removed without replacement.") % \
 			('portage.dep.paren_reduce',), DeprecationWarning, stacklevel=2)
-	mysplit = mystr.split()
 	level = 0
 	stack = [[]]
 	need_bracket = False
 
-	for token in mysplit:
-		if token == "(":
+	for kind, token in _tokenize_depstr(mystr):
+		if kind == _TOKEN_OPEN:
 			need_bracket = False
 			stack.append([])
 			level += 1
-		elif token == ")":
+		elif kind == _TOKEN_CLOSE:
 			if need_bracket:
 				raise InvalidDependString(
 					_("malformed syntax: '%s'") % mystr)
@@ -171,7 +223,7 @@ def paren_reduce(mystr):
 			else:
 				raise InvalidDependString(
 					_("malformed syntax: '%s'") % mystr)
-		elif token == "||":
+		elif kind == _TOKEN_ANY_OF:
 			if need_bracket:
 				raise InvalidDependString(
 					_("malformed syntax: '%s'") % mystr)
@@ -182,7 +234,7 @@ def paren_reduce(mystr):
 				raise InvalidDependString(
 					_("malformed syntax: '%s'") % mystr)
 
-			if token[-1] == "?":
+			if kind == _TOKEN_CONDITIONAL:
 				need_bracket = True
 			
 			stack[level].append(token)
@@ -256,91 +308,61 @@ def paren_enclose(mylist, unevaluated_atom=False):
 			mystrparts.append(x)
 	return " ".join(mystrparts)
 
-def use_reduce(depstr, uselist=[], masklist=[], matchall=False, excludeall=[], is_src_uri=False, \
-	eapi=None, opconvert=False, flat=False, is_valid_flag=None, token_class=None, matchnone=False):
-	"""
-	Takes a dep string and reduces the use? conditionals out, leaving an array
-	with subarrays. All redundant brackets are removed.
+_compiled_depstr_cache = LRUCache(8192, name='portage.dep.use_reduce')
 
-	@param deparray: depstring
-	@type deparray: String
-	@param uselist: List of use enabled flags
-	@type uselist: List
-	@param masklist: List of masked flags (always treated as disabled)
-	@type masklist: List
-	@param matchall: Treat all conditionals as active. Used by repoman. 
-	@type matchall: Bool
-	@param excludeall: List of flags for which negated conditionals are always treated as inactive.
-	@type excludeall: List
-	@param is_src_uri: Indicates if depstr represents a SRC_URI
-	@type is_src_uri: Bool
-	@param eapi: Indicates the EAPI the dep string has to comply to
-	@type eapi: String
-	@param opconvert: Put every operator as first element into it's argument list
-	@type opconvert: Bool
-	@param flat: Create a flat list of all tokens
-	@type flat: Bool
-	@param is_valid_flag: Function that decides if a given use flag might be used in use conditionals
-	@type is_valid_flag: Function
-	@param token_class: Convert all non operator tokens into this class
-	@type token_class: Class
-	@param matchnone: Treat all conditionals as inactive. Used by digestgen(). 
-	@type matchnone: Bool
-	@rtype: List
-	@return: The use reduced depend array
+class _compiled_depstr(object):
+	"""
+	A dependency string that has been split into tokens and validated
+	once, so that use_reduce() can evaluate it against different USE
+	settings without doing that work again. Instances are cached by
+	_compile_depstr() and must be treated as immutable.
+
+	tokens: a list of (kind, token) tuples, where token is the string
+		for brackets, operators and conditionals, or the token_class
+		instance for everything else, except for atoms of a cached
+		instance, which are kept as strings
+	conditionals: maps each conditional string to (flag, is_negated)
+	invalid_flags: the conditionals whose flag doesn't match the USE flag
+		regular expression for the EAPI, in the order that they appear
+	conditional_atoms: (atom, position) tuples for atoms that have USE
+		conditionals, which have to be validated against is_valid_flag
+	atoms: for a cached instance, the Atom instances of the atom tokens,
+		or None otherwise. Since callers such as dep_check rely on atom
+		identity, use_reduce() creates new instances for each call, and
+		these are only kept so that the new instances usually find their
+		parsed fields in the Atom pool.
 	"""
-	if isinstance(depstr, list):
-		if _internal_warnings:
-			warnings.warn(_("Passing paren_reduced dep arrays to %s is deprecated. " + \
-				"Pass the original dep string instead.") % \
-				('portage.dep.use_reduce',), DeprecationWarning, stacklevel=2)
-		depstr = paren_enclose(depstr)
-
-	if opconvert and flat:
-		raise ValueError("portage.dep.use_reduce: 'opconvert' and 'flat' are mutually exclusive")
-
-	if matchall and matchnone:
-		raise ValueError("portage.dep.use_reduce: 'matchall' and 'matchnone' are mutually exclusive")
-
-	useflag_re = _get_useflag_re(eapi)
-
-	def is_active(conditional):
-		"""
-		Decides if a given use conditional is active.
-		"""
-		if conditional.startswith("!"):
-			flag = conditional[1:-1]
-			is_negated = True
-		else:
-			flag = conditional[:-1]
-			is_negated = False
-		
-		if is_valid_flag:
-			if not is_valid_flag(flag):
-				msg = _("USE flag '%s' referenced in " + \
-					"conditional '%s' is not in IUSE") \
-					% (flag, conditional)
-				e = InvalidData(msg, category='IUSE.missing')
-				raise InvalidDependString(msg, errors=(e,))
-		else:
-			if useflag_re.match(flag) is None:
-				raise InvalidDependString(
-					_("invalid use flag '%s' in conditional '%s'") % (flag, conditional))
-
-		if is_negated and flag in excludeall:
-			return False
 
-		if flag in masklist:
-			return is_negated
+	__slots__ = ('tokens', 'conditionals', 'invalid_flags',
+		'conditional_atoms', 'atoms')
 
-		if matchall:
-			return True
+	def __init__(self, tokens, conditionals, invalid_flags,
+		conditional_atoms, atoms):
+		self.tokens = tokens
+		self.conditionals = conditionals
+		self.invalid_flags = invalid_flags
+		self.conditional_atoms = conditional_atoms
+		self.atoms = atoms
 
-		if matchnone:
-			return False
+def _compile_depstr(depstr, eapi, is_src_uri, token_class,
+	is_valid_flag=None):
+	"""
+	Split depstr into tokens and check its syntax, raising
+	InvalidDependString if it is invalid. When token_class is None or
+	Atom, the result is cached, and checks that depend on is_valid_flag
+	are left to the caller.
+	@rtype: _compiled_depstr
+	"""
+	cacheable = token_class is None or token_class is Atom
+	if cacheable:
+		cache_key = (depstr, eapi, is_src_uri, token_class)
+		try:
+			return _compiled_depstr_cache[cache_key]
+		except KeyError:
+			pass
+		is_valid_flag = None
 
-		return (flag in uselist and not is_negated) or \
-			(flag not in uselist and is_negated)
+	useflag_re = _get_useflag_re(eapi)
 
 	def missing_white_space_check(token, pos):
 		"""
@@ -351,12 +373,16 @@ def use_reduce(depstr, uselist=[], masklist=[], matchall=False, excludeall=[], i
 				raise InvalidDependString(
 					_("missing whitespace around '%s' at '%s', token %s") % (x, token, pos+1))
 
-	mysplit = depstr.split()
+	mysplit = _tokenize_depstr(depstr)
+	tokens = []
+	conditionals = {}
+	invalid_flags = []
+	conditional_atoms = []
+	atoms = None
+	if cacheable:
+		atoms = []
 	#Count the bracket level.
 	level = 0
-	#We parse into a stack. Every time we hit a '(', a new empty list is appended to the stack.
-	#When we hit a ')', the last list in the stack is merged with list one level up.
-	stack = [[]]
 	#Set need_bracket to True after use conditionals or ||. Other tokens need to ensure
 	#that need_bracket is not True.
 	need_bracket = False
@@ -364,18 +390,18 @@ def use_reduce(depstr, uselist=[], masklist=[], matchall=False, excludeall=[], i
 	#that need_simple_token is not True.
 	need_simple_token = False
 
-	for pos, token in enumerate(mysplit):
-		if token == "(":
+	for pos, (kind, token) in enumerate(mysplit):
+		if kind == _TOKEN_OPEN:
 			if need_simple_token:
 				raise InvalidDependString(
 					_("expected: file name, got: '%s', token %s") % (token, pos+1))
-			if len(mysplit) >= pos+2 and mysplit[pos+1] == ")":
+			if len(mysplit) >= pos+2 and mysplit[pos+1][0] == _TOKEN_CLOSE:
 				raise InvalidDependString(
 					_("expected: dependency string, got: ')', token %s") % (pos+1,))
 			need_bracket = False
-			stack.append([])
 			level += 1
-		elif token == ")":
+			tokens.append((_TOKEN_OPEN, token))
+		elif kind == _TOKEN_CLOSE:
 			if need_bracket:
 				raise InvalidDependString(
 					_("expected: '(', got: '%s', token %s") % (token, pos+1))
@@ -384,124 +410,11 @@ def use_reduce(depstr, uselist=[], masklist=[], matchall=False, excludeall=[], i
 					_("expected: file name, got: '%s', token %s") % (token, pos+1))
 			if level > 0:
 				level -= 1
-				l = stack.pop()
-
-				is_single = len(l) == 1 or \
-					(opconvert and l and l[0] == "||") or \
-					(not opconvert and len(l)==2 and l[0] == "||")
-				ignore = False
-
-				if flat:
-					#In 'flat' mode, we simply merge all lists into a single large one.
-					if stack[level] and stack[level][-1][-1] == "?":
-						#The last token before the '(' that matches the current ')'
-						#was a use conditional. The conditional is removed in any case.
-						#Merge the current list if needed.
-						if is_active(stack[level][-1]):
-							stack[level].pop()
-							stack[level].extend(l)
-						else:
-							stack[level].pop()
-					else:
-						stack[level].extend(l)
-					continue
-
-				if stack[level]:
-					if stack[level][-1] == "||" and not l:
-						#Optimize: || ( ) -> .
-						stack[level].pop()
-					elif stack[level][-1][-1] == "?":
-						#The last token before the '(' that matches the current ')'
-						#was a use conditional, remove it and decide if we
-						#have to keep the current list.
-						if not is_active(stack[level][-1]):
-							ignore = True
-						stack[level].pop()
-
-				def ends_in_any_of_dep(k):
-					return k>=0 and stack[k] and stack[k][-1] == "||"
-
-				def starts_with_any_of_dep(k):
-					#'ends_in_any_of_dep' for opconvert
-					return k>=0 and stack[k] and stack[k][0] == "||"
-
-				def last_any_of_operator_level(k):
-					#Returns the level of the last || operator if it is in effect for
-					#the current level. It is not in effect, if there is a level, that
-					#ends in a non-operator. This is almost equivalent to stack[level][-1]=="||",
-					#expect that it skips empty levels.
-					while k>=0:
-						if stack[k]:
-							if stack[k][-1] == "||":
-								return k
-							elif stack[k][-1][-1] != "?":
-								return -1
-						k -= 1
-					return -1
-
-				def special_append():
-					"""
-					Use extend instead of append if possible. This kills all redundant brackets.
-					"""
-					if is_single:
-						#Either [A], [[...]] or [|| [...]]
-						if l[0] == "||" and ends_in_any_of_dep(level-1):
-							if opconvert:
-								stack[level].extend(l[1:])
-							else:
-								stack[level].extend(l[1])
-						elif len(l) == 1 and isinstance(l[0], list):
-							# l = [[...]]
-							last = last_any_of_operator_level(level-1)
-							if last == -1:
-								if opconvert and isinstance(l[0], list) \
-									and l[0] and l[0][0] == '||':
-									stack[level].append(l[0])
-								else:
-									stack[level].extend(l[0])
-							else:
-								if opconvert and l[0] and l[0][0] == "||":
-									stack[level].extend(l[0][1:])
-								else:
-									stack[level].append(l[0])
-						else:
-							stack[level].extend(l)
-					else:
-						if opconvert and stack[level] and stack[level][-1] == '||':
-							stack[level][-1] = ['||'] + l
-						else:
-							stack[level].append(l)
-
-				if l and not ignore:
-					#The current list is not empty and we don't want to ignore it because
-					#of an inactive use conditional.
-					if not ends_in_any_of_dep(level-1) and not ends_in_any_of_dep(level):
-						#Optimize: ( ( ... ) ) -> ( ... ). Make sure there is no '||' hanging around.
-						stack[level].extend(l)
-					elif not stack[level]:
-						#An '||' in the level above forces us to keep to brackets.
-						special_append()
-					elif is_single and ends_in_any_of_dep(level):
-						#Optimize: || ( A ) -> A,  || ( || ( ... ) ) -> || ( ... )
-						stack[level].pop()
-						special_append()
-					elif ends_in_any_of_dep(level) and ends_in_any_of_dep(level-1):
-						#Optimize: || ( A || ( B C ) ) -> || ( A B C )
-						stack[level].pop()
-						stack[level].extend(l)
-					else:
-						if opconvert and ends_in_any_of_dep(level):
-							#In opconvert mode, we have to move the operator from the level
-							#above into the current list.
-							stack[level].pop()
-							stack[level].append(["||"] + l)
-						else:
-							special_append()
-
 			else:
 				raise InvalidDependString(
 					_("no matching '%s' for '%s', token %s") % ("(", ")", pos+1))
-		elif token == "||":
+			tokens.append((_TOKEN_CLOSE, token))
+		elif kind == _TOKEN_ANY_OF:
 			if is_src_uri:
 				raise InvalidDependString(
 					_("any-of dependencies are not allowed in SRC_URI: token %s") % (pos+1,))
@@ -509,8 +422,8 @@ def use_reduce(depstr, uselist=[], masklist=[], matchall=False, excludeall=[], i
 				raise InvalidDependString(
 					_("expected: '(', got: '%s', token %s") % (token, pos+1))
 			need_bracket = True
-			stack[level].append(token)
-		elif token == "->":
+			tokens.append((_TOKEN_OTHER, token))
+		elif kind == _TOKEN_ARROW:
 			if need_simple_token:
 				raise InvalidDependString(
 					_("expected: file name, got: '%s', token %s") % (token, pos+1))
@@ -521,7 +434,7 @@ def use_reduce(depstr, uselist=[], masklist=[], matchall=False, excludeall=[], i
 				raise InvalidDependString(
 					_("SRC_URI arrow not allowed in EAPI %s: token %s") % (eapi, pos+1))
 			need_simple_token = True
-			stack[level].append(token)	
+			tokens.append((_TOKEN_OTHER, token))
 		else:
 			missing_white_space_check(token, pos)
 
@@ -534,12 +447,25 @@ def use_reduce(depstr, uselist=[], masklist=[], matchall=False, excludeall=[], i
 				raise InvalidDependString(
 					_("expected: file name, got: '%s', token %s") % (token, pos+1))
 
-			if token[-1] == "?":
+			if kind == _TOKEN_CONDITIONAL:
 				need_bracket = True
+				if token not in conditionals:
+					if token.startswith("!"):
+						flag = token[1:-1]
+						is_negated = True
+					else:
+						flag = token[:-1]
+						is_negated = False
+					conditionals[token] = (flag, is_negated)
+					if useflag_re.match(flag) is None:
+						invalid_flags.append(token)
+				tokens.append((_TOKEN_OTHER, token))
 			else:
 				need_simple_token = False
+				kind = _TOKEN_OTHER
 				if token_class and not is_src_uri:
 					#Add a hack for SRC_URI here, to avoid conditional code at the consumer level
+					token_str = token
 					try:
 						token = token_class(token, eapi=eapi,
 							is_valid_flag=is_valid_flag)
@@ -553,11 +479,16 @@ def use_reduce(depstr, uselist=[], masklist=[], matchall=False, excludeall=[], i
 						raise InvalidDependString(
 							_("Invalid token '%s', token %s") % (token, pos+1))
 
-					if not matchall and \
-						hasattr(token, 'evaluate_conditionals'):
-						token = token.evaluate_conditionals(uselist)
+					if hasattr(token, 'evaluate_conditionals'):
+						kind = _TOKEN_ATOM
+						if getattr(token, 'use', None) is not None and \
+							token.use.conditional:
+							conditional_atoms.append((token, pos))
+						if atoms is not None:
+							atoms.append(token)
+							token = token_str
 
-			stack[level].append(token)
+				tokens.append((kind, token))
 
 	if level != 0:
 		raise InvalidDependString(
@@ -571,6 +502,244 @@ def use_reduce(depstr, uselist=[], masklist=[], matchall=False, excludeall=[], i
 		raise InvalidDependString(
 			_("Missing file name at end of string"))
 
+	compiled = _compiled_depstr(tokens, conditionals, invalid_flags,
+		conditional_atoms, atoms)
+	if cacheable:
+		_compiled_depstr_cache[cache_key] = compiled
+	return compiled
+
+def use_reduce(depstr, uselist=[], masklist=[], matchall=False, excludeall=[], is_src_uri=False, \
+	eapi=None, opconvert=False, flat=False, is_valid_flag=None, token_class=None, matchnone=False):
+	"""
+	Takes a dep string and reduces the use? conditionals out, leaving an array
+	with subarrays. All redundant brackets are removed.
+
+	The dep string is only split and validated the first time that it is
+	seen with a given eapi, is_src_uri and token_class. Later calls
+	reuse the cached tokens, and only have to evaluate conditionals.
+	Each call still returns new token_class instances, since callers
+	such as dep_check rely on atom identity.
+
+	@param deparray: depstring
+	@type deparray: String
+	@param uselist: List of use enabled flags
+	@type uselist: List
+	@param masklist: List of masked flags (always treated as disabled)
+	@type masklist: List
+	@param matchall: Treat all conditionals as active. Used by repoman. 
+	@type matchall: Bool
+	@param excludeall: List of flags for which negated conditionals are always treated as inactive.
+	@type excludeall: List
+	@param is_src_uri: Indicates if depstr represents a SRC_URI
+	@type is_src_uri: Bool
+	@param eapi: Indicates the EAPI the dep string has to comply to
+	@type eapi: String
+	@param opconvert: Put every operator as first element into it's argument list
+	@type opconvert: Bool
+	@param flat: Create a flat list of all tokens
+	@type flat: Bool
+	@param is_valid_flag: Function that decides if a given use flag might be used in use conditionals
+	@type is_valid_flag: Function
+	@param token_class: Convert all non operator tokens into this class
+	@type token_class: Class
+	@param matchnone: Treat all conditionals as inactive. Used by digestgen(). 
+	@type matchnone: Bool
+	@rtype: List
+	@return: The use reduced depend array
+	"""
+	if isinstance(depstr, list):
+		if _internal_warnings:
+			warnings.warn(_("Passing paren_reduced dep arrays to %s is deprecated. " + \
+				"Pass the original dep string instead.") % \
+				('portage.dep.use_reduce',), DeprecationWarning, stacklevel=2)
+		depstr = paren_enclose(depstr)
+
+	if opconvert and flat:
+		raise ValueError("portage.dep.use_reduce: 'opconvert' and 'flat' are mutually exclusive")
+
+	if matchall and matchnone:
+		raise ValueError("portage.dep.use_reduce: 'matchall' and 'matchnone' are mutually exclusive")
+
+	compiled = _compile_depstr(depstr, eapi, is_src_uri, token_class,
+		is_valid_flag=is_valid_flag)
+	conditionals = compiled.conditionals
+
+	# Validation that depends on is_valid_flag is not cached.
+	if is_valid_flag:
+		for conditional, (flag, is_negated) in conditionals.items():
+			if not is_valid_flag(flag):
+				msg = _("USE flag '%s' referenced in " + \
+					"conditional '%s' is not in IUSE") \
+					% (flag, conditional)
+				e = InvalidData(msg, category='IUSE.missing')
+				raise InvalidDependString(msg, errors=(e,))
+		if eapi is not None:
+			for atom, pos in compiled.conditional_atoms:
+				try:
+					atom._validate_conditionals(is_valid_flag)
+				except InvalidAtom as e:
+					raise InvalidDependString(
+						_("Invalid atom (%s), token %s") \
+						% (e, pos+1), errors=(e,))
+	elif compiled.invalid_flags:
+		conditional = compiled.invalid_flags[0]
+		raise InvalidDependString(
+			_("invalid use flag '%s' in conditional '%s'") % \
+			(conditionals[conditional][0], conditional))
+
+	def is_active(conditional):
+		"""
+		Decides if a given use conditional is active.
+		"""
+		flag, is_negated = conditionals[conditional]
+
+		if is_negated and flag in excludeall:
+			return False
+
+		if flag in masklist:
+			return is_negated
+
+		if matchall:
+			return True
+
+		if matchnone:
+			return False
+
+		return (flag in uselist and not is_negated) or \
+			(flag not in uselist and is_negated)
+
+	#Count the bracket level.
+	level = 0
+	#We parse into a stack. Every time we hit a '(', a new empty list is appended to the stack.
+	#When we hit a ')', the last list in the stack is merged with list one level up.
+	stack = [[]]
+	l = None
+	is_single = False
+
+	def ends_in_any_of_dep(k):
+		return k>=0 and stack[k] and stack[k][-1] == "||"
+
+	def last_any_of_operator_level(k):
+		#Returns the level of the last || operator if it is in effect for
+		#the current level. It is not in effect, if there is a level, that
+		#ends in a non-operator. This is almost equivalent to stack[level][-1]=="||",
+		#expect that it skips empty levels.
+		while k>=0:
+			if stack[k]:
+				if stack[k][-1] == "||":
+					return k
+				elif stack[k][-1][-1] != "?":
+					return -1
+			k -= 1
+		return -1
+
+	def special_append():
+		"""
+		Use extend instead of append if possible. This kills all redundant brackets.
+		"""
+		if is_single:
+			#Either [A], [[...]] or [|| [...]]
+			if l[0] == "||" and ends_in_any_of_dep(level-1):
+				if opconvert:
+					stack[level].extend(l[1:])
+				else:
+					stack[level].extend(l[1])
+			elif len(l) == 1 and isinstance(l[0], list):
+				# l = [[...]]
+				last = last_any_of_operator_level(level-1)
+				if last == -1:
+					if opconvert and isinstance(l[0], list) \
+						and l[0] and l[0][0] == '||':
+						stack[level].append(l[0])
+					else:
+						stack[level].extend(l[0])
+				else:
+					if opconvert and l[0] and l[0][0] == "||":
+						stack[level].extend(l[0][1:])
+					else:
+						stack[level].append(l[0])
+			else:
+				stack[level].extend(l)
+		else:
+			if opconvert and stack[level] and stack[level][-1] == '||':
+				stack[level][-1] = ['||'] + l
+			else:
+				stack[level].append(l)
+
+	for kind, token in compiled.tokens:
+		if kind == _TOKEN_OPEN:
+			stack.append([])
+			level += 1
+		elif kind == _TOKEN_CLOSE:
+			level -= 1
+			l = stack.pop()
+
+			is_single = len(l) == 1 or \
+				(opconvert and l and l[0] == "||") or \
+				(not opconvert and len(l)==2 and l[0] == "||")
+			ignore = False
+
+			if flat:
+				#In 'flat' mode, we simply merge all lists into a single large one.
+				if stack[level] and stack[level][-1][-1] == "?":
+					#The last token before the '(' that matches the current ')'
+					#was a use conditional. The conditional is removed in any case.
+					#Merge the current list if needed.
+					if is_active(stack[level][-1]):
+						stack[level].pop()
+						stack[level].extend(l)
+					else:
+						stack[level].pop()
+				else:
+					stack[level].extend(l)
+				continue
+
+			if stack[level]:
+				if stack[level][-1] == "||" and not l:
+					#Optimize: || ( ) -> .
+					stack[level].pop()
+				elif stack[level][-1][-1] == "?":
+					#The last token before the '(' that matches the current ')'
+					#was a use conditional, remove it and decide if we
+					#have to keep the current list.
+					if not is_active(stack[level][-1]):
+						ignore = True
+					stack[level].pop()
+
+			if l and not ignore:
+				#The current list is not empty and we don't want to ignore it because
+				#of an inactive use conditional.
+				if not ends_in_any_of_dep(level-1) and not ends_in_any_of_dep(level):
+					#Optimize: ( ( ... ) ) -> ( ... ). Make sure there is no '||' hanging around.
+					stack[level].extend(l)
+				elif not stack[level]:
+					#An '||' in the level above forces us to keep to brackets.
+					special_append()
+				elif is_single and ends_in_any_of_dep(level):
+					#Optimize: || ( A ) -> A,  || ( || ( ... ) ) -> || ( ... )
+					stack[level].pop()
+					special_append()
+				elif ends_in_any_of_dep(level) and ends_in_any_of_dep(level-1):
+					#Optimize: || ( A || ( B C ) ) -> || ( A B C )
+					stack[level].pop()
+					stack[level].extend(l)
+				else:
+					if opconvert and ends_in_any_of_dep(level):
+						#In opconvert mode, we have to move the operator from the level
+						#above into the current list.
+						stack[level].pop()
+						stack[level].append(["||"] + l)
+					else:
+						special_append()
+		elif kind == _TOKEN_ATOM:
+			if compiled.atoms is not None:
+				token = token_class(token, eapi=eapi)
+			if not matchall:
+				token = token.evaluate_conditionals(uselist)
+			stack[level].append(token)
+		else:
+			stack[level].append(token)
+
 	return stack[0]
 
 def dep_opconvert(deplist):
@@ -1031,6 +1200,13 @@ if sys.hexversion < 0x3000000:
 else:
 	_atom_base = str
 
+# Weak-valued pool of live Atom instances, keyed on the constructor
+# arguments that influence parsing. A new Atom that has a matching live
+# instance copies the parsed fields from it, instead of parsing the same
+# atom string again. Each Atom is still a distinct object, since code
+# such as dep_check relies on atom identity.
+_atom_pool = weakref.WeakValueDictionary()
+
 class Atom(_atom_base):
 
 	"""
@@ -1038,6 +1214,10 @@ class Atom(_atom_base):
 	class emulates most of the str methods that are useful with atoms.
 	"""
 
+	__slots__ = ("__weakref__", "blocker", "cp", "cpv", "extended_syntax",
+		"operator", "repo", "slot", "unevaluated_atom", "use",
+		"without_use", "_orig_atom")
+
 	class _blocker(object):
 		__slots__ = ("overlap",)
 
@@ -1068,6 +1248,35 @@ class Atom(_atom_base):
 
 		_atom_base.__init__(s)
 
+		setattr_ = object.__setattr__
+
+		if unevaluated_atom is None and _use is None:
+			pool_key = (s, allow_wildcard, allow_repo, eapi)
+			pooled = _atom_pool.get(pool_key)
+		else:
+			pool_key = None
+			pooled = None
+
+		if pooled is not None:
+			setattr_(self, 'blocker', pooled.blocker)
+			setattr_(self, 'cp', pooled.cp)
+			setattr_(self, 'cpv', pooled.cpv)
+			setattr_(self, 'repo', pooled.repo)
+			setattr_(self, 'slot', pooled.slot)
+			setattr_(self, 'operator', pooled.operator)
+			setattr_(self, 'extended_syntax', pooled.extended_syntax)
+			setattr_(self, 'use', pooled.use)
+			if pooled.without_use is pooled:
+				setattr_(self, 'without_use', self)
+			else:
+				setattr_(self, 'without_use', pooled.without_use)
+			setattr_(self, 'unevaluated_atom', self)
+			# The pooled instance has already been validated against
+			# the same eapi, but is_valid_flag is not part of the key.
+			if eapi is not None and is_valid_flag is not None:
+				self._validate_conditionals(is_valid_flag)
+			return
+
 		if "!" == s[:1]:
 			blocker = self._blocker(forbid_overlap=("!" == s[1:2]))
 			if blocker.overlap.forbid:
@@ -1076,7 +1285,7 @@ class Atom(_atom_base):
 				s = s[1:]
 		else:
 			blocker = False
-		self.__dict__['blocker'] = blocker
+		setattr_(self, 'blocker', blocker)
 		m = _atom_re.match(s)
 		extended_syntax = False
 		if m is None:
@@ -1126,12 +1335,12 @@ class Atom(_atom_base):
 
 		else:
 			raise AssertionError(_("required group not found in atom: '%s'") % self)
-		self.__dict__['cp'] = cp
-		self.__dict__['cpv'] = cpv
-		self.__dict__['repo'] = repo
-		self.__dict__['slot'] = slot
-		self.__dict__['operator'] = op
-		self.__dict__['extended_syntax'] = extended_syntax
+		setattr_(self, 'cp', cp)
+		setattr_(self, 'cpv', cpv)
+		setattr_(self, 'repo', repo)
+		setattr_(self, 'slot', slot)
+		setattr_(self, 'operator', op)
+		setattr_(self, 'extended_syntax', extended_syntax)
 
 		if not (repo is None or allow_repo):
 			raise InvalidAtom(self)
@@ -1153,13 +1362,13 @@ class Atom(_atom_base):
 			else:
 				without_use = self
 
-		self.__dict__['use'] = use
-		self.__dict__['without_use'] = without_use
+		setattr_(self, 'use', use)
+		setattr_(self, 'without_use', without_use)
 
 		if unevaluated_atom:
-			self.__dict__['unevaluated_atom'] = unevaluated_atom
+			setattr_(self, 'unevaluated_atom', unevaluated_atom)
 		else:
-			self.__dict__['unevaluated_atom'] = self
+			setattr_(self, 'unevaluated_atom', self)
 
 		if eapi is not None:
 			if not isinstance(eapi, basestring):
@@ -1179,29 +1388,55 @@ class Atom(_atom_base):
 					raise InvalidAtom(
 						_("Use dep defaults are not allowed in EAPI %s: '%s'") \
 						% (eapi, self), category='EAPI.incompatible')
-				if is_valid_flag is not None and self.use.conditional:
-					invalid_flag = None
-					try:
-						for conditional_type, flags in \
-							self.use.conditional.items():
-							for flag in flags:
-								if not is_valid_flag(flag):
-									invalid_flag = (conditional_type, flag)
-									raise StopIteration()
-					except StopIteration:
-						pass
-					if invalid_flag is not None:
-						conditional_type, flag = invalid_flag
-						conditional_str = _use_dep._conditional_strings[conditional_type]
-						msg = _("USE flag '%s' referenced in " + \
-							"conditional '%s' in atom '%s' is not in IUSE") \
-							% (flag, conditional_str % flag, self)
-						raise InvalidAtom(msg, category='IUSE.missing')
+				if is_valid_flag is not None:
+					self._validate_conditionals(is_valid_flag)
 			if self.blocker and self.blocker.overlap.forbid and not eapi_has_strong_blocks(eapi):
 				raise InvalidAtom(
 					_("Strong blocks are not allowed in EAPI %s: '%s'") \
 						% (eapi, self), category='EAPI.incompatible')
 
+		if pool_key is not None:
+			_atom_pool[pool_key] = self
+
+	def _validate_conditionals(self, is_valid_flag):
+		if not (self.use and self.use.conditional):
+			return
+		invalid_flag = None
+		try:
+			for conditional_type, flags in \
+				self.use.conditional.items():
+				for flag in flags:
+					if not is_valid_flag(flag):
+						invalid_flag = (conditional_type, flag)
+						raise StopIteration()
+		except StopIteration:
+			pass
+		if invalid_flag is not None:
+			conditional_type, flag = invalid_flag
+			conditional_str = _use_dep._conditional_strings[conditional_type]
+			msg = _("USE flag '%s' referenced in " + \
+				"conditional '%s' in atom '%s' is not in IUSE") \
+				% (flag, conditional_str % flag, self)
+			raise InvalidAtom(msg, category='IUSE.missing')
+
+	def __reduce__(self):
+		if self.unevaluated_atom is self:
+			unevaluated_atom = None
+		else:
+			unevaluated_atom = self.unevaluated_atom
+		reduced = (Atom, (_atom_base(self), unevaluated_atom,
+			self.extended_syntax, self.repo is not None))
+		try:
+			orig_atom = self._orig_atom
+		except AttributeError:
+			return reduced
+		return reduced + ({"_orig_atom" : orig_atom},)
+
+	def __setstate__(self, state):
+		# This is only used to restore the _orig_atom attribute
+		# that dep_check sets on virtual atoms.
+		object.__setattr__(self, '_orig_atom', state["_orig_atom"])
+
 	@property
 	def without_repo(self):
 		if self.repo is None:
@@ -1331,21 +1566,77 @@ class ExtendedAtomDict(portage.cache.mappings.MutableMapping):
 	of a normal cp against other normal cp and extended cp.
 	The value type has to be given to __init__ and is assumed to be the same
 	for all values.
+
+	Extended keys of the forms */*, category/* and */package are indexed
+	by the part that they match, so that a lookup only has to visit the
+	keys that match, rather than every extended key. Other extended keys
+	still have to be checked with extended_cp_match().
 	"""
 
-	__slots__ = ('_extended', '_normal', '_value_class')
+	__slots__ = ('_extended', '_extended_order', '_next_order',
+		'_full_wildcards', '_category_wildcards', '_package_wildcards',
+		'_other_wildcards', '_normal', '_value_class')
 
 	def __init__(self, value_class):
 		self._extended = {}
+		# Maps each extended key to a sequence number, so that matches
+		# are merged in the order that they were added.
+		self._extended_order = {}
+		self._next_order = 0
+		self._full_wildcards = set()
+		self._category_wildcards = {}
+		self._package_wildcards = {}
+		self._other_wildcards = set()
 		self._normal = {}
 		self._value_class = value_class
 
 	def copy(self):
 		result = self.__class__(self._value_class)
-		result._extended.update(self._extended)
+		for k in sorted(self._extended,
+			key=self._extended_order.__getitem__):
+			result._add_extended(k, self._extended[k])
 		result._normal.update(self._normal)
 		return result
 
+	def _wildcard_bucket(self, extended_cp):
+		"""
+		Returns the set that extended_cp is indexed in, creating it if
+		necessary.
+		"""
+		category, sep, package = extended_cp.partition("/")
+		if sep and "/" not in package:
+			if category == "*":
+				if package == "*":
+					return self._full_wildcards
+				if "*" not in package:
+					return self._package_wildcards.setdefault(package, set())
+			elif package == "*" and "*" not in category:
+				return self._category_wildcards.setdefault(category, set())
+		return self._other_wildcards
+
+	def _add_extended(self, extended_cp, val):
+		if extended_cp not in self._extended:
+			self._extended_order[extended_cp] = self._next_order
+			self._next_order += 1
+			self._wildcard_bucket(extended_cp).add(extended_cp)
+		self._extended[extended_cp] = val
+
+	def _iter_extended_matches(self, cp):
+		"""
+		Yields the extended keys that match cp, in the order that they
+		were added.
+		"""
+		matches = [k for k in self._other_wildcards \
+			if extended_cp_match(k, cp)]
+		category, sep, package = cp.partition("/")
+		if sep and "/" not in package:
+			matches.extend(self._full_wildcards)
+			matches.extend(self._category_wildcards.get(category, ()))
+			matches.extend(self._package_wildcards.get(package, ()))
+		if len(matches) > 1:
+			matches.sort(key=self._extended_order.__getitem__)
+		return iter(matches)
+
 	def __iter__(self):
 		for k in self._normal:
 			yield k
@@ -1360,7 +1651,17 @@ class ExtendedAtomDict(portage.cache.mappings.MutableMapping):
 
 	def __delitem__(self, cp):
 		if "*" in cp:
-			return self._extended.__delitem__(cp)
+			self._extended.__delitem__(cp)
+			del self._extended_order[cp]
+			bucket = self._wildcard_bucket(cp)
+			bucket.discard(cp)
+			if not bucket:
+				# Drop empty sets from the category and package indexes.
+				category, sep, package = cp.partition("/")
+				if self._category_wildcards.get(category) is bucket:
+					del self._category_wildcards[category]
+				elif self._package_wildcards.get(package) is bucket:
+					del self._package_wildcards[package]
 		else:
 			return self._normal.__delitem__(cp)
 
@@ -1373,7 +1674,9 @@ class ExtendedAtomDict(portage.cache.mappings.MutableMapping):
 
 	def setdefault(self, cp, default=None):
 		if "*" in cp:
-			return self._extended.setdefault(cp, default)
+			if cp not in self._extended:
+				self._add_extended(cp, default)
+			return self._extended[cp]
 		else:
 			return self._normal.setdefault(cp, default)
 
@@ -1398,15 +1701,14 @@ class ExtendedAtomDict(portage.cache.mappings.MutableMapping):
 			else:
 				raise NotImplementedError()
 
-		for extended_cp in self._extended:
-			if extended_cp_match(extended_cp, cp):
-				match = True
-				if hasattr(ret, "update"):
-					ret.update(self._extended[extended_cp])
-				elif hasattr(ret, "extend"):
-					ret.extend(self._extended[extended_cp])
-				else:
-					raise NotImplementedError()
+		for extended_cp in self._iter_extended_matches(cp):
+			match = True
+			if hasattr(ret, "update"):
+				ret.update(self._extended[extended_cp])
+			elif hasattr(ret, "extend"):
+				ret.extend(self._extended[extended_cp])
+			else:
+				raise NotImplementedError()
 
 		if not match:
 			raise KeyError(cp)
@@ -1415,7 +1717,7 @@ class ExtendedAtomDict(portage.cache.mappings.MutableMapping):
 
 	def __setitem__(self, cp, val):
 		if "*" in cp:
-			self._extended[cp] = val
+			self._add_extended(cp, val)
 		else:
 			self._normal[cp] = val
 
@@ -1426,8 +1728,64 @@ class ExtendedAtomDict(portage.cache.mappings.MutableMapping):
 
 	def clear(self):
 		self._extended.clear()
+		self._extended_order.clear()
+		self._full_wildcards.clear()
+		self._category_wildcards.clear()
+		self._package_wildcards.clear()
+		self._other_wildcards.clear()
 		self._normal.clear()
 
+_parsed_atom_cache = LRUCache(16384, name='portage.dep._parse_atom')
+
+def _parse_atom(mydep, allow_wildcard=False, allow_repo=False):
+	"""
+	Return an Atom for mydep, which may be a string or an Atom. The
+	legacy helpers below are often called in loops with the same
+	strings, so the result of parsing each string is memoized, and
+	so is the InvalidAtom exception for an invalid string. The Atom
+	that is returned may be shared, so it must not be handed out to
+	callers that might rely on its identity.
+
+	@raise InvalidAtom: if mydep is not a valid atom
+	"""
+	if isinstance(mydep, Atom):
+		return mydep
+	if not isinstance(mydep, basestring):
+		return Atom(mydep, allow_wildcard=allow_wildcard,
+			allow_repo=allow_repo)
+
+	cache_key = (mydep, allow_wildcard, allow_repo)
+	try:
+		atom = _parsed_atom_cache[cache_key]
+	except KeyError:
+		try:
+			atom = Atom(mydep, allow_wildcard=allow_wildcard,
+				allow_repo=allow_repo)
+		except InvalidAtom as e:
+			atom = e
+		_parsed_atom_cache[cache_key] = atom
+
+	if isinstance(atom, InvalidAtom):
+		raise InvalidAtom(atom.value, category=atom.category)
+	return atom
+
+# The first characters of atoms that have an operator or are blockers.
+_atom_prefix_chars = frozenset("<>=~!")
+
+def _parse_extended_atom(mydep):
+	"""
+	Return an Atom for mydep, parsed with wildcards and repositories
+	allowed, or None if mydep is not a valid atom. Only strings that
+	start with an operator or a blocker are parsed, since other strings,
+	such as "cpv:slot::repo", are often not valid atoms, and the string
+	scanning of the callers is cheaper than a failing parse for them.
+	"""
+	if mydep[:1] not in _atom_prefix_chars:
+		return None
+	try:
+		return _parse_atom(mydep, allow_wildcard=True, allow_repo=True)
+	except InvalidAtom:
+		return None
 
 def get_operator(mydep):
 	"""
@@ -1444,10 +1802,7 @@ def get_operator(mydep):
 	@return: The operator. One of:
 		'~', '=', '>', '<', '=*', '>=', or '<='
 	"""
-	if not isinstance(mydep, Atom):
-		mydep = Atom(mydep)
-
-	return mydep.operator
+	return _parse_atom(mydep).operator
 
 def dep_getcpv(mydep):
 	"""
@@ -1462,10 +1817,7 @@ def dep_getcpv(mydep):
 	@rtype: String
 	@return: The depstring with the operator removed
 	"""
-	if not isinstance(mydep, Atom):
-		mydep = Atom(mydep)
-
-	return mydep.cpv
+	return _parse_atom(mydep).cpv
 
 def dep_getslot(mydep):
 	"""
@@ -1484,6 +1836,10 @@ def dep_getslot(mydep):
 	if slot is not False:
 		return slot
 
+	atom = _parse_extended_atom(mydep)
+	if atom is not None:
+		return atom.slot
+
 	#remove repo_name if present
 	mydep = mydep.split(_repo_separator)[0]
 	
@@ -1519,6 +1875,10 @@ def dep_getrepo(mydep):
 		if repo is not False:
 			return repo
 
+	atom = _parse_extended_atom(mydep)
+	if atom is not None:
+		return atom.repo
+
 	colon = mydep.find(_repo_separator)
 	if colon != -1:
 		bracket = mydep.find("[", colon)
@@ -1557,6 +1917,12 @@ def dep_getusedeps( depend ):
 	@rtype: List
 	@return: List of use flags ( or [] if no flags exist )
 	"""
+	atom = _parse_extended_atom(depend)
+	if atom is not None:
+		if atom.use is None:
+			return ()
+		return atom.use.tokens
+
 	use_list = []
 	open_bracket = depend.find('[')
 	# -1 = failure (think c++ string::npos)
@@ -1659,8 +2025,8 @@ def isvalidatom(atom, allow_blockers=False, allow_wildcard=False, allow_repo=Fal
 		2) True if the atom is valid
 	"""
 	try:
-		if not isinstance(atom, Atom):
-			atom = Atom(atom, allow_wildcard=allow_wildcard, allow_repo=allow_repo)
+		atom = _parse_atom(atom, allow_wildcard=allow_wildcard,
+			allow_repo=allow_repo)
 		if not allow_blockers and atom.blocker:
 			return False
 		return True
@@ -1737,10 +2103,60 @@ def dep_getkey(mydep):
 	@rtype: String
 	@return: The package category/package-name
 	"""
-	if not isinstance(mydep, Atom):
-		mydep = Atom(mydep, allow_wildcard=True, allow_repo=True)
+	return _parse_atom(mydep, allow_wildcard=True, allow_repo=True).cp
 
-	return mydep.cp
+def get_operator_list(mydeps):
+	"""
+	Return the result of get_operator() for each of the given atoms,
+	in the same order. Each distinct atom is only parsed once.
+	"""
+	return [_parse_atom(mydep).operator for mydep in mydeps]
+
+def dep_getcpv_list(mydeps):
+	"""
+	Return the result of dep_getcpv() for each of the given atoms,
+	in the same order. Each distinct atom is only parsed once.
+	"""
+	return [_parse_atom(mydep).cpv for mydep in mydeps]
+
+def dep_getkey_list(mydeps):
+	"""
+	Return the result of dep_getkey() for each of the given atoms,
+	in the same order. Each distinct atom is only parsed once.
+	"""
+	return [_parse_atom(mydep, allow_wildcard=True, allow_repo=True).cp \
+		for mydep in mydeps]
+
+def dep_getslot_list(mydeps):
+	"""
+	Return the result of dep_getslot() for each of the given atoms,
+	in the same order.
+	"""
+	return [dep_getslot(mydep) for mydep in mydeps]
+
+def dep_getrepo_list(mydeps):
+	"""
+	Return the result of dep_getrepo() for each of the given atoms,
+	in the same order.
+	"""
+	return [dep_getrepo(mydep) for mydep in mydeps]
+
+def dep_getusedeps_list(mydeps):
+	"""
+	Return the result of dep_getusedeps() for each of the given atoms,
+	in the same order.
+	"""
+	return [dep_getusedeps(mydep) for mydep in mydeps]
+
+def isvalidatom_list(atoms, allow_blockers=False, allow_wildcard=False,
+	allow_repo=False):
+	"""
+	Return the result of isvalidatom() for each of the given atoms,
+	in the same order.
+	"""
+	return [isvalidatom(atom, allow_blockers=allow_blockers,
+		allow_wildcard=allow_wildcard, allow_repo=allow_repo) \
+		for atom in atoms]
 
 def match_to_list(mypkg, mylist):
 	"""
@@ -1850,7 +2266,10 @@ def match_from_list(mydep, candidate_list):
 
 	mylist = []
 
-	if operator is None:
+	if isinstance(candidate_list, _candidate_index):
+		mylist = candidate_list._match_operator(mydep, operator, mycpv_cps)
+
+	elif operator is None:
 		for x in candidate_list:
 			cp = getattr(x, "cp", None)
 			if cp is None:
@@ -1999,39 +2418,175 @@ def match_from_list(mydep, candidate_list):
 
 	return mylist
 
+class _candidate_index(object):
+	"""
+	A reusable index of candidates for match_from_list(), which can be
+	passed in place of a candidate list. The candidates are grouped by cp
+	and sorted by version once, so that version operators resolve by
+	bisection instead of comparing each candidate. Slot, USE and repo
+	filtering are then only applied to the narrowed range. Matches are
+	returned in the same order as they appear in the original list.
+
+	Candidates are cpv strings, or objects with cp and cpv_split
+	attributes such as _emerge.Package instances. Invalid cpvs never
+	match.
+	"""
+
+	__slots__ = ('_by_cp', '_candidates')
+
+	def __init__(self, candidate_list):
+		self._candidates = tuple(candidate_list)
+		by_cp = {}
+		for pos, x in enumerate(self._candidates):
+			xs = getattr(x, "cpv_split", None)
+			if xs is None:
+				xs = catpkgsplit(remove_slot(x))
+				if xs is None:
+					continue
+			cp = xs[0] + "/" + xs[1]
+			entries = by_cp.get(cp)
+			if entries is None:
+				entries = []
+				by_cp[cp] = entries
+			entries.append((_vercmp_key(xs[2] + "-" + xs[3]), pos, xs))
+
+		self._by_cp = {}
+		for cp, entries in by_cp.items():
+			entries.sort()
+			self._by_cp[cp] = ([entry[0] for entry in entries], entries)
+
+	def __len__(self):
+		return len(self._candidates)
+
+	def __iter__(self):
+		return iter(self._candidates)
+
+	def _match_operator(self, mydep, operator, mycpv_cps):
+		"""
+		Return the candidates that match the cp and version parts of
+		mydep, in their original order.
+		"""
+		if operator is None:
+			if mydep.extended_syntax:
+				positions = []
+				for cp, (keys, entries) in self._by_cp.items():
+					if extended_cp_match(mydep.cp, cp):
+						positions.extend(entry[1] for entry in entries)
+				positions.sort()
+			else:
+				try:
+					keys, entries = self._by_cp[mydep.cp]
+				except KeyError:
+					return []
+				positions = sorted(entry[1] for entry in entries)
+			return [self._candidates[pos] for pos in positions]
+
+		try:
+			keys, entries = self._by_cp[mycpv_cps[0] + "/" + mycpv_cps[1]]
+		except KeyError:
+			return []
+
+		ver = mycpv_cps[2]
+		key = _vercmp_key(ver + "-" + mycpv_cps[3])
+
+		if operator == "=":
+			matches = entries[bisect_left(keys, key):bisect_right(keys, key)]
+
+		elif operator == "=*":
+			# =* is a literal prefix match, so this can't be done by
+			# bisection. Apply the same leading zero special casing
+			# as match_from_list() does.
+			myver = ver.lstrip("0")
+			if not myver or not myver[0].isdigit():
+				myver = "0" + myver
+			matches = []
+			for entry in entries:
+				xver = entry[2][2].lstrip("0")
+				if not xver or not xver[0].isdigit():
+					xver = "0" + xver
+				if xver.startswith(myver):
+					matches.append(entry)
+
+		elif operator == "~":
+			# The revision is the last component of the key, so all
+			# revisions of a version form a contiguous range.
+			start = bisect_left(keys, key[:-1] + (0,))
+			end = bisect_right(keys, key[:-1] + (float("inf"),))
+			matches = [entry for entry in entries[start:end] \
+				if entry[2][2] == ver]
+
+		elif operator == ">":
+			matches = entries[bisect_right(keys, key):]
+		elif operator == ">=":
+			matches = entries[bisect_left(keys, key):]
+		elif operator == "<":
+			matches = entries[:bisect_left(keys, key)]
+		elif operator == "<=":
+			matches = entries[:bisect_right(keys, key)]
+		else:
+			raise KeyError(_("Unknown operator: %s") % mydep)
+
+		positions = sorted(entry[1] for entry in matches)
+		return [self._candidates[pos] for pos in positions]
+
 def human_readable_required_use(required_use):
 	return required_use.replace("^^", "exactly-one-of").replace("||", "any-of")
 
-def get_required_use_flags(required_use):
-	"""
-	Returns a set of use flags that are used in the given REQUIRED_USE string
+_compiled_required_use_cache = LRUCache(4096,
+	name='portage.dep._compile_required_use')
+_required_use_result_cache = LRUCache(16384,
+	name='portage.dep.check_required_use')
 
-	@param required_use: REQUIRED_USE string
-	@type required_use: String
-	@rtype: Set
-	@return: Set of use flags that are used in the given REQUIRED_USE string
+class _compiled_required_use(object):
 	"""
+	A REQUIRED_USE string that has been split and validated once, so
+	that check_required_use() can evaluate it against different USE
+	settings without doing that work again. Instances are cached by
+	_compile_required_use() and must be treated as immutable.
+
+	tokens: the string as tokenized by _tokenize_depstr()
+	flags: the flags that the string refers to, in the order that
+		check_required_use() first looks them up, so that the bit
+		with index i of a USE mask corresponds to flags[i]
+	used_flags: the flags as a frozenset, for get_required_use_flags()
+	"""
+
+	__slots__ = ('flags', 'tokens', 'used_flags')
 
-	mysplit = required_use.split()
+	def __init__(self, tokens, flags):
+		self.tokens = tokens
+		self.flags = flags
+		self.used_flags = frozenset(flags)
+
+def _compile_required_use(required_use):
+	try:
+		return _compiled_required_use_cache[required_use]
+	except KeyError:
+		pass
+
+	mysplit = _tokenize_depstr(required_use)
 	level = 0
 	stack = [[]]
 	need_bracket = False
 
-	used_flags = set()
+	flags = []
+	seen_flags = set()
 
 	def register_token(token):
 		if token.endswith("?"):
 			token = token[:-1]
 		if token.startswith("!"):
 			token = token[1:]
-		used_flags.add(token)
+		if token not in seen_flags:
+			seen_flags.add(token)
+			flags.append(token)
 
-	for token in mysplit:
-		if token == "(":
+	for kind, token in mysplit:
+		if kind == _TOKEN_OPEN:
 			need_bracket = False
 			stack.append([])
 			level += 1
-		elif token == ")":
+		elif kind == _TOKEN_CLOSE:
 			if need_bracket:
 				raise InvalidDependString(
 					_("malformed syntax: '%s'") % required_use)
@@ -2043,6 +2598,10 @@ def get_required_use_flags(required_use):
 					if stack[level][-1] in ("||", "^^") or \
 						(not isinstance(stack[level][-1], bool) and \
 						stack[level][-1][-1] == "?"):
+						if stack[level][-1][-1] == "?":
+							# The flag of a conditional is looked up
+							# when its closing bracket is reached.
+							register_token(stack[level][-1])
 						ignore = True
 						stack[level].pop()
 						stack[level].append(True)
@@ -2052,7 +2611,7 @@ def get_required_use_flags(required_use):
 			else:
 				raise InvalidDependString(
 					_("malformed syntax: '%s'") % required_use)
-		elif token in ("||", "^^"):
+		elif kind in (_TOKEN_ANY_OF, _TOKEN_EXACTLY_ONE):
 			if need_bracket:
 				raise InvalidDependString(
 					_("malformed syntax: '%s'") % required_use)
@@ -2064,19 +2623,32 @@ def get_required_use_flags(required_use):
 				raise InvalidDependString(
 					_("malformed syntax: '%s'") % required_use)
 
-			if token[-1] == "?":
+			if kind == _TOKEN_CONDITIONAL:
 				need_bracket = True
 				stack[level].append(token)
 			else:
 				stack[level].append(True)
-			
-			register_token(token)
+				register_token(token)
 
 	if level != 0 or need_bracket:
 		raise InvalidDependString(
 			_("malformed syntax: '%s'") % required_use)
 
-	return frozenset(used_flags)
+	compiled = _compiled_required_use(mysplit, tuple(flags))
+	_compiled_required_use_cache[required_use] = compiled
+	return compiled
+
+def get_required_use_flags(required_use):
+	"""
+	Returns a set of use flags that are used in the given REQUIRED_USE string
+
+	@param required_use: REQUIRED_USE string
+	@type required_use: String
+	@rtype: Set
+	@return: Set of use flags that are used in the given REQUIRED_USE string
+	"""
+
+	return _compile_required_use(required_use).used_flags
 
 class _RequiredUseLeaf(object):
 
@@ -2141,6 +2713,11 @@ def check_required_use(required_use, use, iuse_match):
 	Checks if the use flags listed in 'use' satisfy all
 	constraints specified in 'constraints'.
 
+	The string is only split and validated the first time that it is
+	seen, and the result for a given combination of the flags that it
+	refers to is memoized, so the returned tree is shared between calls
+	and must not be modified.
+
 	@param required_use: REQUIRED_USE string
 	@type required_use: String
 	@param use: Enabled use flags
@@ -2152,22 +2729,44 @@ def check_required_use(required_use, use, iuse_match):
 	@return: Indicates if REQUIRED_USE constraints are satisfied
 	"""
 
-	def is_active(token):
-		if token.startswith("!"):
-			flag = token[1:]
-			is_negated = True
-		else:
-			flag = token
-			is_negated = False
+	compiled = _compile_required_use(required_use)
 
+	mask = 0
+	bit = 1
+	for flag in compiled.flags:
 		if not flag or not iuse_match(flag):
 			msg = _("USE flag '%s' is not in IUSE") \
 				% (flag,)
 			e = InvalidData(msg, category='IUSE.missing')
 			raise InvalidDependString(msg, errors=(e,))
+		if flag in use:
+			mask |= bit
+		bit <<= 1
+
+	cache_key = (required_use, mask)
+	try:
+		return _required_use_result_cache[cache_key]
+	except KeyError:
+		pass
+
+	tree = _eval_required_use(compiled, mask)
+	_required_use_result_cache[cache_key] = tree
+	return tree
 
-		return (flag in use and not is_negated) or \
-			(flag not in use and is_negated)
+def _eval_required_use(compiled, mask):
+	"""
+	Builds the tree that check_required_use() returns, for a compiled
+	REQUIRED_USE string and a mask of the enabled flags, as described
+	by _compiled_required_use.
+	"""
+
+	enabled = set(flag for i, flag in enumerate(compiled.flags) \
+		if mask & (1 << i))
+
+	def is_active(token):
+		if token.startswith("!"):
+			return token[1:] not in enabled
+		return token in enabled
 	
 	def is_satisfied(operator, argument):
 		if not argument:
@@ -2181,15 +2780,14 @@ def check_required_use(required_use, use, iuse_match):
 		elif operator[-1] == "?":
 			return (False not in argument)
 
-	mysplit = required_use.split()
 	level = 0
 	stack = [[]]
 	tree = _RequiredUseBranch()
 	node = tree
 	need_bracket = False
 
-	for token in mysplit:
-		if token == "(":
+	for kind, token in compiled.tokens:
+		if kind == _TOKEN_OPEN:
 			if not need_bracket:
 				child = _RequiredUseBranch(parent=node)
 				node._children.append(child)
@@ -2198,44 +2796,66 @@ def check_required_use(required_use, use, iuse_match):
 			need_bracket = False
 			stack.append([])
 			level += 1
-		elif token == ")":
-			if need_bracket:
-				raise InvalidDependString(
-					_("malformed syntax: '%s'") % required_use)
-			if level > 0:
-				level -= 1
-				l = stack.pop()
-				op = None
-				if stack[level]:
-					if stack[level][-1] in ("||", "^^"):
-						op = stack[level].pop()
+		elif kind == _TOKEN_CLOSE:
+			level -= 1
+			l = stack.pop()
+			op = None
+			if stack[level]:
+				if stack[level][-1] in ("||", "^^"):
+					op = stack[level].pop()
+					satisfied = is_satisfied(op, l)
+					stack[level].append(satisfied)
+					node._satisfied = satisfied
+
+				elif not isinstance(stack[level][-1], bool) and \
+					stack[level][-1][-1] == "?":
+					op = stack[level].pop()
+					if is_active(op[:-1]):
 						satisfied = is_satisfied(op, l)
 						stack[level].append(satisfied)
 						node._satisfied = satisfied
+					else:
+						node._satisfied = True
+						last_node = node._parent._children.pop()
+						if last_node is not node:
+							raise AssertionError(
+								"node is not last child of parent")
+						node = node._parent
+						continue
 
-					elif not isinstance(stack[level][-1], bool) and \
-						stack[level][-1][-1] == "?":
-						op = stack[level].pop()
-						if is_active(op[:-1]):
-							satisfied = is_satisfied(op, l)
-							stack[level].append(satisfied)
-							node._satisfied = satisfied
-						else:
-							node._satisfied = True
-							last_node = node._parent._children.pop()
-							if last_node is not node:
-								raise AssertionError(
-									"node is not last child of parent")
-							node = node._parent
-							continue
-
-				if op is None:
-					satisfied = False not in l
-					node._satisfied = satisfied
-					if l:
-						stack[level].append(satisfied)
+			if op is None:
+				satisfied = False not in l
+				node._satisfied = satisfied
+				if l:
+					stack[level].append(satisfied)
 
-					if len(node._children) <= 1 or \
+				if len(node._children) <= 1 or \
+					node._parent._operator not in ("||", "^^"):
+					last_node = node._parent._children.pop()
+					if last_node is not node:
+						raise AssertionError(
+							"node is not last child of parent")
+					for child in node._children:
+						node._parent._children.append(child)
+						if isinstance(child, _RequiredUseBranch):
+							child._parent = node._parent
+
+			elif not node._children:
+				last_node = node._parent._children.pop()
+				if last_node is not node:
+					raise AssertionError(
+						"node is not last child of parent")
+
+			elif len(node._children) == 1 and op in ("||", "^^"):
+				last_node = node._parent._children.pop()
+				if last_node is not node:
+					raise AssertionError(
+						"node is not last child of parent")
+				node._parent._children.append(node._children[0])
+				if isinstance(node._children[0], _RequiredUseBranch):
+					node._children[0]._parent = node._parent
+					node = node._children[0]
+					if node._operator is None and \
 						node._parent._operator not in ("||", "^^"):
 						last_node = node._parent._children.pop()
 						if last_node is not node:
@@ -2246,52 +2866,15 @@ def check_required_use(required_use, use, iuse_match):
 							if isinstance(child, _RequiredUseBranch):
 								child._parent = node._parent
 
-				elif not node._children:
-					last_node = node._parent._children.pop()
-					if last_node is not node:
-						raise AssertionError(
-							"node is not last child of parent")
-
-				elif len(node._children) == 1 and op in ("||", "^^"):
-					last_node = node._parent._children.pop()
-					if last_node is not node:
-						raise AssertionError(
-							"node is not last child of parent")
-					node._parent._children.append(node._children[0])
-					if isinstance(node._children[0], _RequiredUseBranch):
-						node._children[0]._parent = node._parent
-						node = node._children[0]
-						if node._operator is None and \
-							node._parent._operator not in ("||", "^^"):
-							last_node = node._parent._children.pop()
-							if last_node is not node:
-								raise AssertionError(
-									"node is not last child of parent")
-							for child in node._children:
-								node._parent._children.append(child)
-								if isinstance(child, _RequiredUseBranch):
-									child._parent = node._parent
-
-				node = node._parent
-			else:
-				raise InvalidDependString(
-					_("malformed syntax: '%s'") % required_use)
-		elif token in ("||", "^^"):
-			if need_bracket:
-				raise InvalidDependString(
-					_("malformed syntax: '%s'") % required_use)
+			node = node._parent
+		elif kind in (_TOKEN_ANY_OF, _TOKEN_EXACTLY_ONE):
 			need_bracket = True
 			stack[level].append(token)
 			child = _RequiredUseBranch(operator=token, parent=node)
 			node._children.append(child)
 			node = child
 		else:
-			if need_bracket or "(" in token or ")" in token or \
-				"|" in token or "^" in token:
-				raise InvalidDependString(
-					_("malformed syntax: '%s'") % required_use)
-
-			if token[-1] == "?":
+			if kind == _TOKEN_CONDITIONAL:
 				need_bracket = True
 				stack[level].append(token)
 				child = _RequiredUseBranch(operator=token, parent=node)
@@ -2302,10 +2885,6 @@ def check_required_use(required_use, use, iuse_match):
 				stack[level].append(satisfied)
 				node._children.append(_RequiredUseLeaf(token, satisfied))
 
-	if level != 0 or need_bracket:
-		raise InvalidDependString(
-			_("malformed syntax: '%s'") % required_use)
-
 	tree._satisfied = False not in stack[0]
 	return tree
 
@@ -2327,7 +2906,6 @@ def extract_affecting_use(mystr, atom, eapi=None):
 	@return: List of use flags that need to be enabled, List of use flag that need to be disabled
 	"""
 	useflag_re = _get_useflag_re(eapi)
-	mysplit = mystr.split()
 	level = 0
 	stack = [[]]
 	need_bracket = False
@@ -2346,12 +2924,12 @@ def extract_affecting_use(mystr, atom, eapi=None):
 
 		return flag
 
-	for token in mysplit:
-		if token == "(":
+	for kind, token in _tokenize_depstr(mystr):
+		if kind == _TOKEN_OPEN:
 			need_bracket = False
 			stack.append([])
 			level += 1
-		elif token == ")":
+		elif kind == _TOKEN_CLOSE:
 			if need_bracket:
 				raise InvalidDependString(
 					_("malformed syntax: '%s'") % mystr)
@@ -2408,7 +2986,7 @@ def extract_affecting_use(mystr, atom, eapi=None):
 			else:
 				raise InvalidDependString(
 					_("malformed syntax: '%s'") % mystr)
-		elif token == "||":
+		elif kind == _TOKEN_ANY_OF:
 			if need_bracket:
 				raise InvalidDependString(
 					_("malformed syntax: '%s'") % mystr)
@@ -2419,7 +2997,7 @@ def extract_affecting_use(mystr, atom, eapi=None):
 				raise InvalidDependString(
 					_("malformed syntax: '%s'") % mystr)
 
-			if token[-1] == "?":
+			if kind == _TOKEN_CONDITIONAL:
 				need_bracket = True
 				stack[level].append(token)
 			elif token == atom:
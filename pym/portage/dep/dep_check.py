@@ -157,7 +157,7 @@ def _expand_new_virtuals(mysplit, edebug, mydbapi, mysettings, myroot="/",
 			# Allow the depgraph to map this atom back to the
 			# original, in order to avoid distortion in places
 			# like display or conflict resolution code.
-			virt_atom.__dict__['_orig_atom'] = x
+			object.__setattr__(virt_atom, '_orig_atom', x)
 
 			# According to GLEP 37, RDEPEND is the only dependency
 			# type that is valid for new-style virtuals. Repoman
@@ -256,6 +256,66 @@ def dep_eval(deplist):
 				return 0
 		return 1
 
+class _zapdeps_memo(object):
+	"""
+	Remembers the choices that dep_zapdeps() makes for || deps. This is
+	intended for use during a single dependency calculation, which
+	passes it in as trees[myroot]["zapdeps_memo"]. A choice only depends
+	on what the atoms of the || dep match, so each choice is stored along
+	with a generation number for the package key (cp) of each atom. The
+	caller must call invalidate() for a cp whenever something changes
+	that might affect what its atoms match, and clear() when anything
+	else changes that might affect the choices.
+	"""
+
+	__slots__ = ('hits', 'misses', '_choices', '_generations')
+
+	def __init__(self):
+		self.hits = 0
+		self.misses = 0
+		self._choices = {}
+		self._generations = {}
+
+	def _state(self, cps):
+		generations = self._generations
+		return tuple(generations.get(cp, 0) for cp in cps)
+
+	def get(self, key, cps):
+		"""
+		@rtype: int
+		@return: the index of the choice that was stored for the given
+			key, or None if there is no valid choice
+		"""
+		entry = self._choices.get(key)
+		if entry is not None and entry[0] == self._state(cps):
+			self.hits += 1
+			return entry[1]
+		self.misses += 1
+		return None
+
+	def set(self, key, cps, choice):
+		self._choices[key] = (self._state(cps), choice)
+
+	def invalidate(self, cp):
+		self._generations[cp] = self._generations.get(cp, 0) + 1
+
+	def clear(self):
+		self._choices.clear()
+
+def _zapdeps_memo_key(deps, cps):
+	"""
+	Convert nested lists of atoms to nested tuples, so they can be used
+	as a dict key, and append the cp of each atom to the cps list.
+	"""
+	key = []
+	for x in deps:
+		if isinstance(x, list):
+			x = _zapdeps_memo_key(x, cps)
+		elif isinstance(x, Atom) and not x.blocker and x.cp not in cps:
+			cps.append(x.cp)
+		key.append(x)
+	return tuple(key)
+
 def dep_zapdeps(unreduced, reduced, myroot, use_binaries=0, trees=None):
 	"""
 	Takes an unreduced and reduced deplist and removes satisfied dependencies.
@@ -326,10 +386,34 @@ def dep_zapdeps(unreduced, reduced, myroot, use_binaries=0, trees=None):
 	else:
 		mydbapi = trees[myroot]["porttree"].dbapi
 
+	memo = trees[myroot].get("zapdeps_memo")
+	if memo is not None and vardb is not None:
+		memo_cps = []
+		memo_key = _zapdeps_memo_key(deps, memo_cps)
+		# The parent only matters if it's checked for a direct
+		# circular dependency below.
+		memo_parent = None
+		if parent is not None and priority is not None and \
+			priority.buildtime and \
+			not (priority.satisfied or priority.optional) and \
+			parent.cp in memo_cps:
+			memo_parent = parent
+		memo_key = (memo_key, _zapdeps_memo_key(satisfieds, []),
+			use_binaries, memo_parent)
+		choice = memo.get(memo_key, memo_cps)
+		if choice is not None:
+			x = deps[choice]
+			if isinstance(x, list):
+				return dep_zapdeps(x, satisfieds[choice], myroot,
+					use_binaries=use_binaries, trees=trees)
+			return [x]
+	else:
+		memo = None
+
 	# Sort the deps into installed, not installed but already 
 	# in the graph and other, not installed and not in the graph
 	# and other, with values of [[required_atom], availablility]
-	for x, satisfied in zip(deps, satisfieds):
+	for choice, (x, satisfied) in enumerate(zip(deps, satisfieds)):
 		if isinstance(x, list):
 			atoms = dep_zapdeps(x, satisfied, myroot,
 				use_binaries=use_binaries, trees=trees)
@@ -379,7 +463,7 @@ def dep_zapdeps(unreduced, reduced, myroot, use_binaries=0, trees=None):
 				catpkgsplit(highest_cpv)[1:]) > 0:
 				cp_map[pkg_cp] = avail_pkg
 
-		this_choice = (atoms, slot_map, cp_map, all_available)
+		this_choice = (atoms, slot_map, cp_map, all_available, choice)
 		if all_available:
 			# The "all installed" criterion is not version or slot specific.
 			# If any version of a package is already in the graph then we
@@ -500,13 +584,13 @@ def dep_zapdeps(unreduced, reduced, myroot, use_binaries=0, trees=None):
 		if len(choices) < 2:
 			continue
 		for choice_1 in choices[1:]:
-			atoms_1, slot_map_1, cp_map_1, all_available_1 = choice_1
+			atoms_1, slot_map_1, cp_map_1, all_available_1 = choice_1[:4]
 			cps = set(cp_map_1)
 			for choice_2 in choices:
 				if choice_1 is choice_2:
 					# choice_1 will not be promoted, so move on
 					break
-				atoms_2, slot_map_2, cp_map_2, all_available_2 = choice_2
+				atoms_2, slot_map_2, cp_map_2, all_available_2 = choice_2[:4]
 				intersecting_cps = cps.intersection(cp_map_2)
 				if not intersecting_cps:
 					continue
@@ -532,8 +616,10 @@ def dep_zapdeps(unreduced, reduced, myroot, use_binaries=0, trees=None):
 
 	for allow_masked in (False, True):
 		for choices in choice_bins:
-			for atoms, slot_map, cp_map, all_available in choices:
+			for atoms, slot_map, cp_map, all_available, choice in choices:
 				if all_available or allow_masked:
+					if memo is not None:
+						memo.set(memo_key, memo_cps, choice)
 					return atoms
 
 	assert(False) # This point should not be reachable
@@ -236,6 +236,26 @@ class KeywordsManager(object):
 		return missing
 
 
+	def hasPackageKeywords(self, cp):
+		"""
+		Returns True if any package.keywords or package.accept_keywords
+		entries apply to the given cp. If not, the result of
+		getMissingKeywords() only depends on the KEYWORDS of a package,
+		so it can be shared between all versions with the same KEYWORDS.
+
+		@param cp: The package name without a version
+		@type cp: String
+		@rtype: bool
+		"""
+		for d in self._pkeywords_list:
+			if d.get(cp):
+				return True
+		for d in self._p_accept_keywords:
+			if d.get(cp):
+				return True
+		return bool(self.pkeywordsdict.get(cp))
+
+
 	def getPKeywords(self, cpv, slot, repo, global_accept_keywords):
 		"""Gets any package.keywords settings for cp for the given
 		cpv, slot and repo
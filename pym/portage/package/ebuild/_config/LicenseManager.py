@@ -111,6 +111,18 @@ class LicenseManager(object):
 			rValue = ["-" + token for token in rValue]
 		return rValue
 
+	def hasPackageLicense(self, cp):
+		"""
+		Returns True if any package.license entries apply to the given
+		cp. If not, the result of getMissingLicenses() only depends on
+		the LICENSE and USE of a package.
+
+		@param cp: The package name without a version
+		@type cp: String
+		@rtype: bool
+		"""
+		return bool(self._plicensedict.get(cp))
+
 	def _getPkgAcceptLicense(self, cpv, slot, repo):
 		"""
 		Get an ACCEPT_LICENSE list, accounting for package.license.
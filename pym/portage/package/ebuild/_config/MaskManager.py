@@ -187,3 +187,32 @@ class MaskManager(object):
 		"""
 
 		return self._getMaskAtom(cpv, slot, repo)
+
+	def getMaskedPkgs(self, cp, pkgs):
+		"""
+		Take a list of packages that all have the given cp, in the form
+		"cpv:slot" or "cpv:slot::repo", and return the set of those that
+		getMaskAtom() would return an atom for. Each package.mask and
+		package.unmask atom is matched against the whole list at once.
+
+		@param cp: The cp of all of the packages
+		@type cp: String
+		@param pkgs: The packages to check
+		@type pkgs: list
+		@rtype: set
+		@return: The packages that are masked by package.mask and not
+			unmasked by package.unmask.
+		"""
+
+		masked = set()
+		mask_atoms = self._pmaskdict.get(cp)
+		if mask_atoms:
+			for x in mask_atoms:
+				masked.update(match_from_list(x, pkgs))
+			unmask_atoms = self._punmaskdict.get(cp)
+			if masked and unmask_atoms:
+				# A package that matches any package.unmask atom is not
+				# masked, regardless of which package.mask atom matched.
+				for y in unmask_atoms:
+					masked.difference_update(match_from_list(y, pkgs))
+		return masked
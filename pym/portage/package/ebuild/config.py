@@ -1482,6 +1482,46 @@ class config(object):
 				return x
 		return None
 
+	def _getMaskedCpvs(self, cp, candidates):
+		"""
+		Take a list of (cpv, metadata) tuples for packages that all have
+		the given cp, and return the set of cpvs for which _getMaskAtom()
+		or _getProfileMaskAtom() would return an atom. Each atom is
+		matched against all of the packages at once.
+
+		@param cp: The cp of all of the packages
+		@type cp: String
+		@param candidates: The packages to check
+		@type candidates: list
+		@rtype: set
+		@return: The cpvs of the masked packages.
+		"""
+		pkg_map = {}
+		for cpv, metadata in candidates:
+			pkg = "".join((cpv, _slot_separator, metadata["SLOT"]))
+			repo = metadata.get("repository")
+			if repo and repo != Package.UNKNOWN_REPO:
+				pkg = "".join((pkg, _repo_separator, repo))
+			pkg_map[pkg] = cpv
+		pkg_list = list(pkg_map)
+
+		masked = self._mask_manager.getMaskedPkgs(cp, pkg_list)
+		profile_atoms = self.prevmaskdict.get(cp)
+		if profile_atoms:
+			for x in profile_atoms:
+				matched = set(match_from_list(x, pkg_list))
+				masked.update(pkg for pkg in pkg_list if pkg not in matched)
+		return set(pkg_map[pkg] for pkg in masked)
+
+	def _hasPackageKeywords(self, cp):
+		return self._keywords_manager.hasPackageKeywords(cp)
+
+	def _hasPackageLicense(self, cp):
+		return self._license_manager.hasPackageLicense(cp)
+
+	def _hasPackageProperties(self, cp):
+		return bool(self._ppropertiesdict.get(cp))
+
 	def _getKeywords(self, cpv, metadata):
 		return self._keywords_manager.getKeywords(cpv, metadata["SLOT"], \
 			metadata.get("KEYWORDS", ""), metadata.get("repository"))
@@ -0,0 +1,159 @@
+# Copyright 2011 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import shutil
+import tempfile
+
+from portage.cache import anydbm, flat_hash, sqlite
+from portage.cache.cache_errors import InitializationError
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+class GetManyTestCase(TestCase):
+
+	auxdbkeys = ("DEPEND", "DESCRIPTION", "EAPI", "IUSE", "KEYWORDS",
+		"RDEPEND", "SLOT")
+
+	def _entry(self, cpv, **kwargs):
+		entry = {
+			"DESCRIPTION" : "Package %s" % cpv,
+			"EAPI" : "2",
+			"KEYWORDS" : "x86",
+			"SLOT" : "0",
+			"_eclasses_" : {"eutils" : ("/usr/portage/eclass", 1000)},
+			"_mtime_" : 1234,
+		}
+		entry.update(kwargs)
+		return entry
+
+	def _check_get_many(self, module):
+		tempdir = tempfile.mkdtemp()
+		try:
+			try:
+				db = module.database(tempdir, "/usr/portage", self.auxdbkeys)
+			except InitializationError:
+				# sqlite is optional
+				return
+			cpvs = ["dev-libs/A-%d" % i for i in range(20)]
+			for cpv in cpvs:
+				db[cpv] = self._entry(cpv, DEPEND="dev-libs/B")
+			db["dev-libs/B-1"] = self._entry("dev-libs/B-1",
+				_mtime_="corrupt")
+			db.sync()
+
+			wanted = cpvs[5:] + ["dev-libs/B-1", "dev-libs/C-1"]
+			result = db.get_many(wanted)
+			# Missing and corrupt entries are left out.
+			self.assertEqual(sorted(result), sorted(cpvs[5:]))
+			for cpv in cpvs[5:]:
+				self.assertEqual(dict(result[cpv]), dict(db[cpv]))
+
+			result = db.get_many(cpvs, keys=["DEPEND"])
+			self.assertEqual(sorted(result), sorted(cpvs))
+			entry = result["dev-libs/A-1"]
+			self.assertEqual(entry["DEPEND"], "dev-libs/B")
+			self.assertEqual(entry["_mtime_"], 1234)
+			self.assertEqual(sorted(entry["_eclasses_"]), ["eutils"])
+
+			self.assertEqual(db.get_many([]), {})
+			# Let anydbm sync before the directory is removed.
+			del db
+		finally:
+			shutil.rmtree(tempdir)
+
+	def testFlatHashGetMany(self):
+		self._check_get_many(flat_hash)
+
+	def testAnydbmGetMany(self):
+		self._check_get_many(anydbm)
+
+	def testSqliteGetMany(self):
+		self._check_get_many(sqlite)
+
+	def testAuxGetMany(self):
+		ebuilds = {
+			"dev-libs/A-1": { "SLOT": "1" },
+			"dev-libs/A-2": { "SLOT": "2", "KEYWORDS": "~x86" },
+			"dev-libs/A-3": { "SLOT": "3", "DEPEND": "dev-libs/B" },
+			"dev-libs/B-1::repo1": { },
+			}
+
+		playground = ResolverPlayground(ebuilds=ebuilds)
+		portdb = playground.trees[playground.root]["porttree"].dbapi
+		tempdir = tempfile.mkdtemp()
+		wrapped = []
+		try:
+			portdir = portdb.treemap["test_repo"]
+			repo1 = portdb.treemap["repo1"]
+			# The default flat_hash cache doesn't support batched lookups.
+			for repo_path, auxdb in list(portdb.auxdb.items()):
+				portdb.auxdb[repo_path] = anydbm.database(
+					portdb.depcachedir, repo_path, auxdb._known_keys)
+			cpvs = ["dev-libs/A-1", "dev-libs/A-2", "dev-libs/A-3",
+				"dev-libs/A-4", "dev-libs/B-1"]
+			keys = ["SLOT", "KEYWORDS", "DEPEND"]
+
+			# The first call generates the cache entries.
+			expected = dict((cpv, portdb.aux_get(cpv, keys))
+				for cpv in cpvs if cpv != "dev-libs/A-4")
+			portdb._aux_cache.clear()
+
+			calls = []
+			deleted = []
+			def wrap(repo_path, auxdb):
+				def get_many(cpvs, keys=None, get_many=auxdb.get_many):
+					calls.append((repo_path, sorted(cpvs)))
+					return get_many(cpvs, keys=keys)
+				def _delitem(cpv, _delitem=auxdb._delitem):
+					deleted.append(cpv)
+					return _delitem(cpv)
+				auxdb.get_many = get_many
+				auxdb._delitem = _delitem
+				wrapped.append(auxdb)
+			for repo_path, auxdb in portdb.auxdb.items():
+				wrap(repo_path, auxdb)
+
+			# Each cpv is only looked up in its own repository.
+			self.assertEqual(portdb.aux_get_many(cpvs, keys), expected)
+			self.assertEqual(sorted(calls), [
+				(repo1, ["dev-libs/B-1"]),
+				(portdir, ["dev-libs/A-1", "dev-libs/A-2", "dev-libs/A-3"]),
+				])
+
+			# The internal cache is used for the keys that it has.
+			del calls[:]
+			self.assertEqual(portdb.aux_get_many(cpvs, keys), expected)
+			self.assertEqual(calls, [])
+
+			# The writable cache is only queried for the cpvs that
+			# don't have a valid pre-generated entry.
+			pregen = anydbm.database(tempdir, portdir,
+				portdb.auxdb[portdir]._known_keys)
+			pregen["dev-libs/A-1"] = dict(portdb.auxdb[portdir]["dev-libs/A-1"])
+			wrap("pregen", pregen)
+			portdb._pregen_auxdb[portdir] = pregen
+			portdb._aux_cache.clear()
+			del calls[:]
+			self.assertEqual(portdb.aux_get_many(cpvs, keys), expected)
+			self.assertEqual(sorted(calls), [
+				(repo1, ["dev-libs/B-1"]),
+				(portdir, ["dev-libs/A-2", "dev-libs/A-3"]),
+				("pregen", ["dev-libs/A-1", "dev-libs/A-2", "dev-libs/A-3"]),
+				])
+
+			# Corrupt entries of the writable cache are still removed.
+			entry = dict(portdb.auxdb[portdir]["dev-libs/A-3"])
+			entry["_mtime_"] = "corrupt"
+			portdb.auxdb[portdir]["dev-libs/A-3"] = entry
+			portdb._aux_cache.clear()
+			self.assertEqual(portdb.aux_get_many(cpvs, keys), expected)
+			self.assertEqual(deleted, ["dev-libs/A-3"])
+		finally:
+			# Let anydbm sync before the directories are removed.
+			while wrapped:
+				auxdb = wrapped.pop()
+				del auxdb.get_many, auxdb._delitem
+			portdb._pregen_auxdb.clear()
+			auxdb = pregen = None
+			playground.cleanup()
+			shutil.rmtree(tempdir)
@@ -0,0 +1,83 @@
+# Copyright 2011 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import shutil
+import tempfile
+
+from portage import os
+from portage import _unicode_decode
+from portage.cache.packed import database
+from portage.tests import TestCase
+
+class PackedCacheTestCase(TestCase):
+
+	auxdbkeys = ("DEPEND", "DESCRIPTION", "EAPI", "IUSE", "KEYWORDS",
+		"RDEPEND", "SLOT")
+
+	def _entry(self, cpv, **kwargs):
+		entry = {
+			"DESCRIPTION" : "Package %s" % cpv,
+			"EAPI" : "2",
+			"KEYWORDS" : "x86",
+			"SLOT" : "0",
+			"_eclasses_" : {"eutils" : ("/usr/portage/eclass", 1000)},
+			"_mtime_" : 1234,
+		}
+		entry.update(kwargs)
+		return entry
+
+	def testPackedCache(self):
+		tempdir = tempfile.mkdtemp()
+		try:
+			db = database(tempdir, "/usr/portage", self.auxdbkeys)
+			self.assertEqual(list(db), [])
+
+			cpvs = ["dev-libs/A-%d" % i for i in range(50)]
+			for cpv in cpvs:
+				db[cpv] = self._entry(cpv, DEPEND="dev-libs/B")
+			description = _unicode_decode(b'Caf\xc3\xa9',
+				encoding='utf_8', errors='strict')
+			db["dev-libs/B-1"] = self._entry("dev-libs/B-1",
+				DESCRIPTION=description)
+
+			# Pending writes are visible before they are committed.
+			self.assertEqual(db["dev-libs/A-1"]["DEPEND"], "dev-libs/B")
+			db.sync()
+			self.assertTrue(os.path.exists(db._db_path))
+
+			db = database(tempdir, "/usr/portage", self.auxdbkeys)
+			self.assertEqual(sorted(db), sorted(cpvs + ["dev-libs/B-1"]))
+			entry = db["dev-libs/A-7"]
+			self.assertEqual(entry["DEPEND"], "dev-libs/B")
+			self.assertEqual(entry["_mtime_"], 1234)
+			self.assertEqual(entry["_eclasses_"],
+				{"eutils" : ("/usr/portage/eclass", 1000)})
+			# Empty values are not stored.
+			self.assertFalse("RDEPEND" in entry)
+			self.assertEqual(entry.get("RDEPEND", ""), "")
+			self.assertEqual(db["dev-libs/B-1"]["DESCRIPTION"], description)
+			self.assertFalse("dev-libs/C-1" in db)
+			self.assertRaises(KeyError, db.__getitem__, "dev-libs/C-1")
+
+			# Another instance sees the changes once they are committed.
+			other_db = database(tempdir, "/usr/portage", self.auxdbkeys)
+			db["dev-libs/C-1"] = self._entry("dev-libs/C-1")
+			del db["dev-libs/A-0"]
+			self.assertFalse("dev-libs/A-0" in db)
+			self.assertTrue("dev-libs/A-0" in other_db)
+			db.commit()
+			self.assertEqual(other_db["dev-libs/C-1"]["SLOT"], "0")
+			self.assertEqual(sorted(db), sorted(cpvs[1:] +
+				["dev-libs/B-1", "dev-libs/C-1"]))
+
+			# A writer with different keys converts the entries.
+			db = database(tempdir, "/usr/portage",
+				self.auxdbkeys + ("LICENSE",))
+			db["dev-libs/D-1"] = self._entry("dev-libs/D-1", LICENSE="GPL-2")
+			db.commit()
+			db = database(tempdir, "/usr/portage", self.auxdbkeys)
+			self.assertEqual(db["dev-libs/A-3"]["DEPEND"], "dev-libs/B")
+			self.assertEqual(db["dev-libs/D-1"]["LICENSE"], "GPL-2")
+			self.assertEqual(len(list(db)), 52)
+		finally:
+			shutil.rmtree(tempdir)
@@ -0,0 +1,129 @@
+# Copyright 2011 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import gc
+import shutil
+import tempfile
+
+from portage.cache.cache_errors import InitializationError
+from portage.cache.sqlite import database, wal_database
+from portage.tests import TestCase
+
+class SqliteCacheTestCase(TestCase):
+
+	auxdbkeys = ("DEPEND", "DESCRIPTION", "EAPI", "SLOT")
+
+	def _entry(self, cpv, **kwargs):
+		entry = {
+			"DESCRIPTION" : "Package %s" % cpv,
+			"EAPI" : "2",
+			"SLOT" : "0",
+			"_eclasses_" : {"eutils" : ("/usr/portage/eclass", 1000)},
+			"_mtime_" : 1234,
+		}
+		entry.update(kwargs)
+		return entry
+
+	def testSqliteCache(self):
+		tempdir = tempfile.mkdtemp()
+		try:
+			try:
+				db = database(tempdir, "/usr/portage", self.auxdbkeys)
+			except InitializationError:
+				# sqlite is optional
+				return
+			db._db_cursor.execute("PRAGMA journal_mode")
+			self.assertEqual(db._db_cursor.fetchone()[0], "delete")
+
+			cpvs = ["dev-libs/A-%d" % i for i in range(20)]
+			for cpv in cpvs:
+				db[cpv] = self._entry(cpv, DEPEND="dev-libs/B")
+			del db["dev-libs/A-0"]
+
+			# The writes are visible before they are committed, but
+			# only to this connection.
+			self.assertEqual(db["dev-libs/A-1"]["DEPEND"], "dev-libs/B")
+			self.assertFalse("dev-libs/A-0" in db)
+			self.assertEqual(sorted(db), sorted(cpvs[1:]))
+			reader = database(tempdir, "/usr/portage", self.auxdbkeys,
+				readonly=True)
+			self.assertEqual(list(reader), [])
+
+			db.sync()
+			self.assertEqual(sorted(reader), sorted(cpvs[1:]))
+			entry = reader["dev-libs/A-7"]
+			self.assertEqual(entry["DEPEND"], "dev-libs/B")
+			self.assertEqual(entry["_mtime_"], 1234)
+			self.assertRaises(KeyError, reader.__getitem__, "dev-libs/A-0")
+			self.assertEqual(sorted(reader.get_many(cpvs)), sorted(cpvs[1:]))
+			del reader
+			del db
+
+			# A database with the layout from before schema version 2
+			# is migrated.
+			db = database(tempdir, "/usr/portage", self.auxdbkeys)
+			cursor = db._db_cursor
+			cursor.execute("DROP TABLE portage_packages")
+			columns = ["_eclasses_", "_mtime_"] + list(self.auxdbkeys)
+			columns.sort()
+			cursor.execute("CREATE TABLE portage_packages ( " + \
+				"internal_db_package_id INTEGER PRIMARY KEY AUTOINCREMENT," + \
+				"portage_package_key TEXT," + \
+				",".join("%s TEXT" % k for k in columns) + \
+				",UNIQUE(portage_package_key) )")
+			cursor.execute("INSERT INTO portage_packages " + \
+				"(portage_package_key, _mtime_, _eclasses_, SLOT) " + \
+				"VALUES ('dev-libs/B-1', '1234', '', '1')")
+			db._db_connection.commit()
+			del cursor
+			del db
+
+			db = database(tempdir, "/usr/portage", self.auxdbkeys)
+			self.assertEqual(list(db), ["dev-libs/B-1"])
+			self.assertEqual(db["dev-libs/B-1"]["SLOT"], "1")
+			db._db_cursor.execute("PRAGMA user_version")
+			self.assertEqual(db._db_cursor.fetchone()[0],
+				database._db_schema_version)
+
+			# With different keys, the old entries are incomplete
+			# and they are dropped.
+			db = database(tempdir, "/usr/portage",
+				self.auxdbkeys + ("IUSE",))
+			self.assertEqual(list(db), [])
+
+			# A read-only connection can't create the table.
+			self.assertRaises(InitializationError, database,
+				tempdir, "/usr/local/portage", self.auxdbkeys, readonly=True)
+		finally:
+			shutil.rmtree(tempdir)
+
+	def testSqliteWalCache(self):
+		tempdir = tempfile.mkdtemp()
+		try:
+			try:
+				db = wal_database(tempdir, "/usr/portage", self.auxdbkeys)
+			except InitializationError:
+				# sqlite is optional
+				return
+			db._db_cursor.execute("PRAGMA journal_mode")
+			if db._db_cursor.fetchone()[0] != "wal":
+				# sqlite doesn't support write-ahead logging
+				return
+			db["dev-libs/A-1"] = self._entry("dev-libs/A-1")
+			db.sync()
+			reader = wal_database(tempdir, "/usr/portage", self.auxdbkeys,
+				readonly=True)
+			self.assertEqual(list(reader), ["dev-libs/A-1"])
+			del reader
+			del db
+			# Close the connections.
+			gc.collect()
+
+			# The default class switches the database back to the
+			# rollback journal.
+			db = database(tempdir, "/usr/portage", self.auxdbkeys)
+			db._db_cursor.execute("PRAGMA journal_mode")
+			self.assertEqual(db._db_cursor.fetchone()[0], "delete")
+			self.assertEqual(db["dev-libs/A-1"]["SLOT"], "0")
+		finally:
+			shutil.rmtree(tempdir)
@@ -0,0 +1,54 @@
+# Copyright 2011 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+
+class PortdbVisibleBatchTestCase(TestCase):
+
+	def testVisibleBatch(self):
+		ebuilds = {
+			"dev-libs/A-1": { },
+			"dev-libs/A-2": { "KEYWORDS": "~x86" },
+			"dev-libs/A-3": { "LICENSE": "TEST" },
+			"dev-libs/A-4": { "LICENSE": "GPL-2" },
+			"dev-libs/A-5": { "SLOT": "1" },
+			"dev-libs/A-6": { "SLOT": "1" },
+			"dev-libs/A-7": { "KEYWORDS": "~x86" },
+
+			"dev-libs/B-1": { "KEYWORDS": "~x86" },
+			"dev-libs/B-2": { "KEYWORDS": "~x86" },
+			"dev-libs/B-3": { "LICENSE": "TEST" },
+			"dev-libs/B-4": { "LICENSE": "TEST" },
+
+			"dev-libs/C-1": { },
+			"dev-libs/C-2": { },
+		}
+		user_config = {
+			# Like visible(), masks are matched without the repository,
+			# so an atom for another repository applies too.
+			"package.mask": ("=dev-libs/A-5", ">=dev-libs/A-6", "dev-libs/B",
+				"=dev-libs/C-2::other_repo"),
+			"package.unmask": ("dev-libs/A:1", "=dev-libs/B-4"),
+			"package.keywords": ("=dev-libs/B-2 ~x86",),
+			"package.license": (">=dev-libs/B-3 TEST",),
+		}
+		expected = {
+			"dev-libs/A": ["dev-libs/A-1", "dev-libs/A-4",
+				"dev-libs/A-5", "dev-libs/A-6"],
+			"dev-libs/B": ["dev-libs/B-4"],
+			"dev-libs/C": ["dev-libs/C-1"],
+		}
+
+		playground = ResolverPlayground(ebuilds=ebuilds,
+			user_config=user_config)
+		try:
+			portdb = playground.trees[playground.root]["porttree"].dbapi
+			for cp, visible in expected.items():
+				cpvs = portdb.cp_list(cp)
+				self.assertEqual(portdb.visible_batch(cp, cpvs), visible)
+				self.assertEqual(portdb.visible_batch(cp, cpvs),
+					portdb.gvisible(portdb.visible(cpvs)))
+				self.assertEqual(portdb.xmatch("match-visible", cp), visible)
+		finally:
+			playground.cleanup()
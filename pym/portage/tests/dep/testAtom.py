@@ -1,6 +1,11 @@
 # Copyright 2006, 2010 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
+try:
+	import cPickle as pickle
+except ImportError:
+	import pickle
+
 from portage.tests import TestCase
 from portage.dep import Atom
 from portage.exception import InvalidAtom
@@ -313,3 +318,47 @@ class TestAtom(TestCase):
 			b = a._eval_qa_conditionals(use_mask, use_force)
 			self.assertEqual(str(b), expected_atom)
 			self.assertEqual(str(b.unevaluated_atom), atom)
+
+	def test_atom_pool(self):
+		a = Atom("=sys-apps/portage-2.1-r1:0[doc,a?]")
+		b = Atom("=sys-apps/portage-2.1-r1:0[doc,a?]")
+
+		# Parsed fields are shared, but each atom is a distinct object
+		# that refers to itself where appropriate.
+		self.assertFalse(a is b)
+		self.assertTrue(a.use is b.use)
+		self.assertTrue(a.without_use is b.without_use)
+		self.assertTrue(b.unevaluated_atom is b)
+		for attr in ("blocker", "cp", "cpv", "extended_syntax",
+			"operator", "repo", "slot"):
+			self.assertEqual(getattr(a, attr), getattr(b, attr))
+
+		c = Atom("sys-apps/portage")
+		self.assertTrue(c.without_use is c)
+		self.assertTrue(Atom("sys-apps/portage").without_use is not c)
+
+		# Validation that depends on constructor arguments must
+		# still happen when a matching atom is already pooled.
+		self.assertRaises(InvalidAtom, Atom, "sys-apps/portage::gentoo")
+		Atom("sys-apps/portage::gentoo", allow_repo=True)
+		self.assertRaises(InvalidAtom, Atom, "sys-apps/portage::gentoo")
+		Atom("dev-libs/A[foo?]", eapi="2")
+		self.assertRaises(InvalidAtom, Atom, "dev-libs/A[foo?]", eapi="2",
+			is_valid_flag=lambda flag: False)
+
+	def test_atom_pickle(self):
+		a = Atom("=sys-apps/portage-2.1-r1:0[doc,a?]")
+		b = a.evaluate_conditionals(["a"])
+		for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+			c = pickle.loads(pickle.dumps(b, protocol))
+			self.assertEqual(c, b)
+			self.assertEqual(c.unevaluated_atom, a)
+			self.assertEqual(hasattr(c, "_orig_atom"), False)
+
+		# dep_check sets _orig_atom on the atoms of virtuals.
+		v = Atom("virtual/foo")
+		object.__setattr__(v, "_orig_atom", a)
+		for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+			c = pickle.loads(pickle.dumps(v, protocol))
+			self.assertEqual(c, v)
+			self.assertEqual(c._orig_atom, a)
@@ -2,7 +2,7 @@
 # Distributed under the terms of the GNU General Public License v2
 
 from portage.tests import TestCase
-from portage.dep import check_required_use
+from portage.dep import check_required_use, get_required_use_flags
 from portage.exception import InvalidDependString
 
 class TestCheckRequiredUse(TestCase):
@@ -217,3 +217,31 @@ class TestCheckRequiredUse(TestCase):
 			self.assertEqual(result, expected,
 				"REQUIRED_USE = '%s', USE = '%s', '%s' != '%s'" % \
 				(required_use, " ".join(use), result, expected))
+
+	def testCheckRequiredUseMemoized(self):
+		"""
+		Repeated checks of the same string with different USE must
+		not return results that were memoized for other USE, and
+		IUSE must still be checked on every call.
+		"""
+		required_use = "foo? ( || ( bar baz ) ) !foo? ( qux )"
+		iuse = frozenset(["foo", "bar", "baz", "qux"])
+		self.assertEqual(get_required_use_flags(required_use), iuse)
+
+		test_cases = (
+			(["foo"], False, "foo? ( || ( bar baz ) )"),
+			(["foo", "bar"], True, ""),
+			([], False, "!foo? ( qux )"),
+			(["qux"], True, ""),
+			(["foo"], False, "foo? ( || ( bar baz ) )"),
+			(["foo", "qux", "unrelated"], False, "foo? ( || ( bar baz ) )"),
+		)
+
+		for use, expected, reduced_noise in test_cases:
+			for i in range(2):
+				result = check_required_use(required_use, use, iuse.__contains__)
+				self.assertEqual(bool(result), expected, " ".join(use))
+				self.assertEqual(result.tounicode(), reduced_noise, " ".join(use))
+
+		self.assertRaises(InvalidDependString, check_required_use,
+			required_use, ["foo"], iuse.difference(["qux"]).__contains__)
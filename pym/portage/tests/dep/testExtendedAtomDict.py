@@ -16,3 +16,28 @@ class TestExtendedAtomDict(TestCase):
 		self.assertEqual(d.get("sys-apps/portage"), { "test1": "x", "test3": "z" })
 		self.assertEqual(d["dev-libs/*"], { "test2": "y" })
 		self.assertEqual(d["sys-apps/portage"], {'test1': 'x', 'test3': 'z'})
+
+	def testExtendedAtomDictIndex(self):
+		d = ExtendedAtomDict(list)
+		d["*/*"] = ["all"]
+		d["dev-libs/*"] = ["category"]
+		d["*/foo"] = ["package"]
+		d["dev-*/fo*"] = ["other"]
+		d["dev-libs/foo"] = ["normal"]
+		self.assertEqual(d["dev-libs/foo"],
+			["normal", "all", "category", "package", "other"])
+		self.assertEqual(d["sys-apps/foo"], ["all", "package"])
+		self.assertEqual(d["dev-util/fob"], ["all", "other"])
+		self.assertEqual(d.get("foo"), None)
+
+		del d["*/foo"]
+		del d["*/*"]
+		self.assertEqual(d.get("sys-apps/foo"), None)
+		self.assertEqual(d["dev-libs/foo"], ["normal", "category", "other"])
+
+		d["*/*"] = ["all"]
+		c = d.copy()
+		self.assertEqual(c["dev-libs/bar"], ["category", "all"])
+		c.clear()
+		self.assertEqual(c.get("dev-libs/bar"), None)
+		self.assertEqual(d["dev-libs/bar"], ["category", "all"])
@@ -3,7 +3,10 @@
 # Distributed under the terms of the GNU General Public License v2
 
 from portage.tests import TestCase
-from portage.dep import dep_getcpv
+from portage.dep import dep_getcpv, dep_getcpv_list, dep_getkey_list, \
+	dep_getrepo_list, dep_getslot_list, dep_getusedeps_list, \
+	get_operator_list, isvalidatom_list
+from portage.exception import InvalidAtom
 
 class DepGetCPV(TestCase):
 	""" A simple testcase for isvalidatom
@@ -33,3 +36,24 @@ class DepGetCPV(TestCase):
 					if slot:
 						mycpv += slot
 					self.assertEqual( dep_getcpv( mycpv ), cpv )
+
+	def testDepGetCPVList(self):
+		atoms = [">=sys-apps/portage-2.1:2", "=sys-apps/portage-2.1*",
+			"!<dev-libs/A-1[foo,-bar]", ">=sys-apps/portage-2.1:2"]
+		self.assertEqual(dep_getcpv_list(atoms),
+			[dep_getcpv(atom) for atom in atoms])
+		self.assertEqual(dep_getkey_list(atoms + ["*/*::repo"]),
+			["sys-apps/portage", "sys-apps/portage", "dev-libs/A",
+			"sys-apps/portage", "*/*"])
+		self.assertEqual(get_operator_list(atoms), [">=", "=*", "<", ">="])
+		self.assertEqual(dep_getslot_list(atoms + ["app-misc/test:3"]),
+			["2", None, None, "2", "3"])
+		self.assertEqual(dep_getrepo_list(["dev-libs/A::repo", "dev-libs/A"]),
+			["repo", None])
+		self.assertEqual(dep_getusedeps_list(atoms),
+			[(), (), ("foo", "-bar"), ()])
+		self.assertEqual(isvalidatom_list(atoms + ["sys-apps/portage-2.1"],
+			allow_blockers=True), [True, True, True, True, False])
+		self.assertRaises(InvalidAtom, dep_getcpv_list, ["sys-apps/portage-2.1"])
+		# The failure is memoized, but must still raise.
+		self.assertRaises(InvalidAtom, dep_getcpv, "sys-apps/portage-2.1")
@@ -3,7 +3,8 @@
 
 import sys
 from portage.tests import TestCase
-from portage.dep import Atom, match_from_list, _repo_separator
+from portage.dep import Atom, match_from_list, _candidate_index, \
+	_repo_separator
 from portage.versions import catpkgsplit
 
 if sys.hexversion >= 0x3000000:
@@ -96,13 +97,27 @@ class Test_match_from_list(TestCase):
 		)
 
 		for atom, cpv_list, expected_result in tests:
-			result = []
-			for pkg in match_from_list( atom, cpv_list ):
-				if isinstance(pkg, Package):
-					if pkg.repo:
-						result.append(pkg.cpv + _repo_separator + pkg.repo)
+			for candidates in (cpv_list, _candidate_index(cpv_list)):
+				result = []
+				for pkg in match_from_list( atom, candidates ):
+					if isinstance(pkg, Package):
+						if pkg.repo:
+							result.append(pkg.cpv + _repo_separator + pkg.repo)
+						else:
+							result.append(pkg.cpv)
 					else:
-						result.append(pkg.cpv)
-				else:
-					result.append(pkg)
-			self.assertEqual( result, expected_result )
+						result.append(pkg)
+				self.assertEqual( result, expected_result )
+
+	def testCandidateIndex(self):
+		cpv_list = ["dev-libs/A-2", "dev-libs/A-1", "dev-libs/A-1.0-r0",
+			"dev-libs/A-1-r1", "dev-libs/A-1.5_rc1", "dev-libs/A-10",
+			"dev-libs/B-1", "sys-libs/A-3"]
+		index = _candidate_index(cpv_list)
+		atoms = ("dev-libs/A", "=dev-libs/A-1", "=dev-libs/A-1*",
+			"~dev-libs/A-1", ">dev-libs/A-1", ">=dev-libs/A-1-r1",
+			"<dev-libs/A-2", "<=dev-libs/A-1.5_rc1", "*/A", "dev-libs/*",
+			">dev-libs/C-1")
+		for atom in atoms:
+			self.assertEqual(match_from_list(atom, index),
+				match_from_list(atom, cpv_list))
@@ -2,7 +2,9 @@
 # Distributed under the terms of the GNU General Public License v2
 
 from portage.tests import TestCase
-from portage.dep import paren_reduce
+from portage.dep import paren_reduce, _tokenize_depstr, _TOKEN_ANY_OF, \
+	_TOKEN_ARROW, _TOKEN_CLOSE, _TOKEN_CONDITIONAL, _TOKEN_EXACTLY_ONE, \
+	_TOKEN_OPEN, _TOKEN_OTHER
 from portage.exception import InvalidDependString
 
 class TestParenReduce(TestCase):
@@ -64,3 +66,19 @@ class TestParenReduce(TestCase):
 		for dep_str in test_cases_xfail:
 			self.assertRaisesMsg(dep_str,
 				InvalidDependString, paren_reduce, dep_str)
+
+	def testTokenizeDepstr(self):
+		self.assertEqual(_tokenize_depstr(" a/b  || ( c? ( ^^ ) ) -> !d?\t)"), (
+			(_TOKEN_OTHER, "a/b"),
+			(_TOKEN_ANY_OF, "||"),
+			(_TOKEN_OPEN, "("),
+			(_TOKEN_CONDITIONAL, "c?"),
+			(_TOKEN_OPEN, "("),
+			(_TOKEN_EXACTLY_ONE, "^^"),
+			(_TOKEN_CLOSE, ")"),
+			(_TOKEN_CLOSE, ")"),
+			(_TOKEN_ARROW, "->"),
+			(_TOKEN_CONDITIONAL, "!d?"),
+			(_TOKEN_CLOSE, ")"),
+		))
+		self.assertEqual(_tokenize_depstr(""), ())
@@ -625,3 +625,56 @@ class UseReduce(TestCase):
 
 		for test_case in test_cases_xfail:
 			self.assertRaisesMsg(test_case.deparray, (InvalidDependString, ValueError), test_case.run)
+
+	def testCompiledDepstrReuse(self):
+		"""
+		Repeated calls with the same dep string reuse the cached tokens,
+		so make sure that results don't leak between calls.
+		"""
+		depstr = "a? ( dev-libs/A[b?] ) !a? ( || ( dev-libs/B dev-libs/C ) )"
+
+		result = use_reduce(depstr, uselist=["a", "b"], eapi="2",
+			token_class=Atom)
+		self.assertEqual(result, ["dev-libs/A[b]"])
+		self.assertEqual(result[0].unevaluated_atom, "dev-libs/A[b?]")
+		result.append("dev-libs/D")
+
+		self.assertEqual(use_reduce(depstr, uselist=["a"], eapi="2",
+			token_class=Atom), ["dev-libs/A"])
+		self.assertEqual(use_reduce(depstr, uselist=[], eapi="2",
+			token_class=Atom), ["||", ["dev-libs/B", "dev-libs/C"]])
+		self.assertEqual(use_reduce(depstr, uselist=[], eapi="2",
+			token_class=Atom, opconvert=True),
+			[["||", "dev-libs/B", "dev-libs/C"]])
+		self.assertEqual(use_reduce(depstr, matchall=True, eapi="2",
+			token_class=Atom), ["dev-libs/A[b?]", "||",
+			["dev-libs/B", "dev-libs/C"]])
+
+		# Checks that depend on is_valid_flag are not cached.
+		self.assertRaises(InvalidDependString, use_reduce, depstr,
+			eapi="2", token_class=Atom, is_valid_flag=lambda flag: flag != "b")
+		self.assertRaises(InvalidDependString, use_reduce, depstr,
+			eapi="2", token_class=Atom, is_valid_flag=lambda flag: flag != "a")
+		use_reduce(depstr, eapi="2", token_class=Atom,
+			is_valid_flag=self.always_true)
+
+	def testSharedDepstrAtoms(self):
+		"""
+		Packages with the same dep string must not share Atom instances,
+		since dep_check and the depgraph rely on atom identity.
+		"""
+		depstr = "|| ( dev-libs/A dev-libs/B ) dev-libs/C[foo?]"
+		parent_a = use_reduce(depstr, uselist=["foo"], eapi="2",
+			token_class=Atom)
+		parent_b = use_reduce(depstr, uselist=["foo"], eapi="2",
+			token_class=Atom)
+		self.assertEqual(parent_a, parent_b)
+
+		atoms_a = parent_a[1] + parent_a[2:]
+		atoms_b = parent_b[1] + parent_b[2:]
+		self.assertEqual(atoms_a, ["dev-libs/A", "dev-libs/B", "dev-libs/C[foo]"])
+		for atom_a, atom_b in zip(atoms_a, atoms_b):
+			self.assertEqual(isinstance(atom_a, Atom), True)
+			self.assertEqual(atom_a is atom_b, False)
+			self.assertEqual(atom_a.unevaluated_atom is \
+				atom_b.unevaluated_atom, False)
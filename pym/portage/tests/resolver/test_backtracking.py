@@ -1,6 +1,8 @@
 # Copyright 2010 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
+import _emerge.depgraph
+from _emerge.resolver.backtracking import Backtracker
 from portage.tests import TestCase
 from portage.tests.resolver.ResolverPlayground import ResolverPlayground, ResolverPlaygroundTestCase
 
@@ -167,3 +169,128 @@ class BacktrackingTestCase(TestCase):
 				self.assertEqual(test_case.test_success, True, test_case.fail_msg)
 		finally:
 			playground.cleanup()
+
+	def testBacktrackingJobs(self):
+		"""
+		With --backtrack-jobs, runs are tried in parallel worker
+		processes, and their results are passed back to the Backtracker.
+		"""
+
+		ebuilds = {
+			"dev-libs/D-1": {},
+			"dev-libs/D-2": {},
+			"dev-libs/E-1": { "RDEPEND": "<=dev-libs/D-1" },
+			}
+
+		installed = {
+			"dev-libs/D-1": { "USE": "" },
+			"dev-libs/E-1": { "USE": "", "RDEPEND": "<=dev-libs/D-1" },
+			}
+
+		test_cases = (
+				ResolverPlaygroundTestCase(
+					["dev-libs/D", "dev-libs/E"],
+					options = { "--backtrack-jobs": 4, "--update": True,
+						"--deep": True, "--selective": True },
+					all_permutations = True,
+					mergelist = [],
+					success = True),
+			)
+
+		playground = ResolverPlayground(ebuilds=ebuilds, installed=installed)
+
+		try:
+			self._checkBacktrackingJobs(playground, test_cases)
+		finally:
+			playground.cleanup()
+
+	def testBacktrackingJobsOrder(self):
+		"""
+		The runs that are tried ahead of time have to wait until they are
+		next in depth first order. Here, the first of the two runs for the
+		slot conflict of dev-libs/A adds new runs, which are tried before
+		the second one.
+		"""
+
+		ebuilds = {
+			"dev-libs/A-1": {},
+			"dev-libs/A-2": {},
+			"dev-libs/B-0": {},
+			"dev-libs/B-1": { "DEPEND": "=dev-libs/A-2" },
+			"dev-libs/C-0": {},
+			"dev-libs/C-1": { "DEPEND": "=dev-libs/A-1" },
+			"dev-libs/X-1": {},
+			"dev-libs/X-2": {},
+			"dev-libs/Y-0": {},
+			"dev-libs/Y-1": { "DEPEND": "=dev-libs/X-2" },
+			"dev-libs/Z-0": {},
+			"dev-libs/Z-1": { "DEPEND": "=dev-libs/X-1" },
+			}
+
+		test_cases = (
+				ResolverPlaygroundTestCase(
+					["dev-libs/B", "dev-libs/C", "dev-libs/Y", "dev-libs/Z"],
+					options = { "--backtrack-jobs": 4 },
+					mergelist = ["dev-libs/X-1", "dev-libs/A-1", "dev-libs/B-0",
+						"dev-libs/Y-0", "dev-libs/C-1", "dev-libs/Z-1"],
+					ignore_mergelist_order = True,
+					success = True),
+			)
+
+		playground = ResolverPlayground(ebuilds=ebuilds)
+
+		try:
+			worker_results = self._checkBacktrackingJobs(playground, test_cases)
+			# Make sure that the runs weren't all repeated in-process.
+			self.assertTrue(worker_results)
+		finally:
+			playground.cleanup()
+
+	def _checkBacktrackingJobs(self, playground, test_cases):
+		"""
+		Run each test case with its --backtrack-jobs option, and check that
+		the Backtracker got the same feedback, in the same order, as without
+		--backtrack-jobs, and that none of the workers failed. Returns the
+		results of the workers.
+		"""
+		feedback = []
+		worker_results = []
+
+		def backtracker_feedback(backtracker, infos, node=None):
+			if node is None:
+				node = backtracker._current_node
+			feedback.append(node.parameter)
+			return orig_feedback(backtracker, infos, node=node)
+
+		def run_backtrack_jobs(parameters, run, codec):
+			results = orig_run_backtrack_jobs(parameters, run, codec)
+			worker_results.extend(results)
+			return results
+
+		orig_feedback = Backtracker.feedback
+		orig_run_backtrack_jobs = _emerge.depgraph.run_backtrack_jobs
+		Backtracker.feedback = backtracker_feedback
+		_emerge.depgraph.run_backtrack_jobs = run_backtrack_jobs
+		try:
+			for test_case in test_cases:
+				options = test_case.options
+				test_case.options = options.copy()
+				del test_case.options["--backtrack-jobs"]
+				try:
+					playground.run_TestCase(test_case)
+				finally:
+					test_case.options = options
+				self.assertEqual(test_case.test_success, True, test_case.fail_msg)
+				sequential_feedback = feedback[:]
+				del feedback[:]
+
+				playground.run_TestCase(test_case)
+				self.assertEqual(test_case.test_success, True, test_case.fail_msg)
+				self.assertEqual(feedback, sequential_feedback)
+				del feedback[:]
+		finally:
+			Backtracker.feedback = orig_feedback
+			_emerge.depgraph.run_backtrack_jobs = orig_run_backtrack_jobs
+
+		self.assertTrue(None not in worker_results)
+		return worker_results
@@ -0,0 +1,108 @@
+# Copyright 2011 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from portage import os
+from portage.const import CACHE_PATH
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import (ResolverPlayground,
+	ResolverPlaygroundTestCase)
+from _emerge.BlockerCache import BlockerCache
+
+class BlockerCacheTestCase(TestCase):
+
+	def testBlockerCacheIndex(self):
+		ebuilds = {
+			"dev-libs/A-1": { "RDEPEND": "!dev-libs/B" },
+			"dev-libs/B-1": { },
+			"dev-libs/C-1": { "RDEPEND": "!dev-libs/D !<dev-libs/B-1" },
+			"dev-libs/D-1": { },
+			"dev-libs/E-1": { },
+			}
+		installed = {
+			"dev-libs/A-1": { "RDEPEND": "!dev-libs/B" },
+			"dev-libs/C-1": { "RDEPEND": "!dev-libs/D !<dev-libs/B-1" },
+			"dev-libs/E-1": { },
+			}
+
+		test_cases = (
+			ResolverPlaygroundTestCase(
+				["dev-libs/E"],
+				success = True,
+				mergelist = ["dev-libs/E-1"]),
+			# The installed packages that block these are uninstalled.
+			ResolverPlaygroundTestCase(
+				["dev-libs/B"],
+				success = True,
+				mergelist = ["dev-libs/B-1", "dev-libs/A-1", "!dev-libs/B"]),
+			ResolverPlaygroundTestCase(
+				["dev-libs/D"],
+				success = True,
+				mergelist = ["dev-libs/D-1", "dev-libs/C-1", "!dev-libs/D"]),
+			)
+
+		playground = ResolverPlayground(ebuilds=ebuilds, installed=installed)
+		cache_threshold = BlockerCache._cache_threshold
+		try:
+			vardb = playground.trees[playground.root]["vartree"].dbapi
+			cache_dir = os.path.join(vardb.settings["EROOT"], CACHE_PATH)
+			if not os.path.isdir(cache_dir):
+				os.makedirs(cache_dir)
+
+			# Resolve once to populate the cache, and then again
+			# with the cache loaded from disk.
+			BlockerCache._cache_threshold = 0
+			for i in range(2):
+				for test_case in test_cases:
+					playground.run_TestCase(test_case)
+					self.assertEqual(test_case.test_success, True,
+						test_case.fail_msg)
+			BlockerCache._cache_threshold = cache_threshold
+			self.assertTrue(os.path.exists(os.path.join(cache_dir,
+				"vdb_blockers_index.pickle")))
+
+			blocker_cache = BlockerCache(None, vardb)
+			blocker_cache._cache_threshold = 0
+			for cpv in vardb.cpv_all():
+				counter = 1
+				atoms = [x for x in vardb.aux_get(cpv, ["RDEPEND"])[0].split() \
+					if x.startswith("!")]
+				blocker_cache[cpv] = blocker_cache.BlockerData(counter, atoms)
+			self.assertEqual(blocker_cache.get_blocking_cpvs(["dev-libs/B"]),
+				set(["dev-libs/A-1", "dev-libs/C-1"]))
+			self.assertEqual(blocker_cache.get_blocking_cpvs(["dev-libs/D"]),
+				set(["dev-libs/C-1"]))
+			self.assertEqual(blocker_cache.get_blocking_cpvs(["dev-libs/E"]),
+				set())
+			blocker_cache.flush()
+
+			# The index is loaded from disk by a new instance.
+			blocker_cache = BlockerCache(None, vardb)
+			self.assertEqual(blocker_cache.get_blocking_cpvs(
+				["dev-libs/B", "dev-libs/D"]),
+				set(["dev-libs/A-1", "dev-libs/C-1"]))
+
+			# The index is updated along with the cache.
+			counter = blocker_cache["dev-libs/A-1"].counter
+			blocker_cache["dev-libs/A-1"] = \
+				blocker_cache.BlockerData(counter + 1, ["!dev-libs/E"])
+			del blocker_cache["dev-libs/C-1"]
+			self.assertEqual(blocker_cache.get_blocking_cpvs(
+				["dev-libs/B", "dev-libs/D"]), set())
+			self.assertEqual(blocker_cache.get_blocking_cpvs(["dev-libs/E"]),
+				set(["dev-libs/A-1"]))
+
+			# An entry with a different COUNTER is indexed again when
+			# the index on disk is out of date.
+			blocker_cache._cache_threshold = 0
+			blocker_cache._index_filename += ".new"
+			blocker_cache.flush()
+			blocker_cache = BlockerCache(None, vardb)
+			self.assertEqual(blocker_cache["dev-libs/A-1"].counter,
+				counter + 1)
+			self.assertEqual(blocker_cache.get_blocking_cpvs(
+				["dev-libs/B", "dev-libs/D"]), set())
+			self.assertEqual(blocker_cache.get_blocking_cpvs(["dev-libs/E"]),
+				set(["dev-libs/A-1"]))
+		finally:
+			BlockerCache._cache_threshold = cache_threshold
+			playground.cleanup()
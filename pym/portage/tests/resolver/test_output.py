@@ -1,8 +1,12 @@
 # Copyright 2010 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
+import portage
 from portage.tests import TestCase
 from portage.tests.resolver.ResolverPlayground import ResolverPlayground, ResolverPlaygroundTestCase
+from _emerge.create_depgraph_params import create_depgraph_params
+from _emerge.depgraph import backtrack_depgraph
+from _emerge.resolver.output import Display
 
 class MergelistOutputTestCase(TestCase):
 
@@ -86,3 +90,47 @@ class MergelistOutputTestCase(TestCase):
 				self.assertEqual(test_case.test_success, True, test_case.fail_msg)
 		finally:
 			playground.cleanup()
+
+	def testMergelistStreaming(self):
+		"""
+		Each entry is written as soon as it has been formatted, rather
+		than after the whole merge list has been formatted.
+		"""
+		ebuilds = {
+			"dev-libs/A-1": { "DEPEND": "dev-libs/B" },
+			"dev-libs/B-1": { "DEPEND": "dev-libs/C" },
+			"dev-libs/C-1": { },
+			}
+
+		events = []
+		class _Display(Display):
+			def set_pkg_info(self, pkg, ordered):
+				events.append(("format", pkg.cpv))
+				return Display.set_pkg_info(self, pkg, ordered)
+			def print_message(self, msg):
+				events.append(("print",))
+				return Display.print_message(self, msg)
+
+		playground = ResolverPlayground(ebuilds=ebuilds)
+		global_noiselimit = portage.util.noiselimit
+		try:
+			for myopts in ({}, {"--verbose": True}, {"--tree": True}):
+				myopts["--pretend"] = True
+				myparams = create_depgraph_params(myopts, None)
+				success, mydepgraph, favorites = backtrack_depgraph(
+					playground.settings, playground.trees, myopts, myparams,
+					None, ["dev-libs/A"], None)
+				self.assertEqual(success, True)
+				mylist = mydepgraph.altlist()
+				del events[:]
+				portage.util.noiselimit = -2
+				try:
+					_Display()(mydepgraph, mylist, favorites)
+				finally:
+					portage.util.noiselimit = global_noiselimit
+				# With --tree, packages may be shown more than once.
+				self.assertTrue(len(events) >= 2 * len(mylist))
+				self.assertEqual([x[0] for x in events],
+					["format", "print"] * (len(events) // 2))
+		finally:
+			playground.cleanup()
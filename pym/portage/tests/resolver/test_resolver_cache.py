@@ -0,0 +1,90 @@
+# Copyright 2011 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from portage import os
+from portage.const import VDB_PATH
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+from _emerge.create_depgraph_params import create_depgraph_params
+from _emerge.depgraph import backtrack_depgraph, cached_depgraph
+from _emerge.ResolverCache import ResolverCache
+
+class ResolverCacheTestCase(TestCase):
+
+	def testResolverCache(self):
+		ebuilds = {
+			"dev-libs/A-1": { "DEPEND": "dev-libs/B" },
+			"dev-libs/B-1": { },
+			"dev-libs/C-1": { },
+			}
+		installed = {
+			"dev-libs/C-1": { },
+			}
+
+		playground = ResolverPlayground(ebuilds=ebuilds, installed=installed)
+		try:
+			settings = playground.settings
+			trees = playground.trees
+			myfiles = ["dev-libs/A"]
+			myopts = {"--pretend": True}
+			myparams = create_depgraph_params(myopts, None)
+
+			cache = ResolverCache(settings, trees)
+			digest = cache.get_digest(None, myfiles, myopts)
+			self.assertEqual(cache.get(digest), None)
+
+			success, mydepgraph, favorites = backtrack_depgraph(settings,
+				trees, myopts, myparams, None, myfiles, None)
+			self.assertEqual(success, True)
+			mergelist = [x.cpv for x in mydepgraph.altlist()]
+			self.assertEqual(mergelist, ["dev-libs/B-1", "dev-libs/A-1"])
+			cache.store(digest, mydepgraph.altlist(), favorites)
+
+			# The entry is loaded from disk by a new instance.
+			cache = ResolverCache(settings, trees)
+			self.assertEqual(cache.get_digest(None, myfiles, myopts), digest)
+			resume_data = cache.get(digest)
+			self.assertEqual([x[2] for x in resume_data["mergelist"]],
+				mergelist)
+			self.assertEqual(resume_data["favorites"], ["dev-libs/A"])
+
+			success, mydepgraph = cached_depgraph(settings, trees,
+				myopts, myparams, resume_data, None)
+			self.assertEqual(success, True)
+			self.assertEqual([x.cpv for x in mydepgraph.altlist()], mergelist)
+
+			# Display options don't matter, unlike arguments and options
+			# that affect dependency calculation.
+			self.assertEqual(cache.get_digest(None, myfiles,
+				{"--pretend": True, "--verbose": True}), digest)
+			self.assertNotEqual(cache.get_digest(None, myfiles,
+				{"--pretend": True, "--update": True}), digest)
+			self.assertNotEqual(cache.get_digest(None,
+				["dev-libs/C"], myopts), digest)
+
+			# A sync, which updates metadata/timestamp.chk, invalidates
+			# the entry.
+			metadata_dir = os.path.join(playground.portdir, "metadata")
+			if not os.path.isdir(metadata_dir):
+				os.makedirs(metadata_dir)
+			f = open(os.path.join(metadata_dir, "timestamp.chk"), "w")
+			f.write("Tue, 01 Nov 2011 00:00:00 +0000\n")
+			f.close()
+			new_digest = cache.get_digest(None, myfiles, myopts)
+			self.assertNotEqual(new_digest, digest)
+
+			# So does a package merge, which increments the COUNTER.
+			vardb = trees[playground.root]["vartree"].dbapi
+			f = open(vardb._counter_path, "w")
+			f.write("1000")
+			f.close()
+			digest = cache.get_digest(None, myfiles, myopts)
+			self.assertNotEqual(digest, new_digest)
+
+			# And an unmerge, which updates the mtime of the vdb.
+			vdb_path = os.path.join(playground.eroot, VDB_PATH)
+			os.utime(vdb_path, (0, 0))
+			self.assertNotEqual(cache.get_digest(None, myfiles, myopts),
+				digest)
+		finally:
+			playground.cleanup()
@@ -0,0 +1,201 @@
+# Copyright 2011 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import io
+import signal
+import socket
+import sys
+import time
+
+import _emerge.depgraph
+from portage import os
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+from portage.util import writemsg_stdout
+from portage.util.mtimedb import MtimeDB
+from _emerge.create_depgraph_params import create_depgraph_params
+from _emerge.depgraph import backtrack_depgraph
+from _emerge.main import parse_opts
+from _emerge.ResolverDaemon import ResolverDaemon, resolver_client
+
+class _ResolverDaemon(ResolverDaemon):
+	"""
+	Report the number of loads and the merge list, instead of running
+	emerge_main(), which testResolverDaemonEmergeMain covers.
+	"""
+
+	_request_timeout = 1
+
+	def __init__(self, socket_path, load_config):
+		ResolverDaemon.__init__(self, socket_path, load_config=load_config)
+		self._loads = 0
+
+	def _load(self):
+		self._loads += 1
+		ResolverDaemon._load(self)
+
+	def _run(self, args):
+		settings, trees, mtimedb = self._config
+		frozen_config = _emerge.depgraph._preloaded_frozen_config
+		myaction, myopts, myfiles = parse_opts(args, silent=True)
+		myparams = create_depgraph_params(myopts, myaction)
+		success, mydepgraph, favorites = backtrack_depgraph(settings,
+			trees, myopts, myparams, myaction, myfiles, None)
+		writemsg_stdout("loads=%s preloaded=%s mergelist=%s\n" % \
+			(self._loads, mydepgraph._frozen_config is frozen_config,
+			" ".join(x.cpv for x in mydepgraph.altlist())), noiselevel=-1)
+		if success:
+			return os.EX_OK
+		return 1
+
+class ResolverDaemonTestCase(TestCase):
+
+	def _request(self, socket_path, args):
+		stdout = sys.stdout
+		output = io.BytesIO()
+		if sys.hexversion >= 0x3000000:
+			sys.stdout = io.TextIOWrapper(output)
+		else:
+			sys.stdout = output
+		try:
+			retval = resolver_client(socket_path, args)
+			output = output.getvalue()
+		finally:
+			sys.stdout = stdout
+		return retval, output.decode("ascii")
+
+	def _start(self, daemon, socket_path):
+		pid = os.fork()
+		if pid == 0:
+			try:
+				null_fd = os.open(os.devnull, os.O_WRONLY)
+				os.dup2(null_fd, 2)
+				daemon.serve()
+			finally:
+				os._exit(1)
+
+		for i in range(100):
+			if os.path.exists(socket_path):
+				break
+			time.sleep(0.1)
+		return pid
+
+	def testResolverDaemon(self):
+		ebuilds = {
+			"dev-libs/A-1": { "DEPEND": "dev-libs/B" },
+			"dev-libs/B-1": { },
+			}
+
+		playground = ResolverPlayground(ebuilds=ebuilds)
+		socket_path = os.path.join(playground.eroot, "resolver.socket")
+		settings = playground.settings
+		trees = playground.trees
+		daemon = _ResolverDaemon(socket_path,
+			lambda: (settings, trees, {"updates": {}}))
+		pid = None
+		try:
+			# The daemon is not running.
+			self.assertEqual(resolver_client(socket_path,
+				["--pretend", "dev-libs/A"]), None)
+
+			pid = self._start(daemon, socket_path)
+
+			retval, output = self._request(socket_path,
+				["--pretend", "dev-libs/A"])
+			self.assertEqual(retval, os.EX_OK)
+			self.assertEqual(output, "loads=1 preloaded=True " + \
+				"mergelist=dev-libs/B-1 dev-libs/A-1\n")
+
+			# Display options don't need a new frozen config.
+			retval, output = self._request(socket_path,
+				["--pretend", "--verbose", "dev-libs/B"])
+			self.assertEqual(retval, os.EX_OK)
+			self.assertEqual(output, "loads=1 preloaded=True " + \
+				"mergelist=dev-libs/B-1\n")
+
+			# A client that never finishes its request doesn't
+			# stall the others.
+			stuck = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			try:
+				stuck.connect(socket_path)
+				stuck.sendall(b"{")
+				retval, output = self._request(socket_path,
+					["--pretend", "dev-libs/B"])
+				self.assertEqual(retval, os.EX_OK)
+				self.assertEqual(output, "loads=1 preloaded=True " + \
+					"mergelist=dev-libs/B-1\n")
+			finally:
+				stuck.close()
+
+			# Requests that do more than dependency calculation
+			# are left to the client.
+			self.assertEqual(resolver_client(socket_path,
+				["dev-libs/A"]), None)
+			self.assertEqual(resolver_client(socket_path,
+				["--pretend", "--fetchonly", "dev-libs/A"]), None)
+
+			# A package merge causes the state to be reloaded.
+			vardb = trees[playground.root]["vartree"].dbapi
+			f = open(vardb._counter_path, "w")
+			f.write("1000")
+			f.close()
+			retval, output = self._request(socket_path,
+				["--pretend", "dev-libs/A"])
+			self.assertEqual(retval, os.EX_OK)
+			self.assertEqual(output, "loads=2 preloaded=True " + \
+				"mergelist=dev-libs/B-1 dev-libs/A-1\n")
+		finally:
+			if pid is not None:
+				os.kill(pid, signal.SIGTERM)
+				os.waitpid(pid, 0)
+			playground.cleanup()
+
+	def testResolverDaemonEmergeMain(self):
+		"""
+		Run a request through emerge_main(), and check that the
+		depgraph uses the frozen config that the daemon has preloaded.
+		"""
+		ebuilds = {
+			"dev-libs/A-1": { "DEPEND": "dev-libs/B" },
+			"dev-libs/B-1": { },
+			}
+
+		playground = ResolverPlayground(ebuilds=ebuilds)
+		socket_path = os.path.join(playground.eroot, "resolver.socket")
+		settings = playground.settings
+		trees = playground.trees
+		mtimedb = MtimeDB(os.path.join(playground.eroot, "mtimedb"))
+		daemon = ResolverDaemon(socket_path,
+			load_config=lambda: (settings, trees, mtimedb))
+
+		def get_frozen_config(settings, trees, myopts, spinner):
+			preloaded = _emerge.depgraph._preloaded_frozen_config
+			frozen_config = orig_get_frozen_config(settings, trees,
+				myopts, spinner)
+			writemsg_stdout("preloaded=%s\n" % \
+				(preloaded is not None and frozen_config is preloaded,),
+				noiselevel=-1)
+			return frozen_config
+
+		orig_get_frozen_config = _emerge.depgraph._get_frozen_config
+		pid = None
+		try:
+			# The daemon process inherits the wrapper.
+			_emerge.depgraph._get_frozen_config = get_frozen_config
+			try:
+				pid = self._start(daemon, socket_path)
+			finally:
+				_emerge.depgraph._get_frozen_config = orig_get_frozen_config
+
+			retval, output = self._request(socket_path,
+				["--pretend", "dev-libs/A"])
+			self.assertEqual(retval, os.EX_OK, output)
+			self.assertTrue("preloaded=True\n" in output, output)
+			self.assertTrue("preloaded=False" not in output, output)
+			self.assertTrue("dev-libs/B-1" in output, output)
+			self.assertTrue("dev-libs/A-1" in output, output)
+		finally:
+			if pid is not None:
+				os.kill(pid, signal.SIGTERM)
+				os.waitpid(pid, 0)
+			playground.cleanup()
@@ -0,0 +1,68 @@
+# Copyright 2011 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+import json
+import tempfile
+
+from portage import os
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import ResolverPlayground
+from _emerge.create_depgraph_params import create_depgraph_params
+from _emerge.depgraph import _frozen_depgraph_config, depgraph
+from _emerge.resolver.profiling import ResolverProfile
+
+class ResolverProfileTestCase(TestCase):
+
+	def testResolverProfile(self):
+		ebuilds = {
+			"dev-libs/A-1": { "DEPEND": "dev-libs/B", "RDEPEND": "|| ( dev-libs/C dev-libs/D )" },
+			"dev-libs/B-1": { "RDEPEND": "dev-libs/C" },
+			"dev-libs/C-1": { },
+			"dev-libs/D-1": { },
+			}
+
+		playground = ResolverPlayground(ebuilds=ebuilds)
+		fd, filename = tempfile.mkstemp(suffix=".json")
+		os.close(fd)
+		try:
+			myopts = {"--pretend": True}
+			myparams = create_depgraph_params(myopts, None)
+			frozen_config = _frozen_depgraph_config(playground.settings,
+				playground.trees, myopts, None)
+			profile = ResolverProfile()
+			frozen_config._profile = profile
+			mydepgraph = depgraph(playground.settings, playground.trees,
+				myopts, myparams, None, frozen_config=frozen_config)
+			success, favorites = mydepgraph.select_files(["dev-libs/A"])
+			self.assertEqual(success, True)
+			self.assertEqual([x.cpv for x in mydepgraph.altlist()],
+				["dev-libs/C-1", "dev-libs/B-1", "dev-libs/A-1"])
+
+			profile.write(filename)
+			f = open(filename)
+			try:
+				stats = json.load(f)
+			finally:
+				f.close()
+
+			phases = stats["phases"]
+			self.assertEqual(sorted(phases), sorted(ResolverProfile.phases))
+			self.assertEqual(phases["select_files"]["calls"], 1)
+			self.assertEqual(phases["_create_graph"]["calls"], 1)
+			self.assertEqual(phases["_serialize_tasks"]["calls"], 1)
+			self.assertEqual(phases["_add_pkg_deps"]["calls"], 3)
+			for phase in phases.values():
+				self.assertTrue(phase["time"] >= 0)
+			self.assertTrue(phases["select_files"]["time"] >=
+				phases["_create_graph"]["time"])
+
+			caches = stats["caches"]
+			for name in ("_highest_pkg_cache", "_dep_check_composite_db"):
+				cache = caches[name]
+				self.assertTrue(cache["hits"] + cache["misses"] > 0)
+				self.assertEqual(cache["hit_ratio"], float(cache["hits"]) /
+					(cache["hits"] + cache["misses"]))
+			self.assertTrue(isinstance(stats["lru_caches"], dict))
+		finally:
+			os.unlink(filename)
+			playground.cleanup()
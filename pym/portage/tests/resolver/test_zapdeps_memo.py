@@ -0,0 +1,71 @@
+# Copyright 2011 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from portage.tests import TestCase
+from portage.tests.resolver.ResolverPlayground import (ResolverPlayground,
+	ResolverPlaygroundTestCase)
+from _emerge.create_depgraph_params import create_depgraph_params
+from _emerge.depgraph import backtrack_depgraph
+
+class ZapdepsMemoTestCase(TestCase):
+
+	def testZapdepsMemo(self):
+		ebuilds = {
+			"dev-libs/A-1": { "RDEPEND": "|| ( dev-libs/X dev-libs/Y )" },
+			"dev-libs/B-1": { "RDEPEND": "|| ( dev-libs/X dev-libs/Y )" },
+			"dev-libs/C-1": { "RDEPEND": "|| ( dev-libs/X dev-libs/Y )" },
+			"dev-libs/D-1": { "RDEPEND": "|| ( dev-libs/X dev-libs/Y )" },
+			"dev-libs/E-1": { "RDEPEND": "dev-libs/Y" },
+			"dev-libs/X-1": { },
+			"dev-libs/Y-1": { },
+			"dev-libs/Z-1": { },
+			"dev-libs/Z-2": { },
+			"dev-libs/W-1": { "RDEPEND": "|| ( dev-libs/Z dev-libs/X )" },
+			}
+		installed = {
+			"dev-libs/Z-1": { },
+			}
+
+		test_cases = (
+			ResolverPlaygroundTestCase(
+				["dev-libs/A", "dev-libs/B", "dev-libs/C", "dev-libs/D"],
+				success = True,
+				ignore_mergelist_order = True,
+				mergelist = ["dev-libs/X-1", "dev-libs/A-1", "dev-libs/B-1",
+					"dev-libs/C-1", "dev-libs/D-1"]),
+
+			# A package that is pulled into the graph changes
+			# the choices that were made before.
+			ResolverPlaygroundTestCase(
+				["dev-libs/E", "dev-libs/A", "dev-libs/B"],
+				success = True,
+				ignore_mergelist_order = True,
+				mergelist = ["dev-libs/Y-1", "dev-libs/E-1", "dev-libs/A-1",
+					"dev-libs/B-1"]),
+
+			ResolverPlaygroundTestCase(
+				["dev-libs/W", "dev-libs/A"],
+				success = True,
+				ignore_mergelist_order = True,
+				mergelist = ["dev-libs/X-1", "dev-libs/W-1", "dev-libs/A-1"]),
+			)
+
+		playground = ResolverPlayground(ebuilds=ebuilds, installed=installed)
+		try:
+			for test_case in test_cases:
+				playground.run_TestCase(test_case)
+				self.assertEqual(test_case.test_success, True, test_case.fail_msg)
+
+			# The same || dep is evaluated for each parent, so the
+			# choice is reused once dev-libs/X is in the graph.
+			myopts = {"--pretend": True}
+			myparams = create_depgraph_params(myopts, None)
+			success, mydepgraph, favorites = backtrack_depgraph(
+				playground.settings, playground.trees, myopts, myparams,
+				None, ["dev-libs/A", "dev-libs/B", "dev-libs/C", "dev-libs/D"],
+				None)
+			self.assertEqual(success, True)
+			memos = mydepgraph._dynamic_config._zapdeps_memos
+			self.assertTrue(sum(memo.hits for memo in memos) > 0)
+		finally:
+			playground.cleanup()
@@ -2,7 +2,7 @@
 # Distributed under the terms of the GNU General Public License v2
 
 from portage.tests import TestCase
-from portage.util.digraph import digraph
+from portage.util.digraph import compact_digraph, digraph
 #~ from portage.util import noiselimit
 import portage.util
 
@@ -199,3 +199,190 @@ class DigraphTest(TestCase):
 		self.assertEqual(g.root_nodes(), ["B"])
 		self.assertEqual(g.root_nodes(ignore_priority=always_false), ["B"])
 		self.assertEqual(g.root_nodes(ignore_priority=always_true), ["A", "B"])
+
+	def testDigraphStronglyConnectedComponents(self):
+		g = digraph()
+		g.add("B", "A")
+		g.add("C", "B")
+		g.add("A", "C", 1)
+		g.add("D", "C")
+		g.add("E", "D", 1)
+		g.add("D", "E", 1)
+		g.add("F", "F", 1)
+
+		components = g.strongly_connected_components()
+		self.assertEqual(sorted(sorted(x) for x in components),
+			[["A", "B", "C"], ["D", "E"], ["F"]])
+		# Components come after the components that they have edges to.
+		self.assertEqual(sorted(components[0]), ["D", "E"])
+		self.assertEqual(sorted(components[1]), ["A", "B", "C"])
+
+		components = g.strongly_connected_components(ignore_priority=0)
+		self.assertEqual(sorted(sorted(x) for x in components),
+			[["A"], ["B"], ["C"], ["D", "E"], ["F"]])
+
+		components = g.strongly_connected_components(
+			nodes=set(["A", "B", "D", "E"]))
+		self.assertEqual(sorted(sorted(x) for x in components),
+			[["A"], ["B"], ["D", "E"]])
+
+		cycles = g.get_cycles()
+		self.assertEqual(len(cycles), 6)
+		self.assertEqual(set(tuple(x) for x in cycles),
+			set([("B", "C", "A"), ("C", "A", "B"), ("A", "B", "C"),
+			("E", "D"), ("D", "E"), ("F",)]))
+		self.assertEqual(sorted(g.get_cycles(max_length=2)),
+			[["D", "E"], ["E", "D"], ["F"]])
+		self.assertEqual(sorted(g.get_cycles(ignore_priority=0)),
+			[["D", "E"], ["E", "D"], ["F"]])
+
+		# Deep components don't hit the recursion limit.
+		g = digraph()
+		for i in range(1, 5000):
+			g.add(i + 1, i)
+		g.add(1, 5000)
+		self.assertEqual(len(g.strongly_connected_components()), 1)
+		self.assertEqual(len(g.get_cycles(max_length=10)), 0)
+
+	def testCompactDigraph(self):
+		g = digraph()
+		g.add("B", "A", -1)
+		g.add("C", "A", 1)
+		g.add("C", "A", 0)
+		g.add("D", "B")
+		g.add("D", "C", -1)
+		g.add("A", "D", -2)
+		g.add("E", None)
+
+		x = compact_digraph.from_digraph(g)
+		self.assertEqual(x.order, g.order)
+		self.assertEqual(x.get_priorities("C", "A"), [0, 1])
+		self.assertRaises(KeyError, x.get_priorities, "A", "C")
+		for ignore_priority in (None, -2, -1, 0, 1,
+			lambda priority: priority < 0):
+			self.assertEqual(x.leaf_nodes(ignore_priority),
+				g.leaf_nodes(ignore_priority))
+			self.assertEqual(x.root_nodes(ignore_priority),
+				g.root_nodes(ignore_priority))
+			for node in g:
+				self.assertEqual(x.child_nodes(node, ignore_priority),
+					g.child_nodes(node, ignore_priority))
+				self.assertEqual(x.parent_nodes(node, ignore_priority),
+					g.parent_nodes(node, ignore_priority))
+			self.assertEqual(x.get_cycles(ignore_priority),
+				g.get_cycles(ignore_priority))
+
+		# Clones are independent, and their edges stay in the same
+		# order as those of a digraph with the same changes.
+		y = x.clone()
+		h = g.clone()
+		for graph in y, h:
+			graph.remove("D")
+			graph.remove_edge("C", "A")
+			graph.add("E", "A", 2)
+		self.assertEqual(y.all_nodes(), ["B", "A", "C", "E"])
+		self.assertEqual(sorted(y.child_nodes("A")), ["B", "E"])
+		self.assertEqual(y.leaf_nodes(), ["B", "C", "E"])
+		for node in h:
+			self.assertEqual(y.child_nodes(node), h.child_nodes(node))
+			self.assertEqual(y.parent_nodes(node), h.parent_nodes(node))
+		self.assertEqual(sorted(x.child_nodes("A")), ["B", "C"])
+		self.assertEqual(x.child_nodes("A"), g.child_nodes("A"))
+		self.assertEqual(x.parent_nodes("D"), g.parent_nodes("D"))
+		self.assertEqual(x.contains("D"), True)
+		self.assertEqual("D" in y, False)
+		self.assertEqual(y.get("D", "default"), "default")
+
+		x.difference_update(["A", "E"])
+		self.assertEqual(x.all_nodes(), ["B", "C", "D"])
+		self.assertEqual(x.root_nodes(), ["B", "C"])
+		self.assertEqual(x.leaf_nodes(), ["D"])
+		self.assertRaises(KeyError, x.remove, "A")
+		x.delnode("A")
+		x.difference_update(["B", "C", "D"])
+		self.assertEqual(bool(x), False)
+		self.assertEqual(x.is_empty(), True)
+
+	def testCompactDigraphTrackDegrees(self):
+		def ignore_soft(priority):
+			return priority < 1
+
+		x = compact_digraph()
+		x.add("B", "A", 1)
+		x.add("C", "A", 0)
+		x.add("C", "B", 1)
+		x.add("D", "C", 0)
+		x.track_degrees([None, 0, ignore_soft])
+
+		y = x.clone()
+		for g in x, y:
+			self.assertEqual(g.leaf_nodes(), ["D"])
+			self.assertEqual(g.leaf_nodes(0), ["C", "D"])
+			self.assertEqual(g.leaf_nodes(ignore_soft), ["C", "D"])
+			self.assertEqual(g.root_nodes(), ["A"])
+			self.assertEqual(g.root_nodes(ignore_soft), ["A", "D"])
+			self.assertEqual(g.child_nodes("A", ignore_priority=ignore_soft),
+				["B"])
+
+		# The counters are updated as the graph changes.
+		x.add("A", "D", 2)
+		self.assertEqual(x.leaf_nodes(), [])
+		self.assertEqual(x.leaf_nodes(0), ["C"])
+		self.assertEqual(x.root_nodes(ignore_soft), ["D"])
+		x.add("E", "C", 2)
+		self.assertEqual(x.leaf_nodes(0), ["E"])
+		x.remove("C")
+		self.assertEqual(x.leaf_nodes(), ["B", "E"])
+		self.assertEqual(x.root_nodes(), ["D", "E"])
+		x.remove_edge("A", "D")
+		self.assertEqual(x.root_nodes(ignore_soft), ["A", "D", "E"])
+		x.difference_update(["A", "D"])
+		self.assertEqual(x.leaf_nodes(0), ["B", "E"])
+		self.assertEqual(x.root_nodes(0), ["B", "E"])
+
+		# The clone isn't affected.
+		self.assertEqual(y.all_nodes(), ["B", "A", "C", "D"])
+		self.assertEqual(y.leaf_nodes(), ["D"])
+
+	def testCompactDigraphPriorities(self):
+		"""
+		Priorities that share a bit, since their attributes have the
+		same truth values, are still returned as they were added.
+		"""
+		class priority(object):
+			__slots__ = ("satisfied",)
+
+			def __init__(self, satisfied):
+				self.satisfied = satisfied
+
+			def __lt__(self, other):
+				return False
+
+		b1 = priority("dev-libs/B-1")
+		b2 = priority("dev-libs/B-2")
+		g = digraph()
+		g.add("B", "A", b1)
+		x = compact_digraph.from_digraph(g)
+		y = x.clone()
+		y.add("C", "A", b2)
+		y.add("B", "A", b2)
+		self.assertEqual(len(y._priority_table.priorities), 1)
+
+		priorities = x.get_priorities("B", "A")
+		self.assertEqual(len(priorities), 1)
+		self.assertEqual(priorities[0] is b1, True)
+		priorities = y.get_priorities("B", "A")
+		self.assertEqual(len(priorities), 2)
+		self.assertEqual(priorities[0] is b1, True)
+		self.assertEqual(priorities[1] is b2, True)
+		self.assertEqual(y.get_priorities("C", "A")[0] is b2, True)
+		self.assertRaises(KeyError, x.get_priorities, "C", "A")
+
+		# An edge that is added again only has the new priorities.
+		y.remove_edge("B", "A")
+		self.assertRaises(KeyError, y.get_priorities, "B", "A")
+		y.add("B", "A", b2)
+		priorities = y.get_priorities("B", "A")
+		self.assertEqual(len(priorities), 1)
+		self.assertEqual(priorities[0] is b2, True)
+		self.assertEqual(x.get_priorities("B", "A")[0] is b1, True)
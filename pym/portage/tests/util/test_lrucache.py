@@ -0,0 +1,50 @@
+# Copyright 2011 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+from portage.tests import TestCase
+from portage.util.lrucache import LRUCache, cache_stats, set_maxsize
+
+class LRUCacheTestCase(TestCase):
+
+	def testLRUCache(self):
+		cache = LRUCache(3)
+		for i in range(3):
+			cache[i] = str(i)
+		self.assertEqual(list(cache), [0, 1, 2])
+
+		# A lookup makes the entry the most recently used one.
+		self.assertEqual(cache[0], "0")
+		cache[3] = "3"
+		self.assertEqual(list(cache), [2, 0, 3])
+		self.assertFalse(1 in cache)
+		self.assertRaises(KeyError, cache.__getitem__, 1)
+		self.assertEqual(cache.get(1, "missing"), "missing")
+
+		# Values such as None are cached like any other value.
+		cache[4] = None
+		self.assertEqual(cache[4], None)
+		self.assertEqual(list(cache), [0, 3, 4])
+
+		del cache[3]
+		self.assertEqual(list(cache), [0, 4])
+		self.assertEqual(cache.stats(), {"hits": 2, "misses": 2,
+			"evictions": 2, "size": 2, "maxsize": 3})
+
+		cache.resize(1)
+		self.assertEqual(list(cache), [4])
+		cache.clear()
+		self.assertEqual(len(cache), 0)
+		self.assertEqual(list(cache), [])
+
+	def testRegistry(self):
+		cache = LRUCache(10, name="portage.tests.util.test_lrucache")
+		for i in range(5):
+			cache[i] = i
+		cache.get(0)
+		stats = cache_stats()["portage.tests.util.test_lrucache"]
+		self.assertEqual(stats["hits"], 1)
+		self.assertEqual(stats["size"], 5)
+
+		set_maxsize(2, name="portage.tests.util.test_lrucache")
+		self.assertEqual(cache.maxsize, 2)
+		self.assertEqual(list(cache), [4, 0])
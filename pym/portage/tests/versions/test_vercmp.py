@@ -3,7 +3,7 @@
 # Distributed under the terms of the GNU General Public License v2
 
 from portage.tests import TestCase
-from portage.versions import vercmp
+from portage.versions import vercmp, _vercmp_key
 
 class VerCmpTestCase(TestCase):
 	""" A simple testCase for portage.versions.vercmp()
@@ -78,3 +78,25 @@ class VerCmpTestCase(TestCase):
 		]
 		for test in tests:
 			self.assertFalse( vercmp( test[0], test[1]) == 0, msg="%s == %s? Wrong!" % (test[0],test[1]))
+
+	def testVerCmpKey(self):
+		"""
+		_vercmp_key() has to sort in the same order as vercmp()
+		"""
+		versions = ["1", "1.0", "1.0.0", "1.00", "1.01", "1.001", "1.010",
+			"1.1", "1.1b", "1.0b", "1.2", "1.10", "1.09", "1b", "1b_p1",
+			"1_p1", "1_p0", "1_pre", "1_pre1", "1_alpha", "1_beta2",
+			"1_rc1_p1", "1_rc1", "1.0-r0", "1.0-r1", "12.2.5", "12.2b",
+			"cvs.1", "cvs.9999", "9999", "0", "0.0",
+			"999999999999999999999999999999"]
+		for ver1 in versions:
+			key1 = _vercmp_key(ver1)
+			for ver2 in versions:
+				key2 = _vercmp_key(ver2)
+				result = vercmp(ver1, ver2)
+				self.assertEqual((key1 > key2) - (key1 < key2),
+					(result > 0) - (result < 0),
+					msg="%s vs %s? Wrong!" % (ver1, ver2))
+
+		self.assertEqual(_vercmp_key("1.0-r0"), _vercmp_key("1.0"))
+		self.assertEqual(_vercmp_key("1.0_foo"), None)
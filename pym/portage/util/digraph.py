@@ -1,7 +1,7 @@
 # Copyright 2010-2011 Gentoo Foundation
 # Distributed under the terms of the GNU General Public License v2
 
-__all__ = ['digraph']
+__all__ = ['compact_digraph', 'digraph']
 
 from collections import deque
 import sys
@@ -9,6 +9,9 @@ import sys
 from portage import _unicode_decode
 from portage.util import writemsg
 
+if sys.hexversion >= 0x3000000:
+	basestring = str
+
 class digraph(object):
 	"""
 	A directed graph object.
@@ -111,6 +114,14 @@ class digraph(object):
 		"""Checks if the digraph contains mynode"""
 		return node in self.nodes
 
+	def get_priorities(self, child, parent):
+		"""
+		Return a sorted list of the priorities of the edge in the
+		direction from child to parent. Raises KeyError if the
+		edge doesn't exist.
+		"""
+		return self.nodes[parent][0][child][:]
+
 	def get(self, key, default=None):
 		node_data = self.nodes.get(key, self)
 		if node_data is self:
@@ -259,6 +270,10 @@ class digraph(object):
 		except KeyError:
 			pass
 
+	def _unordered_nodes(self):
+		"""Iterate over the nodes in dict order, rather than self.order."""
+		return iter(self.nodes)
+
 	def firstzero(self):
 		leaf_nodes = self.leaf_nodes()
 		if leaf_nodes:
@@ -298,6 +313,14 @@ class digraph(object):
 			queue.extend([(n, child) for child in new])
 
 	def shortest_path(self, start, end, ignore_priority=None):
+		return self._shortest_path(start, end, ignore_priority)
+
+	def _shortest_path(self, start, end, ignore_priority=None,
+		max_length=None):
+		"""
+		Like shortest_path(), but gives up once the paths are longer
+		than 'max_length', since bfs() finds the shortest paths first.
+		"""
 		if start not in self:
 			raise KeyError(start)
 		elif end not in self:
@@ -306,20 +329,108 @@ class digraph(object):
 		paths = {None: []}
 		for parent, child in self.bfs(start, ignore_priority):
 			paths[child] = paths[parent] + [child]
+			if max_length and len(paths[child]) > max_length:
+				return None
 			if child == end:
 				return paths[child]
 		return None
 
+	def strongly_connected_components(self, ignore_priority=None,
+		nodes=None):
+		"""
+		Returns the strongly connected components of the graph, as lists
+		of nodes, using Tarjan's algorithm. Edges are filtered by
+		'ignore_priority', in the same way as for child_nodes(). If 'nodes'
+		is given, only the subgraph of these nodes is considered. The
+		components are returned in reverse topological order, so each
+		component comes after all the components that it has edges to.
+		"""
+		if nodes is None:
+			roots = self.order
+			def child_nodes(node):
+				return iter(self.child_nodes(node, ignore_priority))
+		else:
+			roots = [node for node in self.order if node in nodes]
+			def child_nodes(node):
+				return iter([child for child in
+					self.child_nodes(node, ignore_priority) if child in nodes])
+
+		index = {}
+		lowlink = {}
+		stack = []
+		on_stack = set()
+		components = []
+		for root in roots:
+			if root in index:
+				continue
+			index[root] = lowlink[root] = len(index)
+			stack.append(root)
+			on_stack.add(root)
+			# An explicit stack is used instead of recursion, since
+			# components can be deeper than the recursion limit.
+			work = [(root, child_nodes(root))]
+			while work:
+				node, children = work[-1]
+				for child in children:
+					if child not in index:
+						index[child] = lowlink[child] = len(index)
+						stack.append(child)
+						on_stack.add(child)
+						work.append((child, child_nodes(child)))
+						break
+					elif child in on_stack and index[child] < lowlink[node]:
+						lowlink[node] = index[child]
+				else:
+					work.pop()
+					if work:
+						parent = work[-1][0]
+						if lowlink[node] < lowlink[parent]:
+							lowlink[parent] = lowlink[node]
+					if lowlink[node] == index[node]:
+						component = []
+						while True:
+							member = stack.pop()
+							on_stack.remove(member)
+							component.append(member)
+							if member == node:
+								break
+						component.reverse()
+						components.append(component)
+		return components
+
 	def get_cycles(self, ignore_priority=None, max_length=None):
 		"""
 		Returns all cycles that have at most length 'max_length'.
 		If 'max_length' is 'None', all cycles are returned.
+
+		Since each cycle lies within a single strongly connected component,
+		only children in the same component as a node are searched, and
+		the searches stop at 'max_length' or at the length of the shortest
+		cycle that was already found for the node.
 		"""
+		component_ids = {}
+		for component_id, component in enumerate(
+			self.strongly_connected_components(ignore_priority)):
+			for node in component:
+				component_ids[node] = component_id
+
 		all_cycles = []
-		for node in self.nodes:
+		for node in self._unordered_nodes():
+			component_id = component_ids[node]
 			shortest_path = None
 			for child in self.child_nodes(node, ignore_priority):
-				path = self.shortest_path(child, node, ignore_priority)
+				if component_ids[child] != component_id:
+					continue
+				# Only a path that is shorter than the one that
+				# was found already can replace it.
+				limit = max_length
+				if shortest_path and \
+					(not limit or len(shortest_path) - 1 < limit):
+					limit = len(shortest_path) - 1
+					if not limit:
+						break
+				path = self._shortest_path(child, node, ignore_priority,
+					max_length=limit)
 				if path is None:
 					continue
 				if not shortest_path or len(shortest_path) > len(path):
@@ -340,3 +451,514 @@ class digraph(object):
 
 	if sys.hexversion < 0x3000000:
 		__nonzero__ = __bool__
+
+class _priority_table(object):
+	"""
+	Assigns a bit to each distinct edge priority, so that the priorities
+	of an edge can be stored as a bitmask. Priorities are considered
+	equal if they have the same class and the same truth values for all
+	of their attributes, which is all that the ignore_priority functions
+	of the priority ranges look at. Plain values like integers are
+	compared by value.
+	"""
+
+	__slots__ = ('_bits', 'priorities')
+
+	def __init__(self):
+		self._bits = {}
+		self.priorities = []
+
+	@staticmethod
+	def _key(priority):
+		attrs = []
+		for cls in priority.__class__.__mro__:
+			slots = cls.__dict__.get('__slots__', ())
+			if isinstance(slots, basestring):
+				slots = (slots,)
+			for name in slots:
+				if not name.startswith('__'):
+					attrs.append(bool(getattr(priority, name, None)))
+		if not attrs and not hasattr(priority, '__slots__'):
+			return (priority.__class__, priority)
+		return (priority.__class__, tuple(attrs))
+
+	def bit(self, priority):
+		key = self._key(priority)
+		bit = self._bits.get(key)
+		if bit is None:
+			bit = 1 << len(self.priorities)
+			self._bits[key] = bit
+			self.priorities.append(priority)
+		return bit
+
+	def mask(self, ignore_priority):
+		"""
+		Return a bitmask of the priorities that are not ignored, in the
+		same way as for digraph.child_nodes(). The ignore_priority function
+		is called again for each query, since its result may depend on
+		state that changes between calls.
+		"""
+		mask = 0
+		if hasattr(ignore_priority, '__call__'):
+			for i, priority in enumerate(self.priorities):
+				if not ignore_priority(priority):
+					mask |= 1 << i
+		else:
+			for i, priority in enumerate(self.priorities):
+				if ignore_priority < priority:
+					mask |= 1 << i
+		return mask
+
+class _degree_counter(object):
+	"""
+	Counts the children and parents of each node of a compact_digraph,
+	considering only the edges that have priorities which aren't ignored
+	by a given ignore_priority value, and keeps track of the nodes that
+	have none.
+	"""
+
+	__slots__ = ('ignore_priority', 'mask', '_evaluated', 'children',
+		'parents', 'leaf_ids', 'root_ids')
+
+	def __init__(self, ignore_priority):
+		self.ignore_priority = ignore_priority
+		if ignore_priority is None:
+			# All bits are set.
+			self.mask = -1
+		else:
+			self.mask = 0
+		self._evaluated = 0
+		# [ number of children ] and [ number of parents ],
+		# indexed by node_id
+		self.children = []
+		self.parents = []
+		self.leaf_ids = set()
+		self.root_ids = set()
+
+	def update_mask(self, priority_table):
+		"""Evaluate priorities that have been added to the table."""
+		if self.ignore_priority is None:
+			return
+		priorities = priority_table.priorities
+		if self._evaluated == len(priorities):
+			return
+		ignore_priority = self.ignore_priority
+		for i in range(self._evaluated, len(priorities)):
+			if hasattr(ignore_priority, '__call__'):
+				if not ignore_priority(priorities[i]):
+					self.mask |= 1 << i
+			elif ignore_priority < priorities[i]:
+				self.mask |= 1 << i
+		self._evaluated = len(priorities)
+
+	def copy(self):
+		counter = _degree_counter(self.ignore_priority)
+		counter.mask = self.mask
+		counter._evaluated = self._evaluated
+		counter.children = self.children[:]
+		counter.parents = self.parents[:]
+		counter.leaf_ids = self.leaf_ids.copy()
+		counter.root_ids = self.root_ids.copy()
+		return counter
+
+	def add_node(self, node_id):
+		self.children.append(0)
+		self.parents.append(0)
+		self.leaf_ids.add(node_id)
+		self.root_ids.add(node_id)
+
+	def remove_node(self, node_id):
+		self.leaf_ids.discard(node_id)
+		self.root_ids.discard(node_id)
+
+	def add_edge(self, child_id, parent_id):
+		self.children[parent_id] += 1
+		self.leaf_ids.discard(parent_id)
+		self.parents[child_id] += 1
+		self.root_ids.discard(child_id)
+
+	def remove_edge(self, child_id, parent_id):
+		self.children[parent_id] -= 1
+		if not self.children[parent_id]:
+			self.leaf_ids.add(parent_id)
+		self.parents[child_id] -= 1
+		if not self.parents[child_id]:
+			self.root_ids.add(child_id)
+
+class compact_digraph(digraph):
+	"""
+	A directed graph object with the same interface as digraph, which
+	maps each node to an integer id and stores the edges of each node as
+	a dict of the adjacent nodes, mapped to a bitmask of priorities.
+	This makes clone() a copy of a few lists of small dicts, and reduces
+	priority filtering to a single bitwise AND per edge, which helps with
+	the repeated clone() and leaf_nodes() calls of merge order
+	calculation. Since equal priorities share a bit, as defined by
+	_priority_table, the priorities of each edge are also kept in a
+	dict for get_priorities(), which is shared by clones until they
+	add edges.
+
+	The dicts are filled and copied in the same way as those of digraph,
+	so that they are iterated in the same order, even with the arbitrary
+	dict order of python-2.x. This keeps the order of child_nodes(),
+	parent_nodes() and get_cycles() the same as for digraph.
+	"""
+
+	def __init__(self):
+		"""Create an empty compact_digraph"""
+
+		# { node : node_id }
+		self._ids = {}
+		# The following lists are indexed by node_id, and hold None
+		# for the ids of removed nodes.
+		self._nodes = []
+		# [ { child : priority_mask } ]
+		self._children = []
+		# [ { parent : priority_mask } ]
+		self._parents = []
+		self._priority_table = _priority_table()
+		# { (child, parent) : sorted tuple of priorities }, which also
+		# holds entries of removed edges
+		self._edge_priorities = {}
+		self._edge_priorities_shared = False
+		# { ignore_priority : _degree_counter }, see track_degrees()
+		self._degree_counters = {}
+		# [ position in order ], indexed by node_id, while
+		# degrees are tracked
+		self._ranks = None
+		self.order = []
+
+	@classmethod
+	def from_digraph(cls, graph):
+		"""
+		Create a compact_digraph with the same nodes, edges and
+		order as the given digraph, whose edges are iterated in the
+		same order as those of graph.clone().
+		"""
+		compact = cls()
+		ids = compact._ids
+		bit = compact._priority_table.bit
+		edge_priorities = compact._edge_priorities
+		# Insert the nodes and edges in the same order as digraph.clone().
+		for children, parents, node in graph.nodes.values():
+			node_id = compact._add_node(node)
+			for edges, compact_edges in ((children, compact._children),
+				(parents, compact._parents)):
+				compact_edges = compact_edges[node_id]
+				for other, priorities in edges.items():
+					mask = 0
+					for priority in priorities:
+						mask |= bit(priority)
+					compact_edges[other] = mask
+			for child, priorities in children.items():
+				edge_priorities[(child, node)] = tuple(priorities)
+		compact.order = graph.order[:]
+		return compact
+
+	def _add_node(self, node):
+		node_id = len(self._nodes)
+		self._ids[node] = node_id
+		self._nodes.append(node)
+		self._children.append({})
+		self._parents.append({})
+		self.order.append(node)
+		if self._ranks is not None:
+			# This is greater than the rank of any other node.
+			self._ranks.append(len(self._ranks))
+			for counter in self._degree_counters.values():
+				counter.add_node(node_id)
+		return node_id
+
+	def add(self, node, parent, priority=0):
+		"""Adds the specified node with the specified parent."""
+
+		node_id = self._ids.get(node)
+		if node_id is None:
+			node_id = self._add_node(node)
+
+		if not parent:
+			return
+
+		parent_id = self._ids.get(parent)
+		if parent_id is None:
+			parent_id = self._add_node(parent)
+
+		bit = self._priority_table.bit(priority)
+		parents = self._parents[node_id]
+		old_mask = parents.get(parent, 0)
+		parents[parent] = old_mask | bit
+		children = self._children[parent_id]
+		children[node] = old_mask | bit
+
+		if self._edge_priorities_shared:
+			self._edge_priorities = self._edge_priorities.copy()
+			self._edge_priorities_shared = False
+		edge = (node, parent)
+		if old_mask:
+			priorities = list(self._edge_priorities[edge])
+			priorities.append(priority)
+			priorities.sort()
+		else:
+			priorities = [priority]
+		self._edge_priorities[edge] = tuple(priorities)
+
+		for counter in self._degree_counters.values():
+			counter.update_mask(self._priority_table)
+			if bit & counter.mask and not old_mask & counter.mask:
+				counter.add_edge(node_id, parent_id)
+
+	def _remove_node(self, node):
+		ids = self._ids
+		node_id = ids[node]
+		counters = self._degree_counters.values()
+		for parent, mask in self._parents[node_id].items():
+			parent_id = ids[parent]
+			del self._children[parent_id][node]
+			for counter in counters:
+				if mask & counter.mask:
+					counter.remove_edge(node_id, parent_id)
+		for child, mask in self._children[node_id].items():
+			child_id = ids[child]
+			del self._parents[child_id][node]
+			for counter in counters:
+				if mask & counter.mask:
+					counter.remove_edge(child_id, node_id)
+		for counter in counters:
+			counter.remove_node(node_id)
+		del ids[node]
+		self._nodes[node_id] = None
+		self._children[node_id] = None
+		self._parents[node_id] = None
+
+	def remove(self, node):
+		"""Removes the specified node from the digraph, also removing
+		and ties to other nodes in the digraph. Raises KeyError if the
+		node doesn't exist."""
+
+		self._remove_node(node)
+		self.order.remove(node)
+
+	def difference_update(self, t):
+		"""
+		Remove all given nodes from node_set. This is more efficient
+		than multiple calls to the remove() method.
+		"""
+		if isinstance(t, (list, tuple)) or \
+			not hasattr(t, "__contains__"):
+			t = frozenset(t)
+		order = []
+		for node in self.order:
+			if node not in t:
+				order.append(node)
+				continue
+			self._remove_node(node)
+		self.order = order
+
+	def remove_edge(self, child, parent):
+		"""
+		Remove edge in the direction from child to parent. Note that it is
+		possible for a remaining edge to exist in the opposite direction.
+		Any endpoint vertices that become isolated will remain in the graph.
+		"""
+
+		# Nothing should be modified when a KeyError is raised.
+		for k in parent, child:
+			if k not in self._ids:
+				raise KeyError(k)
+
+		child_id = self._ids[child]
+		parent_id = self._ids[parent]
+		if child not in self._children[parent_id]:
+			raise KeyError(child)
+
+		del self._parents[child_id][parent]
+		mask = self._children[parent_id].pop(child)
+		for counter in self._degree_counters.values():
+			if mask & counter.mask:
+				counter.remove_edge(child_id, parent_id)
+
+	def contains(self, node):
+		"""Checks if the digraph contains mynode"""
+		return node in self._ids
+
+	def _unordered_nodes(self):
+		return iter(self._ids)
+
+	def get_priorities(self, child, parent):
+		"""
+		Return a sorted list of the priorities of the edge in the
+		direction from child to parent. Raises KeyError if the
+		edge doesn't exist.
+		"""
+		if child not in self._children[self._ids[parent]]:
+			raise KeyError(child)
+		return list(self._edge_priorities[(child, parent)])
+
+	def get(self, key, default=None):
+		node_id = self._ids.get(key)
+		if node_id is None:
+			return default
+		return self._nodes[node_id]
+
+	def _mask(self, ignore_priority):
+		try:
+			counter = self._degree_counters.get(ignore_priority)
+		except TypeError:
+			counter = None
+		if counter is not None:
+			return counter.mask
+		return self._priority_table.mask(ignore_priority)
+
+	def _edge_nodes(self, edges, node, ignore_priority):
+		edges = edges[self._ids[node]]
+		if ignore_priority is None:
+			return list(edges)
+		mask = self._mask(ignore_priority)
+		return [other for other, priority_mask in edges.items()
+			if priority_mask & mask]
+
+	def child_nodes(self, node, ignore_priority=None):
+		"""Return all children of the specified node"""
+		return self._edge_nodes(self._children, node, ignore_priority)
+
+	def parent_nodes(self, node, ignore_priority=None):
+		"""Return all parents of the specified node"""
+		return self._edge_nodes(self._parents, node, ignore_priority)
+
+	def track_degrees(self, ignore_priorities):
+		"""
+		Count the children and parents of each node for each of the given
+		ignore_priority values, and update the counts as nodes and edges
+		are added and removed. This way, leaf_nodes() and root_nodes()
+		don't have to check the edges of all nodes for these values. The
+		values must be hashable, and ignore_priority functions must always
+		give the same result for the same priority. Since the results are
+		ordered by the current order, the order must not be rearranged
+		directly afterwards.
+		"""
+		if self._ranks is None:
+			self._ranks = [None] * len(self._nodes)
+			for rank, node in enumerate(self.order):
+				self._ranks[self._ids[node]] = rank
+		for ignore_priority in ignore_priorities:
+			if ignore_priority in self._degree_counters:
+				continue
+			counter = _degree_counter(ignore_priority)
+			counter.update_mask(self._priority_table)
+			mask = counter.mask
+			for node_id, node in enumerate(self._nodes):
+				counter.add_node(node_id)
+				if node is None:
+					counter.remove_node(node_id)
+			for node_id, children in enumerate(self._children):
+				if children is None:
+					continue
+				for child, priority_mask in children.items():
+					if priority_mask & mask:
+						counter.add_edge(self._ids[child], node_id)
+			self._degree_counters[ignore_priority] = counter
+
+	def _tracked_nodes(self, node_ids):
+		nodes = self._nodes
+		return [nodes[node_id] for node_id in
+			sorted(node_ids, key=self._ranks.__getitem__)]
+
+	def _unconnected_nodes(self, edges, ignore_priority):
+		ids = self._ids
+		if ignore_priority is None:
+			return [node for node in self.order if not edges[ids[node]]]
+		mask = self._priority_table.mask(ignore_priority)
+		if not mask:
+			return self.order[:]
+		unconnected = []
+		for node in self.order:
+			for priority_mask in edges[ids[node]].values():
+				if priority_mask & mask:
+					break
+			else:
+				unconnected.append(node)
+		return unconnected
+
+	def leaf_nodes(self, ignore_priority=None):
+		"""Return all nodes that have no children
+
+		If ignore_soft_deps is True, soft deps are not counted as
+		children in calculations."""
+		try:
+			counter = self._degree_counters.get(ignore_priority)
+		except TypeError:
+			counter = None
+		if counter is not None:
+			return self._tracked_nodes(counter.leaf_ids)
+		return self._unconnected_nodes(self._children, ignore_priority)
+
+	def root_nodes(self, ignore_priority=None):
+		"""Return all nodes that have no parents.
+
+		If ignore_soft_deps is True, soft deps are not counted as
+		parents in calculations."""
+		try:
+			counter = self._degree_counters.get(ignore_priority)
+		except TypeError:
+			counter = None
+		if counter is not None:
+			return self._tracked_nodes(counter.root_ids)
+		return self._unconnected_nodes(self._parents, ignore_priority)
+
+	def __bool__(self):
+		return bool(self._ids)
+
+	def is_empty(self):
+		"""Checks if the digraph is empty"""
+		return len(self._ids) == 0
+
+	def clone(self):
+		clone = compact_digraph()
+		# Insert the items one by one like digraph.clone() does, since
+		# dict.copy() may give a different order with python-2.x.
+		clone._ids = dict((node, node_id)
+			for node, node_id in self._ids.items())
+		clone._nodes = self._nodes[:]
+		clone._children = [None] * len(self._children)
+		clone._parents = [None] * len(self._parents)
+		for node_id in clone._ids.values():
+			clone._children[node_id] = dict((child, mask)
+				for child, mask in self._children[node_id].items())
+			clone._parents[node_id] = dict((parent, mask)
+				for parent, mask in self._parents[node_id].items())
+		# The priority table only grows, so it can be shared.
+		clone._priority_table = self._priority_table
+		clone._edge_priorities = self._edge_priorities
+		clone._edge_priorities_shared = True
+		self._edge_priorities_shared = True
+		clone._degree_counters = dict((k, v.copy())
+			for k, v in self._degree_counters.items())
+		if self._ranks is not None:
+			clone._ranks = self._ranks[:]
+		clone.order = self.order[:]
+		return clone
+
+	def debug_print(self):
+		def output(s):
+			writemsg(s, noiselevel=-1)
+		for node, node_id in self._ids.items():
+			output(_unicode_decode("%s ") % (node,))
+			children = self._children[node_id]
+			if children:
+				output("depends on\n")
+			else:
+				output("(no children)\n")
+			for child in children:
+				output(_unicode_decode("  %s (%s)\n") % \
+					(child, self._edge_priorities[(child, node)][-1],))
+
+	# Backward compatibility
+	addnode = add
+	allzeros = leaf_nodes
+	hasnode = contains
+	__contains__ = contains
+	empty = is_empty
+	copy = clone
+
+	if sys.hexversion < 0x3000000:
+		__nonzero__ = __bool__
@@ -0,0 +1,160 @@
+# Copyright 2011 Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+
+__all__ = ['LRUCache', 'cache_stats', 'set_maxsize']
+
+import weakref
+
+_caches = weakref.WeakValueDictionary()
+
+# Indexes into the [prev, next, key, value] link lists.
+_PREV, _NEXT, _KEY, _VALUE = 0, 1, 2, 3
+
+class LRUCache(object):
+	"""
+	A size-bounded mapping that discards the least recently used entry
+	when it grows beyond maxsize. It counts hits, misses and evictions,
+	so that it's possible to see whether a cache is actually helping.
+	Caches that are created with a name are registered, so that their
+	statistics can be reported by cache_stats() and their size can be
+	adjusted by set_maxsize().
+	"""
+
+	__slots__ = ('__weakref__', 'name', 'hits', 'misses', 'evictions',
+		'_data', '_maxsize', '_root')
+
+	def __init__(self, maxsize, name=None):
+		"""
+		@param maxsize: maximum number of entries, or None for no limit
+		@type maxsize: int or None
+		@param name: name used to register this cache for cache_stats()
+			and set_maxsize()
+		@type name: str
+		"""
+		self.name = name
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._data = {}
+		self._maxsize = maxsize
+		self._root = []
+		self._root[:] = [self._root, self._root, None, None]
+		if name is not None:
+			_caches[name] = self
+
+	def __getitem__(self, key):
+		try:
+			link = self._data[key]
+		except KeyError:
+			self.misses += 1
+			raise
+		self.hits += 1
+		# Move the link to the most recently used end of the list.
+		root = self._root
+		link_prev, link_next = link[_PREV], link[_NEXT]
+		link_prev[_NEXT] = link_next
+		link_next[_PREV] = link_prev
+		last = root[_PREV]
+		last[_NEXT] = root[_PREV] = link
+		link[_PREV] = last
+		link[_NEXT] = root
+		return link[_VALUE]
+
+	def get(self, key, default=None):
+		try:
+			return self[key]
+		except KeyError:
+			return default
+
+	def __setitem__(self, key, value):
+		data = self._data
+		root = self._root
+		link = data.get(key)
+		if link is not None:
+			link[_PREV][_NEXT] = link[_NEXT]
+			link[_NEXT][_PREV] = link[_PREV]
+		last = root[_PREV]
+		link = [last, root, key, value]
+		last[_NEXT] = root[_PREV] = data[key] = link
+		if self._maxsize is not None:
+			while len(data) > self._maxsize:
+				self._evict()
+
+	def _evict(self):
+		root = self._root
+		oldest = root[_NEXT]
+		root[_NEXT] = oldest[_NEXT]
+		oldest[_NEXT][_PREV] = root
+		del self._data[oldest[_KEY]]
+		self.evictions += 1
+
+	def __delitem__(self, key):
+		link = self._data.pop(key)
+		link[_PREV][_NEXT] = link[_NEXT]
+		link[_NEXT][_PREV] = link[_PREV]
+
+	def __contains__(self, key):
+		return key in self._data
+
+	def __len__(self):
+		return len(self._data)
+
+	def __iter__(self):
+		root = self._root
+		link = root[_NEXT]
+		while link is not root:
+			yield link[_KEY]
+			link = link[_NEXT]
+
+	def clear(self):
+		self._data.clear()
+		self._root[:] = [self._root, self._root, None, None]
+
+	@property
+	def maxsize(self):
+		return self._maxsize
+
+	def resize(self, maxsize):
+		"""
+		Change the maximum number of entries, evicting the least
+		recently used entries if necessary.
+		"""
+		self._maxsize = maxsize
+		if maxsize is not None:
+			while len(self._data) > maxsize:
+				self._evict()
+
+	def stats(self):
+		"""
+		@rtype: dict
+		@return: hit, miss and eviction counts, along with the current
+			and maximum number of entries
+		"""
+		return {
+			'hits'      : self.hits,
+			'misses'    : self.misses,
+			'evictions' : self.evictions,
+			'size'      : len(self._data),
+			'maxsize'   : self._maxsize,
+		}
+
+def cache_stats():
+	"""
+	@rtype: dict
+	@return: a dict which maps the name of each registered cache to
+		the result of its stats() method
+	"""
+	return dict((name, cache.stats()) for name, cache in \
+		list(_caches.items()))
+
+def set_maxsize(maxsize, name=None):
+	"""
+	Change the maximum number of entries of the named cache, or of
+	all registered caches if name is None.
+	"""
+	if name is None:
+		caches = list(_caches.values())
+	else:
+		caches = [_caches[name]]
+	for cache in caches:
+		cache.resize(maxsize)
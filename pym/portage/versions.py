@@ -11,11 +11,8 @@ __all__ = [
 import re
 import warnings
 
-import portage
-portage.proxy.lazyimport.lazyimport(globals(),
-	'portage.util:cmp_sort_key'
-)
 from portage.localization import _
+from portage.util.lrucache import LRUCache
 
 # \w is [a-zA-Z0-9_]
 
@@ -41,6 +38,10 @@ suffix_regexp = re.compile("^(alpha|beta|rc|pre|p)(\\d*)$")
 suffix_value = {"pre": -2, "p": 0, "alpha": -4, "beta": -3, "rc": -1}
 endversion_keys = ["pre", "p", "alpha", "beta", "rc"]
 
+# Maximum number of entries held by each of the caches in this module.
+# Use portage.util.lrucache.set_maxsize() to adjust it at runtime.
+_cache_maxsize = 32768
+
 def ververify(myver, silent=1):
 	if ver_regexp.match(myver):
 		return 1
@@ -49,7 +50,7 @@ def ververify(myver, silent=1):
 			print(_("!!! syntax error in version: %s") % myver)
 		return 0
 
-vercmp_cache = {}
+vercmp_cache = LRUCache(_cache_maxsize, name='portage.versions.vercmp')
 def vercmp(ver1, ver2, silent=1):
 	"""
 	Compare two versions
@@ -214,6 +215,81 @@ def vercmp(ver1, ver2, silent=1):
 	vercmp_cache[mykey] = rval
 	return rval
 	
+_vercmp_key_cache = LRUCache(_cache_maxsize,
+	name='portage.versions._vercmp_key')
+def _vercmp_key(ver):
+	"""
+	Parse a version once and return an immutable key that sorts in the
+	same order as vercmp(). Two versions that vercmp() considers equal
+	(such as 1.0 and 1.0-r0) produce equal keys, so the keys can be
+	compared directly as plain tuples, or used as the 'key' parameter in
+	places like list.sort(), sorted(), min() and max().
+
+	Example usage:
+		>>> from portage.versions import _vercmp_key
+		>>> _vercmp_key('1.0-r1') < _vercmp_key('1.2-r3')
+		True
+
+	@param ver: version (see ver_regexp in portage.versions.py)
+	@type ver: string (example: "2.1.2-r3")
+	@rtype: tuple or None
+	@return: a key tuple, or None if ver is invalid
+	"""
+	try:
+		return _vercmp_key_cache[ver]
+	except KeyError:
+		pass
+
+	match = ver_regexp.match(ver)
+	if match is None:
+		_vercmp_key_cache[ver] = None
+		return None
+
+	# Components after the first one are compared as integers unless
+	# either side has a leading zero, in which case vercmp() compares
+	# them as decimal fractions. A component with a leading zero is
+	# therefore always less than one without, and two such components
+	# compare like strings once trailing zeros are stripped. The
+	# (-1,) terminator sorts below every component, which matches the
+	# implicit -1 that vercmp() gives to a missing component.
+	components = []
+	if match.group(3):
+		for component in match.group(3)[1:].split("."):
+			if component[0] == "0":
+				components.append((0, component.rstrip("0")))
+			else:
+				components.append((1, int(component)))
+	components.append((-1,))
+
+	if match.group(5):
+		letter = ord(match.group(5))
+	else:
+		letter = 0
+
+	# Suffixes are terminated by the implicit _p-1 that vercmp() uses
+	# for missing suffixes. No real suffix can be equal to it, so the
+	# comparison is always decided there when the lengths differ.
+	suffixes = []
+	for suffix in match.group(6).split("_")[1:]:
+		suffix_match = suffix_regexp.match(suffix)
+		num = suffix_match.group(2)
+		if num:
+			num = int(num)
+		else:
+			num = 0
+		suffixes.append((suffix_value[suffix_match.group(1)], num))
+	suffixes.append((suffix_value["p"], -1))
+
+	if match.group(10):
+		rev = int(match.group(10))
+	else:
+		rev = 0
+
+	key = (bool(match.group(1)), int(match.group(2)), tuple(components),
+		letter, tuple(suffixes), rev)
+	_vercmp_key_cache[ver] = key
+	return key
+
 def pkgcmp(pkg1, pkg2):
 	"""
 	Compare 2 package versions created in pkgsplit format.
@@ -238,7 +314,11 @@ def pkgcmp(pkg1, pkg2):
 	"""
 	if pkg1[0] != pkg2[0]:
 		return None
-	return vercmp("-".join(pkg1[1:]), "-".join(pkg2[1:]))
+	key1 = _vercmp_key("-".join(pkg1[1:]))
+	key2 = _vercmp_key("-".join(pkg2[1:]))
+	if key1 is None or key2 is None:
+		return None
+	return (key1 > key2) - (key1 < key2)
 
 _pv_re = re.compile('^' + _pv + '$', re.VERBOSE)
 
@@ -266,7 +346,7 @@ def _pkgsplit(mypkg):
 
 _cat_re = re.compile('^%s$' % _cat)
 _missing_cat = 'null'
-catcache={}
+catcache = LRUCache(_cache_maxsize, name='portage.versions.catpkgsplit')
 def catpkgsplit(mydata,silent=1):
 	"""
 	Takes a Category/Package-Version-Rev and returns a list of each.
@@ -350,39 +430,25 @@ def cpv_sort_key():
 	"""
 	Create an object for sorting cpvs, to be used as the 'key' parameter
 	in places like list.sort() or sorted(). This calls catpkgsplit() once for
-	each cpv and caches the result. If a given cpv is invalid or two cpvs
-	have different category/package names, then plain string (> and <)
-	comparison is used.
+	each cpv and caches the result. Valid cpvs are grouped by
+	category/package name and then sorted by version. Invalid cpvs are
+	sorted by plain string (> and <) comparison against the
+	category/package names.
 
 	@rtype: key object for sorting
 	@return: object for use as the 'key' parameter in places like
 		list.sort() or sorted()
 	"""
 
-	split_cache = {}
-
-	def cmp_cpv(cpv1, cpv2):
-
-		split1 = split_cache.get(cpv1, False)
-		if split1 is False:
-			split1 = catpkgsplit(cpv1)
-			if split1 is not None:
-				split1 = (split1[:2], '-'.join(split1[2:]))
-			split_cache[cpv1] = split1
-
-		split2 = split_cache.get(cpv2, False)
-		if split2 is False:
-			split2 = catpkgsplit(cpv2)
-			if split2 is not None:
-				split2 = (split2[:2], '-'.join(split2[2:]))
-			split_cache[cpv2] = split2
-
-		if split1 is None or split2 is None or split1[0] != split2[0]:
-			return (cpv1 > cpv2) - (cpv1 < cpv2)
-
-		return vercmp(split1[1], split2[1])
+	def cpv_key(cpv):
+		split = catpkgsplit(cpv)
+		if split is not None:
+			key = _vercmp_key('-'.join(split[2:]))
+			if key is not None:
+				return (split[0] + '/' + split[1], key)
+		return (cpv,)
 
-	return cmp_sort_key(cmp_cpv)
+	return cpv_key
 
 def catsplit(mydep):
         return mydep.split("/", 1)
@@ -394,10 +460,15 @@ def best(mymatches):
 	if len(mymatches) == 1:
 		return mymatches[0]
 	bestmatch = mymatches[0]
-	p2 = catpkgsplit(bestmatch)[1:]
+	p2 = catpkgsplit(bestmatch)
+	key2 = _vercmp_key('-'.join(p2[2:]))
 	for x in mymatches[1:]:
-		p1 = catpkgsplit(x)[1:]
-		if pkgcmp(p1, p2) > 0:
+		p1 = catpkgsplit(x)
+		if p1[1] != p2[1]:
+			continue
+		key1 = _vercmp_key('-'.join(p1[2:]))
+		if key1 > key2:
 			bestmatch = x
-			p2 = catpkgsplit(bestmatch)[1:]
+			p2 = p1
+			key2 = key1
 	return bestmatch